@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
 from github import Github
-from github import GithubException
-from io import StringIO
 import math
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -14,8 +12,8 @@ def ora_italiana():
     ogni scadenza sarebbe sfasata di 1-2 ore (a seconda dell'ora legale)
     rispetto all'orario italiano reale."""
     return datetime.now(ZoneInfo("Europe/Rome")).replace(tzinfo=None)
-import time
 import re
+from archivio import ArchivioGithub, archivio_da_ambiente
 
 # --- 1. CONFIGURAZIONE ---
 FORZA_MODALITA = False  # False = Terminale Blindaggi | True = Mercato
@@ -35,14 +33,18 @@ MERCATO_PAGABILE = FORZA_MODALITA or (ora_italiana() >= APERTURA_MERCATO)
 
 ADMIN_SQUADRE = ["Liverpool Football Club", "Villarreal", "Reggina Calcio 1914", "Siviglia"]
 
-try:
-    TOKEN = st.secrets["GITHUB_TOKEN"]
-    REPO_NAME = st.secrets["REPO_NAME"]
-    g = Github(TOKEN)
-    repo = g.get_repo(REPO_NAME)
-except:
-    st.error("Errore configurazione GitHub nei Secrets.")
-    st.stop()
+# Archivio dei CSV: il repository GitHub dei Secrets, oppure l'archivio
+# locale/SQLite indicato dalle variabili d'ambiente (vedi archivio_da_ambiente)
+archivio = archivio_da_ambiente()
+if archivio is None:
+    try:
+        TOKEN = st.secrets["GITHUB_TOKEN"]
+        REPO_NAME = st.secrets["REPO_NAME"]
+        g = Github(TOKEN)
+        archivio = ArchivioGithub(g.get_repo(REPO_NAME))
+    except:
+        st.error("Errore configurazione GitHub nei Secrets.")
+        st.stop()
 
 # --- 2. FUNZIONI UTILITY ---
 def pulisci_nome(nome):
@@ -78,23 +80,13 @@ def get_team_display_name(squadra):
 @st.cache_data(ttl=300)
 def carica_csv(file_name):
     try:
-        content = repo.get_contents(file_name)
-        return pd.read_csv(StringIO(content.decoded_content.decode("utf-8")))
+        return archivio.leggi_csv(file_name)
     except: 
         return pd.DataFrame()
 
 def salva_file_github(path, df, msg):
-    time.sleep(0.5)
-    csv_buffer = df.to_csv(index=False)
     try:
-        f = repo.get_contents(path)
-        repo.update_file(path, msg, csv_buffer, f.sha)
-    except GithubException as e:
-        if e.status == 404:
-            repo.create_file(path, msg, csv_buffer)
-        else:
-            st.error(f"Errore salvataggio: {e}")
-            raise
+        archivio.scrivi_csv(path, df, msg)
     except Exception as e:
         st.error(f"Errore salvataggio: {e}")
         raise
@@ -102,21 +94,19 @@ def salva_file_github(path, df, msg):
 def salva_clausola_singola(squadra, dati_stringa):
     path = "clausole_segrete.csv"
     nuova_riga = f"{squadra},{dati_stringa}"
-    try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8")
-        righe = [r for r in contenuto.splitlines() if not r.startswith(f"{squadra},")]
+
+    def transazione(tx):
+        righe = [r for r in tx.leggi_testo(path).splitlines() if not r.startswith(f"{squadra},")]
         righe.append(nuova_riga)
-        repo.update_file(path, f"Update {squadra}", "\n".join(righe), f.sha)
-    except:
-        repo.create_file(path, "Inizializzazione", nuova_riga)
+        tx.scrivi_testo(path, "\n".join(righe))
+
+    archivio.transazione(transazione, f"Update {squadra}")
 
 def carica_clausole_salvate():
     """Legge clausole_segrete.csv e restituisce {squadra: 'id:nome:valore;id:nome:valore'}"""
     salvati = {}
     try:
-        f = repo.get_contents("clausole_segrete.csv")
-        for riga in f.decoded_content.decode("utf-8").splitlines():
+        for riga in archivio.leggi_testo("clausole_segrete.csv").splitlines():
             if riga.strip() and "," in riga:
                 s, d = riga.split(",", 1)
                 salvati[s] = d
@@ -125,6 +115,7 @@ def carica_clausole_salvate():
     return salvati
 
 LIMITE_CLAUSOLE_PAGATE = 3
+INTESTAZIONE_RICHIESTE = ["Acquirente", "Proprietario", "Id", "Nome", "Costo", "Stato", "Orario"]
 
 def conta_clausole_pagate(squadra):
     """Conta quante clausole ha già pagato (con successo) questa squadra, leggendo
@@ -136,17 +127,12 @@ def conta_clausole_pagate(squadra):
     return int(mask.sum())
 
 def registra_richiesta_clausola(acquirente, proprietario, player_id, nome, costo):
-    time.sleep(0.5)
-    path = "richieste_scippo.csv"
     orario = ora_italiana().strftime("%Y-%m-%d %H:%M:%S")
-    nuova_riga = f"{acquirente},{proprietario},{player_id},{nome},{costo},PENDENTE,{orario}\n"
-    try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8") + nuova_riga
-        repo.update_file(path, f"Clausola Rescissoria: {nome} alle {orario}", contenuto, f.sha)
-    except:
-        header = "Acquirente,Proprietario,Id,Nome,Costo,Stato,Orario\n"
-        repo.create_file(path, "Init Richieste", header + nuova_riga)
+    archivio.appendi_log(
+        "richieste_scippo.csv",
+        [[acquirente, proprietario, player_id, nome, costo, "PENDENTE", orario]],
+        INTESTAZIONE_RICHIESTE, f"Clausola Rescissoria: {nome} alle {orario}",
+    )
 
 def esegui_trasferimento_clausola(acquirente, proprietario, player_id, nome, costo):
     """Esegue immediatamente lo scambio di crediti e il trasferimento del giocatore,
@@ -186,16 +172,12 @@ def esegui_trasferimento_clausola(acquirente, proprietario, player_id, nome, cos
     ] = acquirente
     salva_file_github("fantamanager-2021-rosters.csv", df_ros, f"Trasferimento {nome}")
 
-    path = "richieste_scippo.csv"
     orario = ora_italiana().strftime("%Y-%m-%d %H:%M:%S")
-    nuova_riga = f"{acquirente},{proprietario},{player_id},{nome},{costo},APPROVATO_AUTO,{orario}\n"
-    try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8") + nuova_riga
-        repo.update_file(path, f"Clausola Rescissoria (auto): {nome} alle {orario}", contenuto, f.sha)
-    except:
-        header = "Acquirente,Proprietario,Id,Nome,Costo,Stato,Orario\n"
-        repo.create_file(path, "Init Richieste", header + nuova_riga)
+    archivio.appendi_log(
+        "richieste_scippo.csv",
+        [[acquirente, proprietario, player_id, nome, costo, "APPROVATO_AUTO", orario]],
+        INTESTAZIONE_RICHIESTE, f"Clausola Rescissoria (auto): {nome} alle {orario}",
+    )
 
     return True, None
 
@@ -0,0 +1,647 @@
+import base64
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import StringIO
+
+import pandas as pd
+from github import GithubException
+from github import InputGitTreeElement
+
+from manifesto_csv import decodifica, rileva_separatore
+
+# --- ARCHIVIO CSV DELLA LEGA ---
+# Tutte le letture e scritture dei CSV passano da un oggetto Archivio, che
+# espone sempre le stesse operazioni (leggi CSV, scrittura con
+# compare-and-swap, accodamento ai log, elenco delle versioni) e ha più
+# implementazioni:
+#   - ArchivioGithub: il repository GitHub vero, quello usato dalle app;
+#   - ArchivioLocale: un archivio su disco con la stessa semantica (blob per
+#     SHA, versioni, rifiuto dei commit non fast-forward) e una latenza
+#     iniettabile per chiamata, per misurare throughput e contesa senza
+#     toccare il servizio reale;
+#   - ArchivioSqlite (archivio_sqlite.py, opzionale): stato della lega in
+#     tabelle indicizzate, una transazione SQLite per operazione.
+#
+# Tutte le scritture "a più file" (roster + crediti + log) sono transazioni:
+# invece di un update_file per file (un commit ciascuno, e quindi la
+# possibilità di restare a metà), si costruisce UN solo albero con tutti i
+# blob modificati e UN solo commit, e il ramo viene spostato solo se nessun
+# altro ha committato nel frattempo (compare-and-swap sul ref).
+
+
+# --- CACHE SU DISCO PER SHA DEL BLOB ---
+# Un blob git è immutabile: lo stesso SHA ha sempre lo stesso contenuto.
+# Il CSV già interpretato viene quindi salvato su disco in formato Feather
+# con lo SHA come nome file e sopravvive ai riavvii dell'app: un file non
+# cambiato non viene né riscaricato né riletto con read_csv, uno cambiato
+# costa un solo download del nuovo blob.
+CARTELLA_CACHE = os.environ.get("LFM_CACHE_DIR", ".cache_lfm")
+
+_testi_blob = {}
+_csv_blob = {}
+_lock_cache = threading.Lock()
+_LIMITE_MEMORIA = 64  # blob tenuti anche in RAM; i più vecchi restano solo su disco
+
+statistiche_richieste = {
+    "richieste": 0,        # chiamate effettive all'elenco file
+    "non_modificate": 0,   # risposte 304: budget risparmiato
+    "blob_scaricati": 0,   # download di contenuti nuovi
+    "blob_da_cache": 0,    # letture servite da memoria o disco
+    "rate_limit_residuo": None,
+}
+_lock_statistiche = threading.Lock()  # i contatori arrivano anche dai thread dei download
+
+
+def _conta_richiesta(chiave, quanto=1):
+    with _lock_statistiche:
+        statistiche_richieste[chiave] += quanto
+
+
+def _memorizza(diz, chiave, valore):
+    with _lock_cache:
+        diz[chiave] = valore
+        while len(diz) > _LIMITE_MEMORIA:
+            del diz[next(iter(diz))]
+
+
+def _csv_da_testo(testo):
+    # Il delimitatore si riconosce qui, una volta per blob: il risultato
+    # finisce nella cache per SHA insieme al DataFrame
+    if not testo.strip():
+        return pd.DataFrame()
+    return pd.read_csv(StringIO(testo), sep=rileva_separatore(testo))
+
+
+def orario_locale(istante):
+    """Istante (secondi epoch) nel formato dell'orario delle versioni dei
+    backend locali; "" (prima di ogni orario) se None."""
+    return "" if istante is None else datetime.fromtimestamp(istante).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sha_blob_git(testo):
+    """SHA che git assegnerebbe al contenuto: lo stesso testo ha lo stesso
+    SHA su GitHub e nell'archivio locale, quindi le cache sono condivise."""
+    dati = testo.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(dati) + dati).hexdigest()
+
+
+def _percorso_cache(sha_blob):
+    return os.path.join(CARTELLA_CACHE, f"{sha_blob}.feather")
+
+
+def _salva_su_disco(sha_blob, df):
+    # Scrittura su file temporaneo + rename: una sessione che legge in
+    # parallelo non vede mai un Feather scritto a metà. Colonne con tipi misti
+    # che pyarrow non sa serializzare restano semplicemente fuori dalla cache.
+    try:
+        os.makedirs(CARTELLA_CACHE, exist_ok=True)
+        tmp = _percorso_cache(sha_blob) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        df.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, _percorso_cache(sha_blob))
+    except Exception:
+        pass
+
+
+class Archivio:
+    """Interfaccia comune dei backend. Le sottoclassi implementano solo le
+    quattro primitive _voci, _scarica_blob, _base_transazione e _pubblica,
+    più elenca_versioni; cache, fotografie e transazioni sono condivise."""
+
+    def __init__(self):
+        self._lock_statistiche = threading.Lock()
+        self.statistiche = {
+            "transazioni": 0,  # chiamate a transazione()
+            "commit": 0,       # commit effettivamente pubblicati
+            "conflitti": 0,    # commit rifiutati perché il ramo era andato avanti
+        }
+
+    def _conta(self, chiave, quanto=1):
+        with self._lock_statistiche:
+            self.statistiche[chiave] += quanto
+
+    # --- primitive dei backend ---
+    def _voci(self):
+        """(versione, {path: sha del blob}) dello stato attuale."""
+        raise NotImplementedError
+
+    def _scarica_blob(self, sha_blob):
+        """Contenuto testuale di un blob (senza cache)."""
+        raise NotImplementedError
+
+    def _base_transazione(self):
+        """(base, {path: sha del blob}) del commit su cui costruire una
+        transazione; base è opaco e viene ripassato a _pubblica."""
+        raise NotImplementedError
+
+    def _pubblica(self, base, modifiche, msg):
+        """Pubblica {path: testo} come nuovo commit sopra base. Restituisce
+        False se nel frattempo il ramo è andato avanti (nessuna modifica)."""
+        raise NotImplementedError
+
+    def elenca_versioni(self, path=None, limite=20, dal=None):
+        """Ultime versioni (dalla più recente), eventualmente solo quelle che
+        toccano 'path' e quelle non più vecchie dell'istante 'dal' (secondi
+        epoch): lista di {'versione', 'messaggio', 'orario'}."""
+        raise NotImplementedError
+
+    # --- letture ---
+    def testo_blob(self, sha_blob):
+        """Contenuto testuale di un blob, scaricato una sola volta per processo."""
+        with _lock_cache:
+            if sha_blob in _testi_blob:
+                return _testi_blob[sha_blob]
+        testo = self._scarica_blob(sha_blob)
+        _conta_richiesta("blob_scaricati")
+        _memorizza(_testi_blob, sha_blob, testo)
+        return testo
+
+    def csv_blob(self, sha_blob):
+        """DataFrame di un blob CSV: memoria del processo, poi cache su disco,
+        e solo come ultima risorsa download + read_csv. Restituisce sempre una
+        copia, perché i chiamanti modificano liberamente il DataFrame."""
+        with _lock_cache:
+            if sha_blob in _csv_blob:
+                _conta_richiesta("blob_da_cache")
+                return _csv_blob[sha_blob].copy()
+
+        df = None
+        if os.path.exists(_percorso_cache(sha_blob)):
+            try:
+                df = pd.read_feather(_percorso_cache(sha_blob))
+                _conta_richiesta("blob_da_cache")
+            except Exception:
+                df = None
+        if df is None:
+            df = _csv_da_testo(self.testo_blob(sha_blob))
+            _salva_su_disco(sha_blob, df)
+
+        _memorizza(_csv_blob, sha_blob, df)
+        return df.copy()
+
+    def versione(self):
+        """Identificativo della versione attuale dei dati."""
+        return self._voci()[0]
+
+    def voci_albero(self):
+        """{path: sha del blob} di tutti i file."""
+        return self._voci()[1]
+
+    def leggi_testo(self, path):
+        """Contenuto testuale di un file. Solleva FileNotFoundError se il file
+        non esiste."""
+        sha_blob = self.voci_albero().get(path)
+        if sha_blob is None:
+            raise FileNotFoundError(path)
+        return self.testo_blob(sha_blob)
+
+    def leggi_csv(self, path):
+        """Lettura di un CSV passando dalla cache per SHA. Solleva
+        FileNotFoundError se il file non esiste."""
+        sha_blob = self.voci_albero().get(path)
+        if sha_blob is None:
+            raise FileNotFoundError(path)
+        return self.csv_blob(sha_blob)
+
+    def fotografia(self, percorsi, testuali=()):
+        """Legge più file della lega ALLA STESSA VERSIONE: un solo elenco dei
+        file, poi i soli blob cambiati scaricati in parallelo. La latenza è
+        quella di circa una richiesta invece della somma di una per file, e
+        ogni vista lavora su uno stato coerente (niente roster di un commit e
+        crediti del commit dopo).
+
+        Restituisce (versione, {path: DataFrame}). I path in 'testuali' vengono
+        restituiti come testo grezzo (es. clausole_segrete.csv, che non è un
+        CSV tabellare). I file mancanti diventano un DataFrame vuoto (o "")."""
+        versione, voci = self._voci()
+
+        def carica(path):
+            if path not in voci:
+                return "" if path in testuali else pd.DataFrame()
+            if path in testuali:
+                return self.testo_blob(voci[path])
+            return self.csv_blob(voci[path])
+
+        with ThreadPoolExecutor(max_workers=min(8, max(1, len(percorsi)))) as pool:
+            dati = dict(zip(percorsi, pool.map(carica, percorsi)))
+        return versione, dati
+
+    def fotografia_voci(self, percorsi):
+        """Come fotografia(), ma al posto della versione dell'archivio
+        restituisce {path: sha del blob} dei soli file letti (None se
+        mancano): chiavi di cache per file allineate ai dati restituiti."""
+        voci = self.voci_albero()
+        dati = {p: self.csv_blob(voci[p]) if p in voci else pd.DataFrame() for p in percorsi}
+        return {p: voci.get(p) for p in percorsi}, dati
+
+    # --- scritture ---
+    def transazione(self, funzione, msg, max_tentativi=5):
+        """Esegue funzione(tx) su una fotografia fresca dei dati e pubblica
+        TUTTE le modifiche che ha registrato in un unico commit.
+
+        Il commit viene agganciato con un compare-and-swap: se nel frattempo
+        qualcun altro ha committato, la pubblicazione viene rifiutata e si
+        riparte da capo rileggendo i dati. Una transazione fallita non lascia
+        nulla a metà: o si muovono roster, crediti e log insieme, o non si
+        muove niente.
+
+        funzione deve basarsi SOLO su quanto legge da tx (viene rieseguita a
+        ogni tentativo) e restituisce il proprio esito, che viene inoltrato al
+        chiamante. Se non registra modifiche non viene creato alcun commit (es.
+        giocatore già trasferito: si risponde subito senza scrivere)."""
+        self._conta("transazioni")
+        for tentativo in range(max_tentativi):
+            base, voci = self._base_transazione()
+            tx = Transazione(self, voci)
+            esito = funzione(tx)
+            modifiche = tx.testi()
+            if not modifiche:
+                return esito
+            if self._pubblica(base, modifiche, msg):
+                self._conta("commit")
+                return esito
+            self._conta("conflitti")
+            if tentativo + 1 < max_tentativi:
+                time.sleep(0.5 + tentativo * 0.5)
+
+        raise Exception(f"Transazione '{msg}' non riuscita dopo {max_tentativi} tentativi: il ramo è cambiato a ogni tentativo.")
+
+    def scrivi_csv(self, path, df, msg):
+        """Sostituisce un CSV con il contenuto di df, in un commit."""
+        def scrivi(tx):
+            tx.scrivi_csv(path, df)
+        self.transazione(scrivi, msg)
+
+    def appendi_log(self, path, righe, intestazione, msg):
+        """Accoda righe a un CSV di log, in un commit."""
+        def accoda(tx):
+            tx.appendi_righe(path, righe, intestazione)
+        self.transazione(accoda, msg)
+
+
+class Transazione:
+    """Fotografia dei dati a una versione precisa, più le modifiche in
+    sospeso. Le letture vedono sempre lo stato di quella versione (più quanto
+    già scritto nella transazione stessa), così tutti i controlli — limite
+    clausole, proprietario attuale, crediti — vengono fatti sugli stessi dati
+    che verranno poi sovrascritti, e non su copie lette in momenti diversi."""
+
+    def __init__(self, archivio, voci_albero):
+        self.archivio = archivio
+        self.voci_albero = voci_albero  # {path: sha del blob}
+        self.modifiche = {}             # {path: nuovo contenuto testuale}
+        self._tabelle = {}              # {path: DataFrame modificato, serializzato alla fine}
+
+    def esiste(self, path):
+        return path in self.modifiche or path in self._tabelle or path in self.voci_albero
+
+    def testi(self):
+        """Tutte le modifiche come {path: testo}, pronte da pubblicare."""
+        testi = dict(self.modifiche)
+        for path, df in self._tabelle.items():
+            testi[path] = df.to_csv(index=False)
+        return testi
+
+    def leggi_testo(self, path):
+        """Contenuto del file in questa transazione ("" se non esiste)."""
+        if path in self._tabelle:
+            return self._tabelle[path].to_csv(index=False)
+        if path in self.modifiche:
+            return self.modifiche[path]
+        sha_blob = self.voci_albero.get(path)
+        return self.archivio.testo_blob(sha_blob) if sha_blob else ""
+
+    def leggi_csv(self, path):
+        if path in self._tabelle:
+            return self._tabelle[path].copy()
+        if path in self.modifiche:
+            return _csv_da_testo(self.modifiche[path])
+        sha_blob = self.voci_albero.get(path)
+        return self.archivio.csv_blob(sha_blob) if sha_blob else pd.DataFrame()
+
+    def scrivi_testo(self, path, testo):
+        self._tabelle.pop(path, None)
+        self.modifiche[path] = testo
+
+    def scrivi_csv(self, path, df):
+        self.modifiche.pop(path, None)
+        self._tabelle[path] = df
+
+    def appendi_righe(self, path, righe, intestazione):
+        """Accoda righe a un CSV di log senza riscriverne il contenuto
+        esistente (formato e virgolette restano quelli originali). Se il file
+        non esiste ancora viene creato con l'intestazione."""
+        testo = self.leggi_testo(path)
+        if not testo.strip():
+            testo = ",".join(intestazione) + "\n"
+        elif not testo.endswith("\n"):
+            testo += "\n"
+        buffer = StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(righe)
+        self.scrivi_testo(path, testo + buffer.getvalue())
+
+    # --- operazioni per riga ---
+    # Le operazioni di mercato usano questi metodi invece di modificare a mano
+    # interi DataFrame: qui diventano modifiche al CSV, sul backend SQLite
+    # (archivio_sqlite.py) UPDATE/DELETE/INSERT sulle sole righe interessate.
+    # I filtri sono uguaglianze colonna=valore, confrontate come testo.
+    def _maschera(self, df, filtri):
+        maschera = pd.Series(True, index=df.index)
+        for colonna, valore in filtri.items():
+            if colonna not in df.columns:
+                return pd.Series(False, index=df.index)
+            maschera &= df[colonna].astype(str).str.strip() == str(valore).strip()
+        return maschera
+
+    def _da_modificare(self, path):
+        if path in self._tabelle:
+            return self._tabelle[path]
+        return self.leggi_csv(path)
+
+    def righe(self, path, **filtri):
+        """Righe del CSV che soddisfano i filtri."""
+        df = self.leggi_csv(path)
+        return df[self._maschera(df, filtri)]
+
+    def aggiorna_righe(self, path, valori, **filtri):
+        """Imposta {colonna: valore} sulle righe filtrate; restituisce quante."""
+        df = self._da_modificare(path)
+        maschera = self._maschera(df, filtri)
+        if maschera.any():
+            for colonna, valore in valori.items():
+                df.loc[maschera, colonna] = valore
+            self.scrivi_csv(path, df)
+        return int(maschera.sum())
+
+    def incrementa(self, path, colonna, delta, **filtri):
+        """Somma delta alla colonna delle righe filtrate; restituisce quante."""
+        df = self._da_modificare(path)
+        maschera = self._maschera(df, filtri)
+        if maschera.any():
+            df.loc[maschera, colonna] += delta
+            self.scrivi_csv(path, df)
+        return int(maschera.sum())
+
+    def elimina_righe(self, path, **filtri):
+        """Elimina le righe filtrate; restituisce quante."""
+        df = self._da_modificare(path)
+        maschera = self._maschera(df, filtri)
+        if maschera.any():
+            self.scrivi_csv(path, df[~maschera])
+        return int(maschera.sum())
+
+    def appendi_df(self, path, nuove):
+        """Accoda le righe di un DataFrame. Se le sue colonne sono già tutte
+        nel file le righe vengono solo accodate nell'ordine dell'intestazione
+        esistente, altrimenti il file viene riscritto con le colonne unite."""
+        attuale = self.leggi_csv(path)
+        if attuale.empty and not len(attuale.columns):
+            self.scrivi_csv(path, nuove.reset_index(drop=True))
+        elif set(nuove.columns) <= set(attuale.columns):
+            righe = nuove.reindex(columns=attuale.columns).astype(object)
+            righe = righe.where(righe.notna(), "").values.tolist()
+            self.appendi_righe(path, righe, list(attuale.columns))
+        else:
+            self.scrivi_csv(path, pd.concat([attuale, nuove], ignore_index=True))
+
+
+# --- BACKEND GITHUB ---
+# L'elenco dei file del ramo viene chiesto con l'ETag della risposta
+# precedente: se nulla è cambiato GitHub risponde 304 senza corpo e, con un
+# token autenticato, quella risposta NON consuma il budget di 5000
+# richieste/ora. Insieme alla cache per SHA, rileggere un file invariato
+# costa zero download, zero parsing e zero budget.
+_alberi = {}  # (url repo, ramo) -> (etag, sha dell'albero, {path: sha})
+
+
+class ArchivioGithub(Archivio):
+    """Il repository GitHub della lega (PyGithub)."""
+
+    def __init__(self, repo, ramo=None):
+        super().__init__()
+        self.repo = repo
+        self.ramo = ramo or repo.default_branch
+
+    def _voci(self):
+        """(sha dell'albero, {path: sha del blob}) del ramo, con una sola
+        richiesta condizionale."""
+        chiave = (self.repo.url, self.ramo)
+        etag, sha_albero, voci = _alberi.get(chiave, (None, None, None))
+
+        status, headers, corpo = self.repo.requester.requestJson(
+            "GET", f"{self.repo.url}/git/trees/{self.ramo}",
+            parameters={"recursive": "1"},
+            headers={"If-None-Match": etag} if etag else None,
+        )
+        _conta_richiesta("richieste")
+        if headers.get("x-ratelimit-remaining") is not None:
+            with _lock_statistiche:
+                statistiche_richieste["rate_limit_residuo"] = int(headers["x-ratelimit-remaining"])
+
+        if status == 304 and voci is not None:
+            _conta_richiesta("non_modificate")
+            return sha_albero, voci
+        if status >= 400:
+            raise GithubException(status, json.loads(corpo) if corpo else None, headers)
+
+        dati = json.loads(corpo)
+        voci = {v["path"]: v["sha"] for v in dati["tree"] if v["type"] == "blob"}
+        _alberi[chiave] = (headers.get("etag"), dati["sha"], voci)
+        return dati["sha"], voci
+
+    def _scarica_blob(self, sha_blob):
+        blob = self.repo.get_git_blob(sha_blob)
+        return decodifica(base64.b64decode(blob.content))[0]
+
+    def _base_transazione(self):
+        ref = self.repo.get_git_ref(f"heads/{self.ramo}")
+        sha_base = ref.object.sha
+        albero = self.repo.get_git_tree(sha_base)
+        voci = {v.path: v.sha for v in albero.tree if v.type == "blob"}
+        return (ref, sha_base, albero), voci
+
+    def _pubblica(self, base, modifiche, msg):
+        ref, sha_base, albero = base
+        elementi = [
+            InputGitTreeElement(path, "100644", "blob", content=testo)
+            for path, testo in modifiche.items()
+        ]
+        nuovo_albero = self.repo.create_git_tree(elementi, albero)
+        _, commit = self.repo.requester.requestJsonAndCheck(
+            "POST", f"{self.repo.url}/git/commits",
+            input={"message": msg, "tree": nuovo_albero.sha, "parents": [sha_base]},
+        )
+        # Aggiornamento NON forzato: se il ramo non punta più a sha_base il
+        # nuovo commit non è un fast-forward e GitHub lo rifiuta.
+        try:
+            ref.edit(commit["sha"], force=False)
+            return True
+        except GithubException as e:
+            if e.status in (409, 422):
+                return False
+            raise
+
+    def elenca_versioni(self, path=None, limite=20, dal=None):
+        filtri = {"sha": self.ramo}
+        if path:
+            filtri["path"] = path
+        if dal is not None:
+            filtri["since"] = datetime.fromtimestamp(dal, timezone.utc)
+        commit = self.repo.get_commits(**filtri)
+        versioni = []
+        for c in commit[:limite]:
+            versioni.append({
+                "versione": c.sha,
+                "messaggio": c.commit.message,
+                "orario": c.commit.author.date.strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        return versioni
+
+
+# --- BACKEND LOCALE ---
+class ArchivioLocale(Archivio):
+    """Archivio su disco con la stessa semantica di quello GitHub, pensato
+    per benchmark e prove di carico offline:
+
+        <cartella>/oggetti/<sha>    blob e manifest, indirizzati per contenuto
+        <cartella>/HEAD             versione attuale
+        <cartella>/versioni.jsonl   storico dei commit (versione, padre, messaggio, file)
+
+    Ogni operazione che su GitHub è una chiamata HTTP attende 'latenza'
+    secondi (più un valore casuale fino a 'variazione'), così la finestra
+    tra lettura e aggiornamento del ref — e quindi la probabilità di
+    conflitto — è realistica. La pubblicazione rifiuta, come GitHub, un
+    commit costruito su una versione che non è più quella attuale.
+    Se l'archivio è vuoto viene inizializzato con i *.csv di 'sorgente'."""
+
+    def __init__(self, cartella, latenza=0.0, variazione=0.0, sorgente=None):
+        super().__init__()
+        self.cartella = cartella
+        self.latenza = latenza
+        self.variazione = variazione
+        self._lock_ref = threading.Lock()
+        os.makedirs(os.path.join(cartella, "oggetti"), exist_ok=True)
+        if self._head() is None:
+            voci = {}
+            if sorgente:
+                for nome in sorted(os.listdir(sorgente)):
+                    if nome.endswith(".csv"):
+                        with open(os.path.join(sorgente, nome), "rb") as f:
+                            voci[nome] = self._salva_oggetto(decodifica(f.read())[0])
+            self._sposta_head(None, voci, "Inizializzazione archivio locale", list(voci))
+
+    def _attendi(self):
+        if self.latenza or self.variazione:
+            time.sleep(self.latenza + random.uniform(0, self.variazione))
+
+    def _percorso(self, *parti):
+        return os.path.join(self.cartella, *parti)
+
+    def _scrivi_atomico(self, percorso, testo):
+        tmp = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write(testo)
+        os.replace(tmp, percorso)
+
+    def _salva_oggetto(self, testo):
+        sha = sha_blob_git(testo)
+        percorso = self._percorso("oggetti", sha)
+        if not os.path.exists(percorso):
+            self._scrivi_atomico(percorso, testo)
+        return sha
+
+    def _leggi_oggetto(self, sha):
+        with open(self._percorso("oggetti", sha), encoding="utf-8", newline="") as f:
+            return f.read()
+
+    def _head(self):
+        try:
+            with open(self._percorso("HEAD"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _manifest(self, versione):
+        return json.loads(self._leggi_oggetto(versione))["voci"]
+
+    def _sposta_head(self, padre, voci, msg, file_modificati):
+        manifest = json.dumps({"padre": padre, "voci": voci}, sort_keys=True)
+        versione = self._salva_oggetto(manifest)
+        riga = {
+            "versione": versione, "padre": padre, "messaggio": msg,
+            "orario": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "file": sorted(file_modificati),
+        }
+        with open(self._percorso("versioni.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(riga, ensure_ascii=False) + "\n")
+        self._scrivi_atomico(self._percorso("HEAD"), versione)
+
+    def _voci(self):
+        self._attendi()
+        versione = self._head()
+        return versione, self._manifest(versione)
+
+    def _scarica_blob(self, sha_blob):
+        self._attendi()
+        return self._leggi_oggetto(sha_blob)
+
+    def _base_transazione(self):
+        self._attendi()  # lettura del ref
+        versione = self._head()
+        self._attendi()  # lettura dell'albero
+        return versione, self._manifest(versione)
+
+    def _pubblica(self, base, modifiche, msg):
+        voci = dict(self._manifest(base))
+        for path, testo in modifiche.items():
+            voci[path] = self._salva_oggetto(testo)
+        self._attendi()  # creazione albero
+        self._attendi()  # creazione commit
+        self._attendi()  # aggiornamento del ref
+        with self._lock_ref:
+            if self._head() != base:
+                return False
+            self._sposta_head(base, voci, msg, modifiche)
+        return True
+
+    def elenca_versioni(self, path=None, limite=20, dal=None):
+        try:
+            with open(self._percorso("versioni.jsonl"), encoding="utf-8") as f:
+                righe = [json.loads(r) for r in f if r.strip()]
+        except FileNotFoundError:
+            return []
+        soglia = orario_locale(dal)
+        versioni = [
+            {"versione": r["versione"], "messaggio": r["messaggio"], "orario": r["orario"]}
+            for r in reversed(righe)
+            if (path is None or path in r["file"]) and r["orario"] >= soglia
+        ]
+        return versioni[:limite]
+
+
+def archivio_da_ambiente():
+    """Archivio alternativo scelto da variabili d'ambiente, altrimenti None
+    (le app usano allora il repository GitHub configurato nei Secrets):
+      - LFM_ARCHIVIO_SQLITE=<file.db>: backend SQLite (archivio_sqlite.py);
+      - LFM_ARCHIVIO_LOCALE=<cartella>: archivio locale, con LFM_LATENZA_MS
+        opzionale.
+    Un archivio nuovo viene popolato con i CSV di LFM_ARCHIVIO_SORGENTE
+    (default: la cartella corrente)."""
+    sorgente = os.environ.get("LFM_ARCHIVIO_SORGENTE", ".")
+    if os.environ.get("LFM_ARCHIVIO_SQLITE"):
+        from archivio_sqlite import ArchivioSqlite
+        return ArchivioSqlite(os.environ["LFM_ARCHIVIO_SQLITE"], sorgente=sorgente)
+    cartella = os.environ.get("LFM_ARCHIVIO_LOCALE")
+    if not cartella:
+        return None
+    return ArchivioLocale(
+        cartella,
+        latenza=float(os.environ.get("LFM_LATENZA_MS", "0")) / 1000,
+        sorgente=sorgente,
+    )
@@ -0,0 +1,403 @@
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from archivio import Archivio, Transazione, _csv_da_testo, orario_locale, sha_blob_git
+from manifesto_csv import decodifica
+
+# --- ARCHIVIO SQLITE ---
+# Backend opzionale per lo stato della lega: crediti, rose e log dei
+# movimenti stanno in tabelle indicizzate invece che in CSV interi da
+# riscrivere a ogni operazione. Una transazione (pagamento clausola,
+# controriscatto, svincolo, taglio, draft) è una transazione SQLite vera:
+# BEGIN IMMEDIATE serializza gli scrittori, quindi niente compare-and-swap,
+# niente tentativi ripetuti e niente più la gara che aggiorna_csv_con_retry
+# doveva aggirare. Un pagamento aggiorna due righe di squadre, una di rose e
+# inserisce una riga di log, ciascuna trovata tramite indice.
+#
+# I CSV su GitHub restano l'artefatto pubblicato: importa() carica lo stato
+# da un altro archivio (o da una cartella), esporta() lo riscrive lì in un
+# unico commit. I file che non hanno una tabella dedicata (quot.csv,
+# stadi.csv, clausole_segrete.csv, ...) sono conservati come testo.
+#
+# voci_albero() restituisce per i file di testo lo sha del blob, come gli
+# altri backend; per le tabelle un identificativo che cambia a ogni
+# transazione che le scrive (tabella 'tabelle'), così chi lo usa come
+# chiave di cache vede ogni modifica. Non è lo sha di un blob: il
+# contenuto si legge con leggi_csv/leggi_testo.
+
+# path del CSV -> (tabella, indici)
+TABELLE = {
+    "leghe.csv": ("squadre", [("Lega", "Squadra"), ("Squadra",)]),
+    "fantamanager-2021-rosters.csv": ("rose", [("Id", "Squadra_LFM"), ("Squadra_LFM",)]),
+    "richieste_scippo.csv": ("richieste_scippo", [("Acquirente", "Stato"), ("Proprietario", "Stato")]),
+    "svincolati_gennaio.csv": ("svincolati_gennaio", [("Squadra",)]),
+    "tagli_volontari.csv": ("tagli_volontari", [("Squadra",)]),
+    "draft_estivo.csv": ("draft_estivo", [("Lega", "Ruolo")]),
+    "movimenti_crediti.csv": ("movimenti_crediti", [("Squadra", "Tipo")]),
+    "saldi_crediti.csv": ("saldi_crediti", [("Lega", "Squadra"), ("Squadra",)]),
+    "clausole_salvate.csv": ("clausole_salvate", [("Squadra",), ("Id",)]),
+}
+
+
+def _tipo_sql(serie):
+    if pd.api.types.is_integer_dtype(serie):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(serie):
+        return "REAL"
+    return "TEXT"
+
+
+def _valore_sql(valore):
+    if valore is None or (not isinstance(valore, str) and pd.isna(valore)):
+        return None
+    if hasattr(valore, "item"):  # scalari numpy
+        return valore.item()
+    return valore
+
+
+def _q(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+
+class TransazioneSqlite(Transazione):
+    """Stessa interfaccia di archivio.Transazione, eseguita dentro una
+    transazione SQLite: ogni lettura e scrittura va direttamente sul database
+    (la transazione è già isolata), le operazioni per riga diventano
+    istruzioni SQL sulle righe interessate."""
+
+    def __init__(self, archivio, conn):
+        super().__init__(archivio, {})
+        self.conn = conn
+        self.file_modificati = set()
+
+    # --- schema ---
+    def _colonne(self, tabella):
+        return [r[1] for r in self.conn.execute(f"PRAGMA table_info({_q(tabella)})")]
+
+    def _assicura_tabella(self, path, df):
+        """Crea la tabella del path (o le aggiunge le colonne mancanti) con i
+        tipi dedotti da df, più gli indici previsti in TABELLE."""
+        tabella, indici = TABELLE[path]
+        colonne = self._colonne(tabella)
+        if not colonne:
+            definizioni = ", ".join(f"{_q(c)} {_tipo_sql(df[c])}" for c in df.columns)
+            self.conn.execute(f"CREATE TABLE {_q(tabella)} ({definizioni})")
+            colonne = list(df.columns)
+        for c in df.columns:
+            if c not in colonne:
+                self.conn.execute(f"ALTER TABLE {_q(tabella)} ADD COLUMN {_q(c)} {_tipo_sql(df[c])}")
+                colonne.append(c)
+        for indice in indici:
+            if all(c in colonne for c in indice):
+                nome = "idx_" + tabella + "_" + "_".join(indice).lower()
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {_q(nome)} ON {_q(tabella)} ({', '.join(_q(c) for c in indice)})"
+                )
+        return tabella
+
+    def _inserisci(self, tabella, df):
+        if df.empty:
+            return
+        colonne = ", ".join(_q(c) for c in df.columns)
+        segnaposto = ", ".join("?" for _ in df.columns)
+        righe = [[_valore_sql(v) for v in r] for r in df.itertuples(index=False, name=None)]
+        self.conn.executemany(f"INSERT INTO {_q(tabella)} ({colonne}) VALUES ({segnaposto})", righe)
+
+    def _where(self, tabella, filtri):
+        colonne = self._colonne(tabella)
+        if any(c not in colonne for c in filtri):
+            return None, None
+        clausola = " AND ".join(f"{_q(c)} = ?" for c in filtri) or "1"
+        return clausola, [_valore_sql(v) for v in filtri.values()]
+
+    # --- interfaccia di Transazione ---
+    def esiste(self, path):
+        if path in TABELLE:
+            return bool(self._colonne(TABELLE[path][0]))
+        return self.conn.execute("SELECT 1 FROM file WHERE path = ?", (path,)).fetchone() is not None
+
+    def testi(self):
+        # Le scritture sono già nel database; qui serve solo sapere se ce ne sono.
+        return {path: None for path in self.file_modificati}
+
+    def leggi_csv(self, path):
+        if path in TABELLE:
+            tabella = TABELLE[path][0]
+            if not self._colonne(tabella):
+                return pd.DataFrame()
+            return pd.read_sql_query(f"SELECT * FROM {_q(tabella)} ORDER BY rowid", self.conn)
+        riga = self.conn.execute("SELECT sha FROM file WHERE path = ?", (path,)).fetchone()
+        return self.archivio.csv_blob(riga[0]) if riga else pd.DataFrame()
+
+    def leggi_testo(self, path):
+        if path in TABELLE:
+            df = self.leggi_csv(path)
+            return df.to_csv(index=False) if len(df.columns) else ""
+        riga = self.conn.execute("SELECT testo FROM file WHERE path = ?", (path,)).fetchone()
+        return riga[0] if riga else ""
+
+    def scrivi_testo(self, path, testo):
+        if path in TABELLE:
+            self.scrivi_csv(path, _csv_da_testo(testo))
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file (path, sha, testo) VALUES (?, ?, ?)",
+            (path, sha_blob_git(testo), testo),
+        )
+        self.file_modificati.add(path)
+
+    def scrivi_csv(self, path, df):
+        if path not in TABELLE:
+            self.scrivi_testo(path, df.to_csv(index=False))
+            return
+        tabella = TABELLE[path][0]
+        self.conn.execute(f"DROP TABLE IF EXISTS {_q(tabella)}")
+        self._assicura_tabella(path, df)
+        self._inserisci(tabella, df)
+        self.file_modificati.add(path)
+
+    def appendi_righe(self, path, righe, intestazione):
+        if path not in TABELLE:
+            super().appendi_righe(path, righe, intestazione)
+            return
+        self.appendi_df(path, pd.DataFrame(righe, columns=intestazione))
+
+    def appendi_df(self, path, nuove):
+        if path not in TABELLE:
+            super().appendi_df(path, nuove)
+            return
+        tabella = self._assicura_tabella(path, nuove)
+        self._inserisci(tabella, nuove)
+        self.file_modificati.add(path)
+
+    def righe(self, path, **filtri):
+        if path not in TABELLE:
+            return super().righe(path, **filtri)
+        tabella = TABELLE[path][0]
+        clausola, parametri = self._where(tabella, filtri)
+        if clausola is None:
+            return pd.DataFrame()
+        return pd.read_sql_query(
+            f"SELECT * FROM {_q(tabella)} WHERE {clausola} ORDER BY rowid", self.conn, params=parametri
+        )
+
+    def _modifica(self, path, sql, filtri, parametri_iniziali):
+        tabella = TABELLE[path][0]
+        clausola, parametri = self._where(tabella, filtri)
+        if clausola is None:
+            return 0
+        n = self.conn.execute(sql.format(t=_q(tabella), w=clausola), parametri_iniziali + parametri).rowcount
+        if n:
+            self.file_modificati.add(path)
+        return n
+
+    def aggiorna_righe(self, path, valori, **filtri):
+        if path not in TABELLE:
+            return super().aggiorna_righe(path, valori, **filtri)
+        assegnazioni = ", ".join(f"{_q(c)} = ?" for c in valori)
+        return self._modifica(path, "UPDATE {t} SET " + assegnazioni + " WHERE {w}",
+                              filtri, [_valore_sql(v) for v in valori.values()])
+
+    def incrementa(self, path, colonna, delta, **filtri):
+        if path not in TABELLE:
+            return super().incrementa(path, colonna, delta, **filtri)
+        return self._modifica(path, "UPDATE {t} SET " + f"{_q(colonna)} = {_q(colonna)} + ?" + " WHERE {w}",
+                              filtri, [_valore_sql(delta)])
+
+    def elimina_righe(self, path, **filtri):
+        if path not in TABELLE:
+            return super().elimina_righe(path, **filtri)
+        return self._modifica(path, "DELETE FROM {t} WHERE {w}", filtri, [])
+
+
+class ArchivioSqlite(Archivio):
+    """Archivio della lega in un file SQLite (modalità WAL: le letture non
+    bloccano le scritture). Se il database è vuoto viene popolato con i CSV
+    di 'sorgente' (una cartella)."""
+
+    def __init__(self, percorso, sorgente=None):
+        super().__init__()
+        self.percorso = percorso
+        self._locale = threading.local()
+        conn = self._connessione()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS file (path TEXT PRIMARY KEY, sha TEXT, testo TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_file_sha ON file (sha)")
+        conn.execute("CREATE TABLE IF NOT EXISTS tabelle (path TEXT PRIMARY KEY, sha TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS versioni (id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " messaggio TEXT, orario TEXT, file TEXT)"
+        )
+        if sorgente and self.versione() == 0:
+            self.importa_cartella(sorgente)
+        # Database creati prima della tabella 'tabelle': un identificativo
+        # per le tabelle che non lo hanno ancora
+        tx = TransazioneSqlite(self, conn)
+        for path in TABELLE:
+            if tx.esiste(path):
+                conn.execute("INSERT OR IGNORE INTO tabelle (path, sha) VALUES (?, ?)", (path, uuid.uuid4().hex))
+
+    def _connessione(self):
+        # Una connessione per thread: sqlite3 non le condivide tra thread.
+        conn = getattr(self._locale, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.percorso, timeout=30, isolation_level=None)
+            self._locale.conn = conn
+        return conn
+
+    # --- letture ---
+    def _scarica_blob(self, sha_blob):
+        riga = self._connessione().execute("SELECT testo FROM file WHERE sha = ?", (sha_blob,)).fetchone()
+        if riga is None:
+            raise FileNotFoundError(sha_blob)
+        return riga[0]
+
+    def versione(self):
+        riga = self._connessione().execute("SELECT MAX(id) FROM versioni").fetchone()
+        return riga[0] or 0
+
+    def _lettura(self, funzione):
+        """Esegue funzione(tx) in una transazione di sola lettura: tutte le
+        letture vedono lo stesso stato del database."""
+        conn = self._connessione()
+        conn.execute("BEGIN")
+        try:
+            return funzione(TransazioneSqlite(self, conn))
+        finally:
+            conn.execute("COMMIT")
+
+    def _voci_tx(self, tx):
+        presenti = dict(tx.conn.execute("SELECT path, sha FROM tabelle"))
+        presenti = {path: presenti.get(path) for path in TABELLE if tx.esiste(path)}
+        for path, sha in tx.conn.execute("SELECT path, sha FROM file"):
+            presenti[path] = sha
+        return presenti
+
+    def voci_albero(self):
+        """{path: sha del blob} dei file di testo e {path: identificativo
+        della versione} delle tabelle."""
+        return self._lettura(self._voci_tx)
+
+    def leggi_testo(self, path):
+        def leggi(tx):
+            if not tx.esiste(path):
+                raise FileNotFoundError(path)
+            return tx.leggi_testo(path)
+        return self._lettura(leggi)
+
+    def leggi_csv(self, path):
+        def leggi(tx):
+            if not tx.esiste(path):
+                raise FileNotFoundError(path)
+            return tx.leggi_csv(path)
+        return self._lettura(leggi)
+
+    def fotografia(self, percorsi, testuali=()):
+        def leggi(tx):
+            dati = {}
+            for path in percorsi:
+                if path in testuali:
+                    dati[path] = tx.leggi_testo(path)
+                else:
+                    dati[path] = tx.leggi_csv(path)
+            return self.versione(), dati
+        return self._lettura(leggi)
+
+    def fotografia_voci(self, percorsi):
+        def leggi(tx):
+            voci = self._voci_tx(tx)
+            return {p: voci.get(p) for p in percorsi}, {p: tx.leggi_csv(p) for p in percorsi}
+        return self._lettura(leggi)
+
+    # --- scritture ---
+    def transazione(self, funzione, msg, max_tentativi=5):
+        """Esegue funzione(tx) in una transazione SQLite. BEGIN IMMEDIATE
+        prende subito il lock di scrittura: le transazioni concorrenti
+        aspettano il proprio turno invece di fallire e ripartire, quindi
+        max_tentativi è accettato solo per compatibilità."""
+        self._conta("transazioni")
+        conn = self._connessione()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tx = TransazioneSqlite(self, conn)
+            esito = funzione(tx)
+            if tx.file_modificati:
+                conn.execute(
+                    "INSERT INTO versioni (messaggio, orario, file) VALUES (?, ?, ?)",
+                    (msg, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), ",".join(sorted(tx.file_modificati))),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tabelle (path, sha) VALUES (?, ?)",
+                    [(path, uuid.uuid4().hex) for path in sorted(tx.file_modificati) if path in TABELLE],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if tx.file_modificati:
+            self._conta("commit")
+        return esito
+
+    def elenca_versioni(self, path=None, limite=20, dal=None):
+        righe = self._connessione().execute(
+            "SELECT id, messaggio, orario, file FROM versioni WHERE orario >= ? ORDER BY id DESC",
+            (orario_locale(dal),),
+        ).fetchall()
+        versioni = [
+            {"versione": r[0], "messaggio": r[1], "orario": r[2]}
+            for r in righe if path is None or path in r[3].split(",")
+        ]
+        return versioni[:limite]
+
+    # --- import / export CSV ---
+    def importa_testi(self, testi, msg="Importazione CSV"):
+        """Sostituisce lo stato con {path: testo CSV}, in una transazione."""
+        def importa(tx):
+            for path, testo in testi.items():
+                if path in TABELLE:
+                    df = _csv_da_testo(testo)
+                    for c in df.select_dtypes(include=["object", "string"]).columns:
+                        df[c] = df[c].str.strip()
+                    tx.scrivi_csv(path, df)
+                else:
+                    tx.scrivi_testo(path, testo)
+        self.transazione(importa, msg)
+
+    def importa_cartella(self, cartella):
+        testi = {}
+        for nome in sorted(os.listdir(cartella)):
+            if nome.endswith(".csv"):
+                with open(os.path.join(cartella, nome), "rb") as f:
+                    testi[nome] = decodifica(f.read())[0]
+        self.importa_testi(testi, f"Importazione da {cartella}")
+
+    def importa(self, archivio):
+        """Carica tutti i CSV di un altro archivio (es. ArchivioGithub)."""
+        percorsi = [p for p in archivio.voci_albero() if p.endswith(".csv")]
+        _, testi = archivio.fotografia(percorsi, testuali=percorsi)
+        self.importa_testi(testi, "Importazione da archivio")
+
+    def esporta_testi(self):
+        """{path: testo CSV} di tutto lo stato, letto a una sola versione."""
+        def esporta(tx):
+            testi = {path: tx.leggi_testo(path) for path in TABELLE if tx.esiste(path)}
+            for path, testo in tx.conn.execute("SELECT path, testo FROM file"):
+                testi[path] = testo
+            return testi
+        return self._lettura(esporta)
+
+    def esporta(self, archivio, msg="Esportazione stato della lega"):
+        """Pubblica lo stato come CSV su un altro archivio, in un unico commit
+        (solo i file cambiati finiscono davvero nel commit)."""
+        testi = self.esporta_testi()
+
+        def scrivi(tx):
+            for path, testo in testi.items():
+                if tx.leggi_testo(path) != testo:
+                    tx.scrivi_testo(path, testo)
+        archivio.transazione(scrivi, msg)
@@ -0,0 +1,109 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from calendari import calendari_cartella
+from indice_stadi import indice_stadi_locale
+
+# --- BONUS STADIO DELLA STAGIONE ---
+# Le pagine dei calendari calcolano il bonus stadio partita per partita, e
+# solo per la giornata aperta. Qui i bonus di tutte le partite di tutte le
+# competizioni vengono calcolati in blocco (map vettoriali sull'indice degli
+# stadi) una volta per versione dei calendari e di stadi.csv:
+#   partite   ogni partita giocabile con Bonus_Casa e Bonus_Fuori
+#   matrice   una riga per squadra e partita: Campo ("Casa"/"Fuori"),
+#             Bonus, Bonus_Avversario, Differenziale (Bonus - Bonus_Avversario)
+# vantaggio_stadi() ne ricava i totali per squadra (bonus in casa, in
+# trasferta, differenziale) e differenziale_per_giornata() la serie di una
+# squadra, per le pagine "vantaggio stadi" su tutte le 40 squadre.
+
+BonusStagione = namedtuple("BonusStagione", "partite matrice versione")
+
+COLONNE_MATRICE = [
+    "Squadra", "Avversario", "Campo", "Competizione", "Tipo", "Giornata", "N_Giornata",
+    "Bonus", "Bonus_Avversario", "Differenziale",
+]
+
+_stagioni = {}
+_lock_stagioni = threading.Lock()
+_MAX_STAGIONI = 4
+
+
+def bonus_partite(partite, stadi):
+    """Le partite (riposi esclusi) con i bonus stadio di casa e trasferta."""
+    partite = partite[~partite["Riposa"].astype(bool)].reset_index(drop=True)
+    bonus_casa, bonus_fuori = stadi.bonus_colonne(partite["Casa"], partite["Fuori"])
+    return partite.assign(Bonus_Casa=bonus_casa, Bonus_Fuori=bonus_fuori)
+
+
+def matrice_bonus(partite_bonus):
+    """Una riga per squadra e partita, dal punto di vista della squadra."""
+    comuni = ["Competizione", "Tipo", "Giornata", "N_Giornata"]
+    in_casa = partite_bonus[comuni].assign(
+        Squadra=partite_bonus["Casa"], Avversario=partite_bonus["Fuori"], Campo="Casa",
+        Bonus=partite_bonus["Bonus_Casa"], Bonus_Avversario=partite_bonus["Bonus_Fuori"],
+    )
+    fuori = partite_bonus[comuni].assign(
+        Squadra=partite_bonus["Fuori"], Avversario=partite_bonus["Casa"], Campo="Fuori",
+        Bonus=partite_bonus["Bonus_Fuori"], Bonus_Avversario=partite_bonus["Bonus_Casa"],
+    )
+    matrice = pd.concat([in_casa, fuori], ignore_index=True)
+    matrice["Differenziale"] = matrice["Bonus"] - matrice["Bonus_Avversario"]
+    return matrice[COLONNE_MATRICE]
+
+
+def vantaggio_stadi(matrice):
+    """Totali per squadra: partite, bonus in casa, bonus in trasferta, bonus
+    complessivo e differenziale (totale e medio a partita), con il
+    campionato di appartenenza. Ordinati per differenziale."""
+    if matrice.empty:
+        return pd.DataFrame(columns=["Squadra", "Campionato", "Partite", "Bonus_Casa", "Bonus_Fuori",
+                                     "Bonus_Totale", "Differenziale", "Differenziale_Medio"])
+    in_casa = matrice["Campo"] == "Casa"
+    righe = matrice.assign(
+        Bonus_Casa=np.where(in_casa, matrice["Bonus"], 0.0),
+        Bonus_Fuori=np.where(in_casa, 0.0, matrice["Bonus"]),
+    )
+    totali = righe.groupby("Squadra", sort=False).agg(
+        Partite=("Bonus", "size"), Bonus_Casa=("Bonus_Casa", "sum"), Bonus_Fuori=("Bonus_Fuori", "sum"),
+        Bonus_Totale=("Bonus", "sum"), Differenziale=("Differenziale", "sum"),
+    )
+    totali["Differenziale_Medio"] = totali["Differenziale"] / totali["Partite"]
+    campionati = matrice[matrice["Tipo"] == "Campionato"].drop_duplicates("Squadra").set_index("Squadra")["Competizione"]
+    totali.insert(0, "Campionato", campionati.reindex(totali.index).fillna("").values)
+    return totali.reset_index().sort_values(["Differenziale", "Squadra"], ascending=[False, True], ignore_index=True)
+
+
+def differenziale_per_giornata(matrice, squadra):
+    """Le partite della squadra in ordine di giornata, con il differenziale
+    di ognuna e quello cumulato."""
+    righe = matrice[matrice["Squadra"] == squadra].sort_values(["Tipo", "Competizione", "N_Giornata"], kind="stable")
+    return righe.assign(Cumulato=righe.groupby("Competizione")["Differenziale"].cumsum())
+
+
+def bonus_stagione(cartella=".", stadi=None):
+    """BonusStagione di tutti i calendari della cartella. Ricalcolato solo
+    quando cambia il contenuto di un calendario o lo stadi.csv."""
+    stadi = stadi if stadi is not None else indice_stadi_locale()
+    calendari = [c for c in calendari_cartella(cartella) if len(c)]
+    versione = (tuple(c.impronta for c in calendari), stadi.versione)
+    if stadi.versione is not None:
+        with _lock_stagioni:
+            stagione = _stagioni.get(versione)
+        if stagione is not None:
+            return stagione
+
+    if calendari:
+        partite = bonus_partite(pd.concat([c.partite for c in calendari], ignore_index=True), stadi)
+    else:
+        partite = pd.DataFrame(columns=["Competizione", "Tipo", "Giornata", "N_Giornata", "Casa", "Fuori",
+                                        "Bonus_Casa", "Bonus_Fuori"])
+    stagione = BonusStagione(partite, matrice_bonus(partite), versione)
+    if stadi.versione is not None:
+        with _lock_stagioni:
+            _stagioni[versione] = stagione
+            while len(_stagioni) > _MAX_STAGIONI:
+                _stagioni.pop(next(iter(_stagioni)))
+    return stagione
@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from riepilogo_squadre import impronta_dati
+
+# --- BUDGET NETTO DEI RIVALI ---
+# La soglia di blindaggio di una squadra è il budget netto più alto tra le
+# altre squadre della sua lega: crediti meno la manutenzione dello stadio
+# (l'unico costo certo per tutti). Il Terminale la ricalcolava a ogni login
+# filtrando leghe.csv sui rivali e prendendo il massimo.
+#
+# Qui si calcola per tutte le squadre insieme: per ogni lega il budget netto
+# più alto e il secondo, e per ogni squadra il massimo "esclusa se stessa"
+# (il secondo se la squadra è proprio quella col massimo, altrimenti il
+# primo). Un ordinamento e due groupby, invece di un filtro per squadra.
+# Memorizzato per impronta di crediti e squadre e versione di stadi.csv.
+
+COLONNE_BUDGET = ["Lega", "Squadra", "Crediti", "Manutenzione", "Netti", "Max_Rivali", "Rivale_Max"]
+
+_budget = {}
+_lock_budget = threading.Lock()
+_MAX_BUDGET = 8
+
+
+def calcola_budget_rivali(df_leghe, stadi):
+    """Una riga per squadra di leghe.csv (COLONNE_BUDGET): budget netto e
+    massimo budget netto dei rivali di lega (0 se non ha rivali), con il
+    nome del rivale che lo detiene."""
+    if df_leghe.empty or not {"Lega", "Squadra", "Crediti"} <= set(df_leghe.columns):
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_BUDGET})
+    budget = df_leghe[["Lega", "Squadra"]].copy()
+    budget["Crediti"] = pd.to_numeric(df_leghe["Crediti"], errors="coerce").fillna(0).astype(int)
+    budget["Manutenzione"] = budget["Squadra"].map(stadi.manutenzione).astype(int)
+    budget["Netti"] = budget["Crediti"] - budget["Manutenzione"]
+
+    ordinati = budget.sort_values("Netti", ascending=False, kind="stable")
+    rango = ordinati.groupby("Lega", sort=False).cumcount()
+    primi = ordinati[rango == 0].set_index("Lega")
+    secondi = ordinati[rango == 1].set_index("Lega")
+
+    primo = budget["Lega"].map(primi["Netti"])
+    e_primo = budget["Squadra"] == budget["Lega"].map(primi["Squadra"])
+    budget["Max_Rivali"] = np.where(e_primo, budget["Lega"].map(secondi["Netti"]), primo)
+    budget["Rivale_Max"] = np.where(e_primo, budget["Lega"].map(secondi["Squadra"]), budget["Lega"].map(primi["Squadra"]))
+    budget["Max_Rivali"] = budget["Max_Rivali"].fillna(0).astype(int)
+    budget["Rivale_Max"] = budget["Rivale_Max"].fillna("")
+    return budget[COLONNE_BUDGET].reset_index(drop=True)
+
+
+class BudgetRivali:
+    """Tabella dei budget netti con lookup per squadra."""
+
+    def __init__(self, tabella, versione=None):
+        self.tabella = tabella
+        self.versione = versione
+        self._righe = {sq: i for i, sq in enumerate(tabella["Squadra"])}
+
+    def __contains__(self, squadra):
+        return squadra in self._righe
+
+    def max_rivali(self, squadra):
+        """Budget netto più alto tra i rivali di lega della squadra (soglia
+        di blindaggio), 0 se la squadra non è in leghe.csv."""
+        i = self._righe.get(squadra)
+        return int(self.tabella["Max_Rivali"].iat[i]) if i is not None else 0
+
+    def netti(self, squadra):
+        i = self._righe.get(squadra)
+        return int(self.tabella["Netti"].iat[i]) if i is not None else 0
+
+    def lega(self, lega):
+        """Le righe di una lega, dal budget netto più alto."""
+        righe = self.tabella[self.tabella["Lega"] == lega]
+        return righe.sort_values("Netti", ascending=False, kind="stable")
+
+
+def budget_rivali(df_leghe, stadi):
+    """BudgetRivali memorizzato per impronta di Lega, Squadra e Crediti e
+    per versione degli stadi (senza versione viene ricalcolato)."""
+    if stadi.versione is None:
+        return BudgetRivali(calcola_budget_rivali(df_leghe, stadi))
+    colonne = [c for c in ("Lega", "Squadra", "Crediti") if c in df_leghe.columns]
+    chiave = impronta_dati(df_leghe[colonne], extra=(stadi.versione,))
+    with _lock_budget:
+        budget = _budget.get(chiave)
+    if budget is None:
+        budget = BudgetRivali(calcola_budget_rivali(df_leghe, stadi), chiave)
+        with _lock_budget:
+            _budget[chiave] = budget
+            while len(_budget) > _MAX_BUDGET:
+                _budget.pop(next(iter(_budget)))
+    return budget
@@ -0,0 +1,156 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+# --- BUFFER DEI LOG (WRITE-BEHIND) ---
+# Le righe dei log che nessun controllo rilegge subito (svincoli, tagli,
+# draft, richieste di clausola) non hanno bisogno di un commit ciascuna:
+# vengono scritte in un file locale (una riga JSON, con fsync) e confermate
+# subito, poi pubblicate tutte insieme in UN commit ogni 'max_secondi' o
+# appena se ne accumulano 'max_eventi'. Il file sopravvive ai riavvii: le
+# righe rimaste in sospeso vengono pubblicate al riavvio successivo.
+#
+# Ogni blocco pubblicato porta nel messaggio di commit l'id della sua prima
+# voce e quante voci contiene: se il processo muore tra il commit e la
+# pulizia del file, al riavvio le righe già pubblicate vengono riconosciute
+# e non duplicate. Lo storico viene letto a blocchi sempre più grandi finché
+# non si trova il marcatore, ma solo dall'accodamento della voce più vecchia
+# in poi (un commit non può precederla): anche con molti commit di altri nel
+# frattempo il blocco non viene ripubblicato, e un blocco mai pubblicato
+# costa poche versioni lette, non tutto lo storico.
+#
+# I log che fanno da fonte per i controlli (es. richieste_scippo.csv per il
+# limite di clausole pagate e il controriscatto) restano invece nella stessa
+# transazione dell'operazione: devono essere visibili subito a tutti.
+
+CARTELLA_BUFFER = os.environ.get("LFM_BUFFER_DIR", ".buffer_lfm")
+MARCATORE = re.compile(r"\[buffer (\w+) x(\d+)\]")
+MARGINE_OROLOGIO = 600  # secondi di tolleranza tra l'orologio dell'app e quello dell'archivio
+MAX_STORICO = 500       # versioni lette al massimo per voci senza orario di accodamento
+
+
+class BufferLog:
+    def __init__(self, archivio, nome, max_eventi=20, max_secondi=15.0):
+        self.archivio = archivio
+        self.percorso = os.path.join(CARTELLA_BUFFER, f"{nome}.jsonl")
+        self.max_eventi = max_eventi
+        self.max_secondi = max_secondi
+        self._lock = threading.Lock()
+        self._lock_pubblicazione = threading.Lock()
+        self._sveglia = threading.Event()
+        os.makedirs(CARTELLA_BUFFER, exist_ok=True)
+        self._voci = self._carica()
+        self._scarta_gia_pubblicate()
+        threading.Thread(target=self._ciclo, daemon=True).start()
+
+    def _carica(self):
+        try:
+            with open(self.percorso, encoding="utf-8") as f:
+                return [json.loads(r) for r in f if r.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _scarta_gia_pubblicate(self):
+        if not self._voci:
+            return
+        # Le voci sono pubblicate in ordine: basta trovare il blocco più
+        # recente già presente nello storico e scartare tutto fino alla sua fine.
+        posizioni = {voce["id"]: i for i, voce in enumerate(self._voci)}
+        accodate = [voce.get("creata") for voce in self._voci]
+        dal = min(accodate) - MARGINE_OROLOGIO if None not in accodate else None
+        letti, limite = 0, 20
+        while True:
+            try:
+                versioni = self.archivio.elenca_versioni(limite=limite, dal=dal)
+            except Exception:
+                return
+            for versione in versioni[letti:]:
+                trovato = MARCATORE.search(versione["messaggio"])
+                if trovato and trovato.group(1) in posizioni:
+                    self._rimuovi_prime(posizioni[trovato.group(1)] + int(trovato.group(2)))
+                    return
+            if len(versioni) < limite or (dal is None and limite >= MAX_STORICO):
+                return  # nessun marcatore: le voci non sono state pubblicate
+            letti, limite = len(versioni), limite * 4
+
+    def _riscrivi(self):
+        tmp = f"{self.percorso}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for voce in self._voci:
+                f.write(json.dumps(voce, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.percorso)
+
+    def _rimuovi_prime(self, quante):
+        with self._lock:
+            self._voci = self._voci[quante:]
+            self._riscrivi()
+
+    def accoda(self, path, righe, intestazione):
+        """Registra righe da accodare al CSV 'path'. Ritorna appena la riga è
+        su disco; la pubblicazione avviene in background."""
+        voce = {"id": uuid.uuid4().hex[:12], "creata": time.time(), "path": path, "righe": righe, "intestazione": intestazione}
+        with self._lock:
+            with open(self.percorso, "a", encoding="utf-8") as f:
+                f.write(json.dumps(voce, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._voci.append(json.loads(json.dumps(voce, default=str)))
+            pieno = len(self._voci) >= self.max_eventi
+        if pieno:
+            self._sveglia.set()
+
+    def accoda_df(self, path, df):
+        """Come accoda(), per le righe di un DataFrame."""
+        righe = df.astype(object).where(df.notna(), "").values.tolist()
+        self.accoda(path, righe, list(df.columns))
+
+    def in_sospeso(self, path):
+        """Righe di 'path' non ancora pubblicate, come DataFrame."""
+        with self._lock:
+            voci = [v for v in self._voci if v["path"] == path]
+        if not voci:
+            return pd.DataFrame()
+        return pd.concat([pd.DataFrame(v["righe"], columns=v["intestazione"]) for v in voci], ignore_index=True)
+
+    def unisci(self, path, df):
+        """df (letto dall'archivio) più le righe ancora in sospeso per 'path'."""
+        sospese = self.in_sospeso(path)
+        if sospese.empty:
+            return df
+        if df.empty:
+            return sospese
+        return pd.concat([df, sospese], ignore_index=True)
+
+    def pubblica(self):
+        """Pubblica in un unico commit tutte le righe in sospeso. Restituisce
+        quante righe sono state pubblicate."""
+        with self._lock_pubblicazione:
+            with self._lock:
+                voci = list(self._voci)
+            if not voci:
+                return 0
+
+            def accoda_tutto(tx):
+                for voce in voci:
+                    tx.appendi_df(voce["path"], pd.DataFrame(voce["righe"], columns=voce["intestazione"]))
+
+            messaggio = f"Log movimenti [buffer {voci[0]['id']} x{len(voci)}]"
+            self.archivio.transazione(accoda_tutto, messaggio)
+            self._rimuovi_prime(len(voci))
+            return len(voci)
+
+    def _ciclo(self):
+        while True:
+            self._sveglia.wait(self.max_secondi)
+            self._sveglia.clear()
+            try:
+                self.pubblica()
+            except Exception:
+                pass  # archivio non raggiungibile: si riprova al giro successivo
@@ -0,0 +1,231 @@
+import glob
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+from manifesto_csv import CARTELLA_CACHE, firma_file, leggi_csv
+from modello_lega import impronta_contenuto
+
+# --- CALENDARI COMPILATI ---
+# I Calendario_*.csv sono griglie esportate da Excel: blocchi "Nª Giornata
+# lega" affiancati (due per riga), ognuno seguito dalle sue partite. Le
+# pagine dei calendari (lfm, lab2, lablfm) li scandivano cella per cella a
+# ogni selezione, ognuna a modo suo per campionati e coppe.
+#
+# Qui ogni griglia viene compilata UNA volta in una tabella di partite:
+#   Competizione, File, Tipo ("Campionato" / "Coppa")
+#   Giornata (etichetta del foglio, es. "1ª Giornata lega"), N_Giornata
+#   Serie_A (giornata di Serie A collegata, 0 se manca)
+#   Girone ("" nei campionati), Casa, Fuori
+#   Punti_Casa, Punti_Fuori (fantapunti, NaN se mancano), Risultato ("4-2", "-")
+#   Giocata (risultato presente), Riposa (Casa è la squadra a riposo, Fuori "")
+#
+# Layout delle griglie (c = colonna dell'intestazione del blocco):
+#   campionati  Casa c, punti c+1 e c+2, Fuori c+3, risultato c+4
+#   coppe       Girone c, Casa c+1, punti c+2 e c+3, Fuori c+4, risultato c+5
+# La giornata di Serie A sta in c+2 (campionati) o c+3 (coppe) nella riga
+# d'intestazione, ed è così che si riconosce il layout.
+#
+# La tabella è legata all'impronta del contenuto del file: in memoria finché
+# dimensione e data di modifica non cambiano, su disco (Feather in
+# .cache_lfm/calendari/) tra un riavvio e l'altro. Scegliere una giornata è
+# poi un filtro sull'indice delle giornate.
+
+PREFISSO_CALENDARI = "Calendario_"
+CARTELLA_CALENDARI = os.path.join(CARTELLA_CACHE, "calendari")
+COLONNE_PARTITE = [
+    "Competizione", "File", "Tipo", "Giornata", "N_Giornata", "Serie_A", "Girone",
+    "Casa", "Fuori", "Punti_Casa", "Punti_Fuori", "Risultato", "Giocata", "Riposa",
+]
+
+# Cambia quando cambia il modo di compilare: invalida le tabelle su disco
+_FORMATO = "calendari-1"
+
+_calendari = {}
+_lock_calendari = threading.Lock()
+_MAX_CALENDARI = 16
+_MAX_SU_DISCO = 32
+
+
+def nome_competizione(path):
+    """'Calendario_SERIE-A.csv' -> 'SERIE A'."""
+    return os.path.basename(path).replace(PREFISSO_CALENDARI, "").replace(".csv", "").replace("-", " ")
+
+
+def file_calendari(cartella="."):
+    return sorted(glob.glob(os.path.join(cartella, f"{PREFISSO_CALENDARI}*.csv")))
+
+
+def _numero(serie):
+    return pd.to_numeric(serie.str.extract(r"(\d+)", expand=False), errors="coerce").fillna(0).astype(np.int16)
+
+
+def _punti(serie):
+    return pd.to_numeric(serie.str.replace(",", ".").str.replace('"', ""), errors="coerce")
+
+
+def _colonna(testo, c):
+    return testo[c] if c in testo.columns else pd.Series("", index=testo.index, dtype=object)
+
+
+def compila_griglia(df_griglia, competizione="", nome_file=""):
+    """Tabella delle partite (COLONNE_PARTITE) da una griglia letta con
+    header=None. Le righe prima della prima intestazione (titoli, link) e
+    quelle senza entrambe le squadre vengono scartate."""
+    testo = df_griglia.astype(object).where(df_griglia.notna(), "").astype(str).apply(lambda c: c.str.strip())
+    testo.columns = range(testo.shape[1])
+    minuscolo = testo.apply(lambda c: c.str.lower())
+    intestazioni = testo.apply(lambda c: c.str.contains("Giornata")) & ~minuscolo.apply(lambda c: c.str.contains("serie a"))
+
+    blocchi = []
+    for c in [c for c in testo.columns if intestazioni[c].any()]:
+        righe_int = intestazioni[c]
+        coppa = minuscolo.loc[righe_int, c + 3].str.contains("serie a").any() if c + 3 in testo.columns else False
+        o = 1 if coppa else 0
+        giornata = testo[c].where(righe_int).ffill()
+        blocco = pd.DataFrame({
+            "Giornata": giornata,
+            "Serie_A": _colonna(testo, c + 2 + o).where(righe_int).ffill().fillna(""),
+            "Girone": testo[c] if coppa else "",
+            "Casa": _colonna(testo, c + o),
+            "Fuori": _colonna(testo, c + o + 3),
+            "Punti_Casa": _colonna(testo, c + o + 1),
+            "Punti_Fuori": _colonna(testo, c + o + 2),
+            "Risultato": _colonna(testo, c + o + 4),
+        })
+        blocco["Tipo"] = "Coppa" if coppa else "Campionato"
+
+        # "Riposa" può stare nella colonna del girone o in quella di casa
+        riposa = blocco["Casa"].str.contains("Riposa") | blocco["Girone"].str.contains("Riposa")
+        chi_riposa = blocco["Casa"].where(blocco["Casa"].str.contains("Riposa"), blocco["Girone"])
+        blocco.loc[riposa, "Casa"] = chi_riposa[riposa].str.replace("Riposa", "").str.strip()
+        blocco.loc[riposa, ["Fuori", "Punti_Casa", "Punti_Fuori", "Risultato"]] = ""
+        blocco.loc[riposa & blocco["Girone"].str.contains("Riposa"), "Girone"] = ""
+        blocco["Riposa"] = riposa
+
+        valide = giornata.notna() & ~righe_int & (riposa | ((blocco["Casa"] != "") & (blocco["Fuori"] != "")))
+        blocchi.append(blocco[valide & (blocco["Casa"] != "")])
+
+    if not blocchi:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_PARTITE})
+
+    partite = pd.concat(blocchi, ignore_index=True)
+    partite["Competizione"] = competizione
+    partite["File"] = nome_file
+    partite["N_Giornata"] = _numero(partite["Giornata"])
+    partite["Serie_A"] = _numero(partite["Serie_A"])
+    partite["Punti_Casa"] = _punti(partite["Punti_Casa"])
+    partite["Punti_Fuori"] = _punti(partite["Punti_Fuori"])
+    partite["Giocata"] = partite["Risultato"].str.fullmatch(r"\d+\s*-\s*\d+")
+    partite = partite.sort_values("N_Giornata", kind="stable", ignore_index=True)
+    return partite[COLONNE_PARTITE]
+
+
+class Calendario:
+    """Partite di una competizione con l'indice delle giornate: la scelta
+    di una giornata è un take sulle righe già raggruppate."""
+
+    def __init__(self, partite, impronta=None):
+        self.partite = partite
+        self.impronta = impronta
+        self.competizione = partite["Competizione"].iloc[0] if len(partite) else ""
+        self._righe = partite.groupby("Giornata", sort=False).indices
+        self._giornate = list(
+            partite.drop_duplicates("Giornata").sort_values(["N_Giornata", "Giornata"], kind="stable")["Giornata"]
+        )
+
+    def __len__(self):
+        return len(self.partite)
+
+    def giornate(self):
+        """Etichette delle giornate in ordine numerico."""
+        return list(self._giornate)
+
+    def giornata(self, etichetta):
+        """Partite (e riposi) della giornata, nell'ordine del foglio."""
+        righe = self._righe.get(etichetta)
+        if righe is None:
+            return self.partite.iloc[0:0]
+        return self.partite.take(righe)
+
+
+def _percorso_su_disco(impronta):
+    return os.path.join(CARTELLA_CALENDARI, f"{impronta}.feather")
+
+
+def _carica_da_disco(impronta):
+    percorso = _percorso_su_disco(impronta)
+    if not os.path.exists(percorso):
+        return None
+    try:
+        return feather.read_table(percorso, memory_map=True).to_pandas()
+    except Exception:
+        return None
+
+
+def _salva_su_disco(impronta, partite):
+    percorso = _percorso_su_disco(impronta)
+    tmp = f"{percorso}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CARTELLA_CALENDARI, exist_ok=True)
+        partite.reset_index(drop=True).to_feather(tmp, compression="uncompressed")
+        os.replace(tmp, percorso)
+        voci = [os.path.join(CARTELLA_CALENDARI, v) for v in os.listdir(CARTELLA_CALENDARI) if v.endswith(".feather")]
+        voci.sort(key=os.path.getmtime, reverse=True)
+        for vecchia in voci[_MAX_SU_DISCO:]:
+            os.remove(vecchia)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def compila_calendario(path):
+    """Calendario compilato di un Calendario_*.csv. Si ricompila solo se il
+    contenuto del file cambia; FileNotFoundError se il file non esiste."""
+    firma = firma_file(path)
+    if firma is None:
+        raise FileNotFoundError(path)
+    chiave = (os.path.abspath(path), firma)
+    with _lock_calendari:
+        calendario = _calendari.get(chiave)
+    if calendario is not None:
+        return calendario
+
+    impronta = impronta_contenuto([path], extra=(_FORMATO,))
+    partite = _carica_da_disco(impronta)
+    if partite is None:
+        griglia = leggi_csv(path, header=None, dtype=str)
+        partite = compila_griglia(griglia, nome_competizione(path), os.path.basename(path))
+        _salva_su_disco(impronta, partite)
+    calendario = Calendario(partite, impronta)
+    with _lock_calendari:
+        _calendari[chiave] = calendario
+        while len(_calendari) > _MAX_CALENDARI:
+            _calendari.pop(next(iter(_calendari)))
+    return calendario
+
+
+def calendari_cartella(cartella="."):
+    """Calendario compilato di ogni Calendario_*.csv della cartella (i file
+    illeggibili vengono saltati)."""
+    calendari = []
+    for path in file_calendari(cartella):
+        try:
+            calendari.append(compila_calendario(path))
+        except Exception:
+            continue
+    return calendari
+
+
+def calendari_compilati(cartella="."):
+    """Tutte le partite di tutti i Calendario_*.csv della cartella in una
+    sola tabella."""
+    tabelle = [c.partite for c in calendari_cartella(cartella) if len(c)]
+    if not tabelle:
+        return compila_griglia(pd.DataFrame())
+    return pd.concat(tabelle, ignore_index=True)
@@ -0,0 +1,315 @@
+"""Prova di carico del portale clausole, senza GitHub.
+
+Simula l'apertura del mercato delle 22:00: N manager che nello stesso istante
+pagano clausole, poi i controriscatti (ognuno premuto due volte, come un
+doppio click) e infine il salvataggio delle bozze di blindaggio. Tutto gira
+su una copia locale dei CSV (ArchivioLocale, con latenza simulata delle
+chiamate API, oppure ArchivioSqlite), usando le stesse transazioni del
+portale (operazioni_clausole.py).
+
+Alla fine stampa latenze p50/p95/p99 per operazione, tentativi ripetuti,
+tasso di conflitti e l'esito dei controlli di coerenza dello stato finale.
+Esce con codice 1 se un controllo fallisce.
+
+    python carico_mercato.py --manager 40 --latenza-ms 150
+    python carico_mercato.py --modo diretto       # senza coda, come prima
+    python carico_mercato.py --sqlite
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from archivio import ArchivioLocale
+from coda_transazioni import CodaTransazioni
+from operazioni_clausole import (
+    LIMITE_CLAUSOLE_PAGATE, conta_pagate_in,
+    transazione_clausola_singola, transazione_controriscatto, transazione_trasferimento,
+)
+from registro_clausole import IndiceClausole, leggi_clausole
+from registro_crediti import REGISTRO, SALDI, TIPI, ricostruisci_saldi
+
+ROSTER = "fantamanager-2021-rosters.csv"
+RICHIESTE = "richieste_scippo.csv"
+
+
+def percentile(valori, p):
+    if not valori:
+        return 0.0
+    ordinati = sorted(valori)
+    return ordinati[min(len(ordinati) - 1, max(0, math.ceil(p / 100 * len(ordinati)) - 1))]
+
+
+class Simulazione:
+    def __init__(self, archivio, modo="coda"):
+        self.archivio = archivio
+        self.coda = CodaTransazioni(archivio) if modo == "coda" else None
+        self.misure = []  # (operazione, latenza_s, tentativi, esito)
+        self._lock = threading.Lock()
+
+    def esegui(self, operazione, funzione, msg, in_coda=True):
+        """Esegue una transazione come farebbe il portale (dalla coda, se
+        attiva e se il portale la usa per questa operazione) e ne misura
+        latenza e tentativi. Esito: 'ok', 'rifiutata' (controllo non
+        superato) o 'errore'."""
+        tentativi = [0]
+
+        def misurata(tx):
+            tentativi[0] += 1
+            return funzione(tx)
+
+        inizio = time.perf_counter()
+        try:
+            if self.coda and in_coda:
+                valore = self.coda.esegui(misurata, msg)
+            else:
+                valore = self.archivio.transazione(misurata, msg)
+            esito = "rifiutata" if isinstance(valore, tuple) and valore[0] is False else "ok"
+        except Exception:
+            esito = "errore"
+        with self._lock:
+            self.misure.append((operazione, time.perf_counter() - inizio, tentativi[0], esito))
+        return esito
+
+    def in_parallelo(self, compiti):
+        """Lancia i compiti (funzioni senza argomenti) tutti nello stesso istante."""
+        barriera = threading.Barrier(len(compiti))
+
+        def avvia(compito):
+            barriera.wait()
+            compito()
+
+        thread = [threading.Thread(target=avvia, args=(c,)) for c in compiti]
+        for t in thread:
+            t.start()
+        for t in thread:
+            t.join()
+
+    def report(self):
+        righe = []
+        for operazione in dict.fromkeys(m[0] for m in self.misure):
+            misure = [m for m in self.misure if m[0] == operazione]
+            latenze = [m[1] * 1000 for m in misure]
+            righe.append({
+                "Operazione": operazione,
+                "N": len(misure),
+                "Ok": sum(m[3] == "ok" for m in misure),
+                "Rifiutate": sum(m[3] == "rifiutata" for m in misure),
+                "Errori": sum(m[3] == "errore" for m in misure),
+                "p50 ms": round(percentile(latenze, 50)),
+                "p95 ms": round(percentile(latenze, 95)),
+                "p99 ms": round(percentile(latenze, 99)),
+                "Tentativi ripetuti": sum(max(0, m[2] - 1) for m in misure),
+            })
+        return pd.DataFrame(righe)
+
+
+def scegli_manager(df_leghe, quanti):
+    """Fino a 'quanti' squadre, pescate a turno da ogni lega."""
+    per_lega = [list(g['Squadra']) for _, g in df_leghe.groupby('Lega', sort=False)]
+    scelte = []
+    while len(scelte) < quanti and any(per_lega):
+        for squadre in per_lega:
+            if squadre and len(scelte) < quanti:
+                scelte.append(squadre.pop(0))
+    return scelte
+
+
+def lega_di(df_leghe, squadra):
+    return df_leghe.loc[df_leghe['Squadra'] == squadra, 'Lega'].iloc[0]
+
+
+def controlli_coerenza(archivio, iniziale, sim, bozze):
+    """Controlli sullo stato finale: (descrizione, superato)."""
+    leghe = archivio.leggi_csv("leghe.csv")
+    saldi = archivio.leggi_csv(SALDI)
+    registro = archivio.leggi_csv(REGISTRO)
+    roster = archivio.leggi_csv(ROSTER)
+    richieste = archivio.leggi_csv(RICHIESTE)
+    nuove = richieste.iloc[len(iniziale["richieste"]):]
+    controlli = []
+
+    crediti = leghe.set_index('Squadra')['Crediti'].astype(int)
+    vista = saldi.set_index('Squadra')
+    controlli.append(("Saldi = crediti di leghe.csv per ogni squadra",
+                      bool((vista['Saldo'].astype(int).reindex(crediti.index) == crediti).all())))
+    controlli.append(("Saldo = iniziale + movimenti per ogni squadra",
+                      bool((vista['Iniziale'] + vista[list(TIPI.values())].sum(axis=1) == vista['Saldo']).all())))
+
+    movimenti_run = registro.iloc[iniziale["registro"]:]['Importo'].astype(int).sum()
+    controlli.append(("Variazione dei crediti totali = somma dei movimenti registrati",
+                      int(crediti.sum()) - iniziale["crediti"] == int(movimenti_run)))
+
+    penali = sum(int(c) - math.ceil(float(c) * 1.10)
+                 for c in nuove[nuove['Stato'] == 'CONTRORISCATTATO']['Costo'])
+    controlli.append(("Crediti persi = sole penali dei controriscatti",
+                      int(crediti.sum()) - iniziale["crediti"] == penali))
+
+    ok = {op: sum(1 for m in sim.misure if m[0] == op and m[3] == "ok") for op in ("Pagamento", "Controriscatto")}
+    controlli.append(("Un log per ogni pagamento riuscito", len(nuove) == ok["Pagamento"]))
+    controlli.append(("Un solo controriscatto riuscito per pagamento",
+                      int((nuove['Stato'] == 'CONTRORISCATTATO').sum()) == ok["Controriscatto"]))
+
+    controlli.append(("Nessuna riga del roster persa o duplicata", len(roster) == iniziale["roster"]))
+    # Lo stesso Id compare in più leghe: si controlla la coppia (Id, squadra)
+    presenti = set(zip(roster['Id'].astype(str), roster['Squadra_LFM']))
+    attesi, precedenti = {}, {}
+    for _, r in nuove.iterrows():
+        riscattato = r['Stato'] == 'CONTRORISCATTATO'
+        chiave = (str(r['Id']), lega_di(leghe, r['Acquirente']))
+        attesi[chiave] = r['Proprietario'] if riscattato else r['Acquirente']
+        precedenti[chiave] = r['Acquirente'] if riscattato else r['Proprietario']
+    controlli.append(("Proprietario nel roster = ultimo movimento registrato",
+                      all((pid, attesi[k]) in presenti and (pid, precedenti[k]) not in presenti
+                          for k in attesi for pid in [k[0]])))
+
+    controlli.append((f"Nessuna squadra oltre il limite di {LIMITE_CLAUSOLE_PAGATE} clausole",
+                      all(conta_pagate_in(richieste, sq) <= max(LIMITE_CLAUSOLE_PAGATE, conta_pagate_in(iniziale["richieste"], sq))
+                          for sq in leghe['Squadra'])))
+
+    clausole = IndiceClausole(leggi_clausole(archivio))
+    controlli.append(("Bozza di ogni squadra = uno dei salvataggi riusciti",
+                      all(clausole.clausole_di(sq) in valori for sq, valori in bozze.items())))
+    controlli.append(("Versione della bozza = salvataggi riusciti",
+                      all(clausole.versione_di(sq) == iniziale["bozze"].versione_di(sq) + len(valori)
+                          for sq, valori in bozze.items())))
+    controlli.append(("Bozze delle altre squadre intatte",
+                      all(clausole.clausole_di(sq) == iniziale["bozze"].clausole_di(sq)
+                          for sq in iniziale["bozze"].squadre() if sq not in bozze)))
+    return controlli
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prova di carico del mercato clausole su un archivio locale.")
+    parser.add_argument("--manager", type=int, default=40, help="manager simulati (default 40)")
+    parser.add_argument("--pagamenti", type=int, default=2, help="clausole che ogni manager prova a pagare")
+    parser.add_argument("--contesa", type=float, default=0.3,
+                        help="quota di pagamenti sul giocatore più conteso della lega (default 0.3)")
+    parser.add_argument("--latenza-ms", type=float, default=100, help="latenza simulata per chiamata API")
+    parser.add_argument("--variazione-ms", type=float, default=50, help="variazione casuale della latenza")
+    parser.add_argument("--modo", choices=["coda", "diretto"], default="coda",
+                        help="coda a scrittore unico (come il portale) o transazioni dirette")
+    parser.add_argument("--sqlite", action="store_true", help="usa ArchivioSqlite invece dell'archivio locale")
+    parser.add_argument("--sorgente", default=".", help="cartella con i CSV di partenza")
+    parser.add_argument("--cartella", default=None, help="cartella di lavoro (default: temporanea)")
+    parser.add_argument("--seme", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seme)
+    cartella = args.cartella or tempfile.mkdtemp(prefix="carico_lfm_")
+    if args.sqlite:
+        from archivio_sqlite import ArchivioSqlite
+        archivio = ArchivioSqlite(os.path.join(cartella, "lfm.sqlite"), sorgente=args.sorgente)
+    else:
+        archivio = ArchivioLocale(cartella, latenza=args.latenza_ms / 1000,
+                                  variazione=args.variazione_ms / 1000, sorgente=args.sorgente)
+
+    df_leghe = archivio.leggi_csv("leghe.csv")
+    df_roster = archivio.leggi_csv(ROSTER)
+    df_roster = df_roster[pd.to_numeric(df_roster['Id'], errors='coerce').notna()]
+    lega_di = dict(zip(df_leghe['Squadra'], df_leghe['Lega']))
+    manager = scegli_manager(df_leghe, args.manager)
+
+    # Il primo movimento crea la vista dei saldi: la si crea prima del
+    # cronometro, così non pesa sul primo pagamento misurato
+    def crea_registro(tx):
+        if not tx.esiste(SALDI):
+            registro, saldi = ricostruisci_saldi(tx.leggi_csv)
+            tx.scrivi_csv(REGISTRO, registro)
+            tx.scrivi_csv(SALDI, saldi)
+    archivio.transazione(crea_registro, "Creazione registro crediti")
+
+    bozze_iniziali = IndiceClausole(leggi_clausole(archivio))
+    iniziale = {
+        "crediti": int(archivio.leggi_csv("leghe.csv")['Crediti'].astype(int).sum()),
+        "registro": len(archivio.leggi_csv(REGISTRO)),
+        "roster": len(archivio.leggi_csv(ROSTER)),
+        "richieste": archivio.leggi_csv(RICHIESTE),
+        "bozze": bozze_iniziali,
+    }
+
+    # Giocatori delle altre squadre della stessa lega, e il più conteso per lega
+    candidati = {}
+    for sq in manager:
+        rivali = [s for s, l in lega_di.items() if l == lega_di[sq] and s != sq]
+        candidati[sq] = df_roster[df_roster['Squadra_LFM'].isin(rivali)][['Squadra_LFM', 'Id']].values.tolist()
+    conteso = {l: random.choice(candidati[sq]) for sq, l in ((sq, lega_di[sq]) for sq in manager) if candidati[sq]}
+
+    sim = Simulazione(archivio, args.modo)
+    pagati = []
+    ora = datetime.now()
+
+    def manager_paga(sq):
+        def compito():
+            for _ in range(args.pagamenti):
+                if not candidati[sq]:
+                    return
+                proprietario, pid = conteso[lega_di[sq]] if random.random() < args.contesa else random.choice(candidati[sq])
+                if proprietario == sq:
+                    continue
+                costo = random.randint(20, 120)
+                nome = f"Giocatore {pid}"
+                orario = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                esito = sim.esegui("Pagamento", transazione_trasferimento(
+                    sq, proprietario, proprietario, pid, nome, costo, orario), f"Clausola Rescissoria (auto): {nome}")
+                if esito == "ok":
+                    with sim._lock:
+                        pagati.append((proprietario, sq, pid, nome, costo))
+        return compito
+
+    inizio = time.perf_counter()
+    sim.in_parallelo([manager_paga(sq) for sq in manager])
+
+    # Ogni controriscatto premuto due volte: deve riuscirne al più uno
+    def controriscatto(proprietario, acquirente, pid, nome, costo):
+        return lambda: sim.esegui("Controriscatto", transazione_controriscatto(
+            proprietario, acquirente, acquirente, pid, nome, costo, ora), f"Controriscatto: {nome} torna a {proprietario}")
+    richiesti = pagati[::2]
+    if richiesti:
+        sim.in_parallelo([controriscatto(*p) for p in richiesti for _ in range(2)])
+
+    # Bozze di blindaggio: ogni manager salva due volte con valori diversi
+    bozze = {}
+
+    def salva_bozza(sq, dati):
+        def compito():
+            if sim.esegui("Bozza blindaggio", transazione_clausola_singola(sq, dati), f"Update {sq}") == "ok":
+                with sim._lock:
+                    bozze.setdefault(sq, []).append(dati)
+        return compito
+    compiti = []
+    for sq in manager:
+        for _ in range(2):
+            giocatori = random.sample(candidati[sq], min(3, len(candidati[sq])))
+            dati = [(str(pid), f"Giocatore {pid}", random.randint(10, 400)) for _, pid in giocatori]
+            compiti.append(salva_bozza(sq, dati))
+    sim.in_parallelo(compiti)
+    durata = time.perf_counter() - inizio
+
+    stat = archivio.statistiche
+    tentativi = stat['commit'] + stat['conflitti']
+    # La latenza viene iniettata solo nell'archivio locale
+    latenza = "" if args.sqlite else f" · latenza {args.latenza_ms:.0f}±{args.variazione_ms:.0f} ms"
+    print(f"\nArchivio: {'SQLite' if args.sqlite else 'locale'} in {cartella} · modo: {args.modo} · "
+          f"{len(manager)} manager{latenza}\n")
+    print(sim.report().to_string(index=False))
+    print(f"\nOperazioni: {len(sim.misure)} in {durata:.1f} s ({len(sim.misure) / durata:.1f}/s) · "
+          f"commit: {stat['commit']} · conflitti: {stat['conflitti']} "
+          f"({stat['conflitti'] / tentativi:.0%} dei tentativi di commit)" if tentativi else "")
+
+    print("\nCoerenza dello stato finale:")
+    controlli = controlli_coerenza(archivio, iniziale, sim, bozze)
+    for descrizione, superato in controlli:
+        print(f"  {'✅' if superato else '❌'} {descrizione}")
+    return 0 if all(s for _, s in controlli) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
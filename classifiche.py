@@ -0,0 +1,178 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from calendari import calendari_cartella
+
+# --- CLASSIFICHE ---
+# Classifiche di campionati e gironi di coppa dai risultati nei calendari
+# compilati (calendari.py): vittorie, pareggi e sconfitte dal risultato
+# ("2-3"), fantapunti fatti e subiti, forma recente e scontri diretti.
+#
+# Il motore lavora per giornata: ogni giornata giocata viene trasformata in
+# esiti (una riga per squadra) e sommata ai totali una volta sola. A ogni
+# aggiornamento dei calendari si confronta l'impronta delle partite di ogni
+# giornata con quella già vista: solo le giornate nuove o corrette vengono
+# rielaborate (i loro vecchi esiti tolti dai totali, i nuovi aggiunti),
+# invece di rifare la stagione intera.
+#
+# Ordinamento: punti, poi fantapunti fatti, differenza reti, gol fatti.
+
+COLONNE_ESITI = [
+    "Competizione", "Tipo", "Girone", "Giornata", "N_Giornata", "Squadra", "Avversario", "Campo",
+    "G", "V", "N", "P", "GF", "GS", "PF", "PS", "Pt", "Esito",
+]
+CONTATORI = ["G", "V", "N", "P", "GF", "GS", "PF", "PS", "Pt"]
+CHIAVE_CLASSIFICA = ["Competizione", "Tipo", "Girone", "Squadra"]
+PARTITE_FORMA = 5
+
+# Colonne delle partite che decidono gli esiti: se non cambiano, la giornata
+# non va rielaborata
+_COLONNE_FIRMA = ["Competizione", "Giornata", "Girone", "Casa", "Fuori", "Punti_Casa", "Punti_Fuori", "Risultato"]
+
+
+def esiti_partite(partite):
+    """Esiti delle partite giocate (riposi esclusi): due righe per partita,
+    una per squadra, con gol, fantapunti e punti in classifica."""
+    giocate = partite[partite["Giocata"].astype(bool) & ~partite["Riposa"].astype(bool)]
+    if giocate.empty:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_ESITI})
+    gol = giocate["Risultato"].str.extract(r"(\d+)\s*-\s*(\d+)").astype(np.int16)
+    comuni = giocate[["Competizione", "Tipo", "Girone", "Giornata", "N_Giornata"]]
+    in_casa = comuni.assign(
+        Squadra=giocate["Casa"], Avversario=giocate["Fuori"], Campo="Casa",
+        GF=gol[0], GS=gol[1], PF=giocate["Punti_Casa"], PS=giocate["Punti_Fuori"],
+    )
+    fuori = comuni.assign(
+        Squadra=giocate["Fuori"], Avversario=giocate["Casa"], Campo="Fuori",
+        GF=gol[1], GS=gol[0], PF=giocate["Punti_Fuori"], PS=giocate["Punti_Casa"],
+    )
+    esiti = pd.concat([in_casa, fuori], ignore_index=True)
+    esiti["G"] = 1
+    esiti["V"] = (esiti["GF"] > esiti["GS"]).astype(int)
+    esiti["N"] = (esiti["GF"] == esiti["GS"]).astype(int)
+    esiti["P"] = (esiti["GF"] < esiti["GS"]).astype(int)
+    esiti["Pt"] = 3 * esiti["V"] + esiti["N"]
+    esiti["PF"] = esiti["PF"].fillna(0.0)
+    esiti["PS"] = esiti["PS"].fillna(0.0)
+    esiti["Esito"] = np.select([esiti["V"] == 1, esiti["N"] == 1], ["V", "N"], "P")
+    return esiti[COLONNE_ESITI]
+
+
+def _somma(esiti):
+    return esiti.groupby(CHIAVE_CLASSIFICA)[CONTATORI].sum()
+
+
+def ordina_classifica(totali):
+    """Totali per squadra ordinati, con DR e posizione (per girone)."""
+    tabella = totali.reset_index() if "Squadra" not in totali.columns else totali.copy()
+    tabella["DR"] = tabella["GF"] - tabella["GS"]
+    tabella = tabella.sort_values(
+        ["Competizione", "Girone", "Pt", "PF", "DR", "GF", "Squadra"],
+        ascending=[True, True, False, False, False, False, True], ignore_index=True,
+    )
+    tabella.insert(0, "Pos", tabella.groupby(["Competizione", "Girone"]).cumcount() + 1)
+    return tabella
+
+
+class MotoreClassifiche:
+    """Totali di classifica aggiornati per giornata (vedi aggiorna)."""
+
+    def __init__(self):
+        self._giornate = {}  # (competizione, giornata) -> (firma, esiti)
+        self.totali = pd.DataFrame(columns=CONTATORI, index=pd.MultiIndex.from_tuples([], names=CHIAVE_CLASSIFICA))
+        self.esiti = esiti_partite(pd.DataFrame(columns=_COLONNE_FIRMA + ["Tipo", "N_Giornata", "Giocata", "Riposa"]))
+        self.rielaborate = 0
+
+    def aggiorna(self, partite):
+        """Allinea i totali alle partite date (tutte le competizioni).
+        Rielabora solo le giornate con partite nuove o cambiate e toglie
+        quelle sparite; restituisce il numero di giornate rielaborate."""
+        giocate = partite[partite["Giocata"].astype(bool) & ~partite["Riposa"].astype(bool)]
+        chiavi = list(zip(giocate["Competizione"], giocate["Giornata"]))
+        hash_righe = pd.util.hash_pandas_object(giocate[_COLONNE_FIRMA], index=False)
+        firme = hash_righe.groupby([giocate["Competizione"], giocate["Giornata"]]).agg(["sum", "size"])
+        firme = {k: tuple(v) for k, v in zip(firme.index, firme.itertuples(index=False))}
+
+        cambiate = [k for k, f in firme.items() if self._giornate.get(k, (None,))[0] != f]
+        sparite = [k for k in self._giornate if k not in firme]
+        if not cambiate and not sparite:
+            self.rielaborate = 0
+            return 0
+
+        vecchi = [self._giornate.pop(k)[1] for k in cambiate + sparite if k in self._giornate]
+        nuovi = pd.Series(chiavi, index=giocate.index).isin(set(cambiate))
+        esiti_nuovi = esiti_partite(giocate[nuovi])
+        for k, esiti_g in esiti_nuovi.groupby(["Competizione", "Giornata"], sort=False):
+            self._giornate[k] = (firme[k], esiti_g)
+
+        totali = self.totali
+        if vecchi:
+            totali = totali.sub(_somma(pd.concat(vecchi)), fill_value=0)
+        if not esiti_nuovi.empty:
+            totali = totali.add(_somma(esiti_nuovi), fill_value=0)
+        self.totali = totali[totali["G"] > 0].astype({c: float if c in ("PF", "PS") else int for c in CONTATORI})
+        self.esiti = pd.concat([e for _, e in self._giornate.values()], ignore_index=True) if self._giornate else esiti_nuovi
+        self.esiti = self.esiti.sort_values(["Competizione", "N_Giornata"], kind="stable", ignore_index=True)
+        self.rielaborate = len(cambiate)
+        return self.rielaborate
+
+    def competizioni(self, tipo=None):
+        totali = self.totali.reset_index()
+        if tipo:
+            totali = totali[totali["Tipo"] == tipo]
+        return sorted(totali["Competizione"].unique())
+
+    def classifica(self, competizione=None, girone=None):
+        """Classifica (tutte le competizioni se None) con la forma recente."""
+        tabella = ordina_classifica(self.totali)
+        if competizione is not None:
+            tabella = tabella[tabella["Competizione"] == competizione]
+        if girone is not None:
+            tabella = tabella[tabella["Girone"] == girone]
+        forma = self.forma()
+        tabella = tabella.assign(Forma=[forma.get((c, s), "") for c, s in zip(tabella["Competizione"], tabella["Squadra"])])
+        return tabella.reset_index(drop=True)
+
+    def forma(self, partite=PARTITE_FORMA):
+        """(competizione, squadra) -> ultimi esiti, dal più vecchio (es. "VNPVV")."""
+        ultimi = self.esiti.groupby(["Competizione", "Squadra"], sort=False).tail(partite)
+        return ultimi.groupby(["Competizione", "Squadra"], sort=False)["Esito"].agg("".join).to_dict()
+
+    def scontri_diretti(self, competizione, squadra=None):
+        """Bilancio di ogni coppia di squadre nella competizione (o solo di
+        'squadra' contro ognuna delle altre)."""
+        esiti = self.esiti[self.esiti["Competizione"] == competizione]
+        if squadra is not None:
+            esiti = esiti[esiti["Squadra"] == squadra]
+        tabella = esiti.groupby(["Squadra", "Avversario"])[CONTATORI].sum().reset_index()
+        tabella["DR"] = tabella["GF"] - tabella["GS"]
+        return tabella
+
+    def posizioni(self, tipo="Campionato"):
+        """Nome squadra (senza spazi, maiuscolo) -> posizione nella sua
+        classifica di campionato."""
+        tabella = ordina_classifica(self.totali)
+        tabella = tabella[tabella["Tipo"] == tipo]
+        return dict(zip(tabella["Squadra"].str.strip().str.upper(), tabella["Pos"]))
+
+
+_motori = {}
+_versioni = {}
+_lock_motori = threading.Lock()
+
+
+def classifiche(cartella="."):
+    """Motore delle classifiche per i calendari della cartella, condiviso e
+    aggiornato in modo incrementale quando un calendario cambia."""
+    calendari = [c for c in calendari_cartella(cartella) if len(c)]
+    versione = tuple(c.impronta for c in calendari)
+    with _lock_motori:
+        motore = _motori.setdefault(cartella, MotoreClassifiche())
+        if _versioni.get(cartella) != versione:
+            partite = pd.concat([c.partite for c in calendari], ignore_index=True) if calendari else None
+            if partite is not None:
+                motore.aggiorna(partite)
+            _versioni[cartella] = versione
+    return motore
@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
 from github import Github
-from github import GithubException
-from io import StringIO
 import math
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -14,8 +12,22 @@ def ora_italiana():
     ogni scadenza sarebbe sfasata di 1-2 ore (a seconda dell'ora legale)
     rispetto all'orario italiano reale."""
     return datetime.now(ZoneInfo("Europe/Rome")).replace(tzinfo=None)
-import time
 import re
+from archivio import ArchivioGithub, archivio_da_ambiente, statistiche_richieste
+from budget_rivali import budget_rivali
+from buffer_log import BufferLog
+from coda_transazioni import ERRORE, FATTO, CodaTransazioni
+from indice_stadi import indice_stadi
+from libro_clausole import libro_clausole
+from modello_lega import modello_da_tabelle
+from operazioni_clausole import (
+    INTESTAZIONE_RICHIESTE, LIMITE_CLAUSOLE_PAGATE, chiave_richiesta, conta_pagate_in, parse_orario_pagamento,
+    transazione_approvazione, transazione_clausola_singola, transazione_controriscatto, transazione_trasferimento,
+)
+from registro_clausole import CLAUSOLE, CLAUSOLE_SEGRETE, indice_clausole
+from registro_crediti import registra_movimento
+from registro_nomi import RegistroNomi, pulisci_nome, registro_nomi
+from scanner_clausole import scanner_clausole
 
 # --- 1. CONFIGURAZIONE ---
 FORZA_MODALITA = False  # False = Terminale Blindaggi | True = Mercato
@@ -35,41 +47,35 @@ MERCATO_PAGABILE = FORZA_MODALITA or (ora_italiana() >= APERTURA_MERCATO)
 
 ADMIN_SQUADRE = ["Liverpool Football Club", "Villarreal", "Reggina Calcio 1914", "Siviglia"]
 
-try:
-    TOKEN = st.secrets["GITHUB_TOKEN"]
-    REPO_NAME = st.secrets["REPO_NAME"]
-    g = Github(TOKEN)
-    repo = g.get_repo(REPO_NAME)
-except:
-    st.error("Errore configurazione GitHub nei Secrets.")
-    st.stop()
+# Archivio dei CSV: il repository GitHub dei Secrets, oppure l'archivio
+# locale/SQLite indicato dalle variabili d'ambiente (vedi archivio_da_ambiente)
+archivio = archivio_da_ambiente()
+if archivio is None:
+    try:
+        TOKEN = st.secrets["GITHUB_TOKEN"]
+        REPO_NAME = st.secrets["REPO_NAME"]
+        g = Github(TOKEN)
+        archivio = ArchivioGithub(g.get_repo(REPO_NAME))
+    except:
+        st.error("Errore configurazione GitHub nei Secrets.")
+        st.stop()
 
-# --- 2. FUNZIONI UTILITY ---
-def pulisci_nome(nome):
-    """Pulisce il nome rimuovendo TUTTO ciò che non è una lettera all'inizio"""
-    if not nome or pd.isna(nome):
-        return ""
-    
-    nome_pulito = str(nome).strip()
-    
-    # Rimuovi tutto fino al primo carattere alfabetico (A-Z o a-z)
-    match = re.search(r'[A-Za-z]', nome_pulito)
-    if match:
-        nome_pulito = nome_pulito[match.start():]
-    
-    # Se il nome inizia con una lettera minuscola, rendila maiuscola
-    if nome_pulito and nome_pulito[0].islower():
-        nome_pulito = nome_pulito[0].upper() + nome_pulito[1:]
-    
-    # Rimuovi spazi multipli
-    nome_pulito = re.sub(r'\s+', ' ', nome_pulito).strip()
-    
-    # Se il nome è vuoto o troppo corto, restituisci l'originale
-    if not nome_pulito or len(nome_pulito) < 2:
-        return str(nome).strip()
-    
-    return nome_pulito
+@st.cache_resource
+def apri_buffer_log():
+    """Buffer write-behind dei log (uno per processo, vedi buffer_log.py)."""
+    return BufferLog(archivio, "clausole")
+
+buffer_log = apri_buffer_log()
+
+@st.cache_resource
+def apri_coda_transazioni():
+    """Coda FIFO a scrittore unico per pagamenti e controriscatti (vedi
+    coda_transazioni.py): una per processo, condivisa da tutte le sessioni."""
+    return CodaTransazioni(archivio)
+
+coda_transazioni = apri_coda_transazioni()
 
+# --- 2. FUNZIONI UTILITY ---
 def get_team_display_name(squadra):
     """Restituisce il nome della squadra pulito per la visualizzazione"""
     return pulisci_nome(squadra)
@@ -78,27 +84,10 @@ def get_team_display_name(squadra):
 @st.cache_data(ttl=300)
 def carica_csv(file_name):
     try:
-        content = repo.get_contents(file_name)
-        return pd.read_csv(StringIO(content.decoded_content.decode("utf-8")))
+        return archivio.leggi_csv(file_name)
     except: 
         return pd.DataFrame()
 
-def salva_file_github(path, df, msg):
-    time.sleep(0.5)
-    csv_buffer = df.to_csv(index=False)
-    try:
-        f = repo.get_contents(path)
-        repo.update_file(path, msg, csv_buffer, f.sha)
-    except GithubException as e:
-        if e.status == 404:
-            repo.create_file(path, msg, csv_buffer)
-        else:
-            st.error(f"Errore salvataggio: {e}")
-            raise
-    except Exception as e:
-        st.error(f"Errore salvataggio: {e}")
-        raise
-
 def aggiorna_csv_con_retry(path, funzione_trasformazione, msg, max_tentativi=5):
     """Applica una trasformazione a un CSV su GitHub in modo sicuro rispetto a
     scritture concorrenti (es. due manager che pagano clausole diverse quasi
@@ -109,151 +98,215 @@ def aggiorna_csv_con_retry(path, funzione_trasformazione, msg, max_tentativi=5):
     appena aggiornato da un'altra (visto con Simeone: pagamento riuscito,
     trasferimento del giocatore perso).
 
-    funzione_trasformazione riceve il DataFrame appena letto e deve restituire
-    il DataFrame modificato. Se la scrittura viene rifiutata da GitHub perché
-    il file è cambiato nel frattempo, si riprova da capo con i dati nuovi
-    invece di sovrascrivere. Solleva un'eccezione se anche dopo max_tentativi
-    non riesce (evento raro, ma va segnalato invece di fallire in silenzio)."""
-    ultimo_errore = None
-    for tentativo in range(max_tentativi):
-        try:
-            contenuto = repo.get_contents(path)
-            df_fresco = pd.read_csv(StringIO(contenuto.decoded_content.decode("utf-8")))
-            sha_corrente = contenuto.sha
-        except GithubException as e:
-            if e.status == 404:
-                df_fresco = pd.DataFrame()
-                sha_corrente = None
-            else:
-                raise
-
-        df_modificato = funzione_trasformazione(df_fresco)
-        csv_buffer = df_modificato.to_csv(index=False)
-
-        try:
-            if sha_corrente is not None:
-                repo.update_file(path, msg, csv_buffer, sha_corrente)
-            else:
-                repo.create_file(path, msg, csv_buffer)
-            return
-        except GithubException as e:
-            ultimo_errore = e
-            if e.status in (409, 422):
-                time.sleep(0.5 + tentativo * 0.5)
-                continue
-            raise
+    È il caso a file singolo di Archivio.transazione (archivio.py): per le
+    operazioni che toccano più file insieme usare direttamente quella, così
+    finiscono tutte nello stesso commit."""
+    def transazione(tx):
+        tx.scrivi_csv(path, funzione_trasformazione(tx.leggi_csv(path)))
 
-    raise Exception(f"Impossibile salvare {path} dopo {max_tentativi} tentativi: {ultimo_errore}")
+    archivio.transazione(transazione, msg, max_tentativi=max_tentativi)
 
-def salva_clausola_singola(squadra, dati_stringa):
-    path = "clausole_segrete.csv"
-    nuova_riga = f"{squadra},{dati_stringa}"
-    try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8")
-        righe = [r for r in contenuto.splitlines() if not r.startswith(f"{squadra},")]
-        righe.append(nuova_riga)
-        repo.update_file(path, f"Update {squadra}", "\n".join(righe), f.sha)
-    except:
-        repo.create_file(path, "Inizializzazione", nuova_riga)
+def salva_clausola_singola(squadra, giocatori):
+    """Sostituisce (o aggiunge) la bozza della squadra, [(id, nome, valore)],
+    nella tabella delle clausole: un upsert sulle sole righe della squadra.
+    Passa dalla coda a scrittore unico come i pagamenti: a ridosso della
+    scadenza salvano tutti insieme, e in transazioni dirette si scontravano
+    sullo stesso commit fino a esaurire i tentativi."""
+    orario = ora_italiana().strftime("%Y-%m-%d %H:%M:%S")
+    coda_transazioni.esegui(transazione_clausola_singola(squadra, giocatori, orario), f"Update {squadra}")
+
+def carica_budget_rivali():
+    """Budget netto dei rivali di ogni squadra (budget_rivali.py), calcolato
+    una volta per crediti e stadi: soglia del Terminale, mercato e admin."""
+    return budget_rivali(df_leghe, stadi)
+
+def carica_libro_clausole():
+    """Libro delle clausole di tutte le leghe (libro_clausole.py), costruito
+    una volta per versione del repository: il mercato fa un lookup per squadra."""
+    return libro_clausole(
+        df_leghe, dati_lega["fantamanager-2021-rosters.csv"], dati_lega["quot.csv"],
+        carica_clausole_salvate(), registro, ("clausole", versione_lega) if versione_lega else None,
+    )
 
 def carica_clausole_salvate():
-    """Legge clausole_segrete.csv e restituisce {squadra: 'id:nome:valore;id:nome:valore'}"""
-    salvati = {}
-    try:
-        f = repo.get_contents("clausole_segrete.csv")
-        for riga in f.decoded_content.decode("utf-8").splitlines():
-            if riga.strip() and "," in riga:
-                s, d = riga.split(",", 1)
-                salvati[s] = d
-    except:
-        pass
-    return salvati
-
-LIMITE_CLAUSOLE_PAGATE = 3
+    """Indice delle bozze salvate (registro_clausole.IndiceClausole) dalla
+    fotografia della lega: costruito una volta per versione del repository
+    e condiviso da barra admin, mercato, Terminale e tasse."""
+    return indice_clausole(dati_lega[CLAUSOLE], dati_lega[CLAUSOLE_SEGRETE], ("clausole", versione_lega) if versione_lega else None)
 
 def conta_clausole_pagate(squadra):
     """Conta quante clausole ha già pagato (con successo) questa squadra, leggendo
     lo storico reale su richieste_scippo.csv invece di fidarsi di un contatore in sessione."""
-    df_sc = carica_csv("richieste_scippo.csv")
-    if df_sc.empty or 'Acquirente' not in df_sc.columns or 'Stato' not in df_sc.columns:
-        return 0
-    mask = (df_sc['Acquirente'] == squadra) & (df_sc['Stato'].astype(str).isin(['APPROVATO', 'APPROVATO_AUTO']))
-    return int(mask.sum())
+    return conta_pagate_in(carica_csv("richieste_scippo.csv"), squadra)
 
 def registra_richiesta_clausola(acquirente, proprietario, player_id, nome, costo):
-    time.sleep(0.5)
-    path = "richieste_scippo.csv"
+    """Accoda una richiesta PENDENTE nel buffer dei log: confermata subito,
+    pubblicata insieme alle altre nel commit successivo del buffer."""
     orario = ora_italiana().strftime("%Y-%m-%d %H:%M:%S")
-    nuova_riga = f"{acquirente},{proprietario},{player_id},{nome},{costo},PENDENTE,{orario}\n"
-    try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8") + nuova_riga
-        repo.update_file(path, f"Clausola Rescissoria: {nome} alle {orario}", contenuto, f.sha)
-    except:
-        header = "Acquirente,Proprietario,Id,Nome,Costo,Stato,Orario\n"
-        repo.create_file(path, "Init Richieste", header + nuova_riga)
+    buffer_log.accoda(
+        "richieste_scippo.csv",
+        [[acquirente, proprietario, player_id, nome, costo, "PENDENTE", orario]],
+        INTESTAZIONE_RICHIESTE,
+    )
 
-def esegui_trasferimento_clausola(acquirente, proprietario, player_id, nome, costo):
+def esegui_trasferimento_clausola(acquirente, proprietario, player_id, nome, costo, attendi=True):
     """Esegue immediatamente lo scambio di crediti e il trasferimento del giocatore,
     senza passare per un'approvazione admin. Registra comunque un log per lo storico.
 
-    ORDINE IMPORTANTE: prima il roster, poi i crediti. Se il trasferimento del
-    giocatore fallisce (già preso da qualcun altro nel frattempo), i crediti
-    non vengono proprio toccati — evita il caso "crediti mossi ma giocatore
-    non trasferito" già capitato con Simeone."""
+    Roster, crediti e log vengono scritti in UN SOLO commit (archivio.transazione):
+    o si muovono tutti e tre o non si muove niente. Niente più il caso
+    "crediti mossi ma giocatore non trasferito" già capitato con Simeone, e un
+    solo giro di chiamate GitHub per pagamento invece di tre commit separati.
+    Limite clausole e proprietario attuale vengono controllati sulla stessa
+    fotografia dei dati che viene poi scritta: se nel frattempo un altro
+    pagamento è passato, il commit viene rifiutato e i controlli rifatti.
+
+    La transazione passa dalla coda a scrittore unico: con attendi=False
+    restituisce subito (None, biglietto) e l'esito si legge poi dalla coda."""
     if not (FORZA_MODALITA or ora_italiana() >= APERTURA_MERCATO):
         return False, f"Il mercato non è ancora aperto ai pagamenti. Si apre alle {APERTURA_MERCATO.strftime('%H:%M del %d/%m/%Y')}."
 
-    # Controllo limite: conteggio fresco al momento dell'esecuzione, non quello
-    # calcolato all'apertura della pagina (potrebbe essere cambiato nel frattempo)
-    if conta_clausole_pagate(acquirente) >= LIMITE_CLAUSOLE_PAGATE:
-        return False, f"Hai già raggiunto il limite di {LIMITE_CLAUSOLE_PAGATE} clausole pagate. Nessun credito è stato mosso."
-
-    proprietario_pulito = pulisci_nome(proprietario)
-    esito = {"trovato": False}
-
-    def trasforma_roster(df):
-        mask = (df['Id'].astype(str) == str(player_id)) & (df['Squadra_LFM'] == proprietario_pulito)
-        if mask.any():
-            esito["trovato"] = True
-            df.loc[mask, 'Squadra_LFM'] = acquirente
-        return df
-
-    aggiorna_csv_con_retry(
-        "fantamanager-2021-rosters.csv", trasforma_roster, f"Trasferimento {nome}"
-    )
-
-    if not esito["trovato"]:
-        return False, "Questo giocatore non appartiene più a questa squadra: probabilmente è già stato trasferito da qualcun altro un istante prima. Nessun credito è stato mosso."
-
-    def trasforma_crediti(df):
-        df.loc[df['Squadra'] == acquirente, 'Crediti'] -= int(costo)
-        df.loc[df['Squadra'] == proprietario, 'Crediti'] += int(costo)
-        return df
-
-    aggiorna_csv_con_retry("leghe.csv", trasforma_crediti, f"Pagata clausola rescissoria {nome}")
-
-    path = "richieste_scippo.csv"
     orario = ora_italiana().strftime("%Y-%m-%d %H:%M:%S")
-    nuova_riga = f"{acquirente},{proprietario},{player_id},{nome},{costo},APPROVATO_AUTO,{orario}\n"
+    transazione = transazione_trasferimento(acquirente, proprietario, pulisci_nome(proprietario), player_id, nome, costo, orario)
+    return consegna_operazione(transazione, f"Clausola Rescissoria (auto): {nome}", attendi)
+
+def consegna_operazione(transazione, msg, attendi):
+    """Consegna la transazione alla coda. Con attendi=True ne restituisce
+    l'esito (ok, motivo); altrimenti (None, biglietto) da seguire con
+    mostra_operazione_in_coda()."""
+    biglietto = coda_transazioni.accoda(transazione, msg)
+    if not attendi:
+        return None, biglietto
     try:
-        f = repo.get_contents(path)
-        contenuto = f.decoded_content.decode("utf-8") + nuova_riga
-        repo.update_file(path, f"Clausola Rescissoria (auto): {nome} alle {orario}", contenuto, f.sha)
-    except:
-        header = "Acquirente,Proprietario,Id,Nome,Costo,Stato,Orario\n"
-        repo.create_file(path, "Init Richieste", header + nuova_riga)
-
-    return True, None
+        return coda_transazioni.attendi(biglietto)
+    except Exception as e:
+        return False, f"Operazione non riuscita: {e}. Nessun credito è stato mosso."
+
+@st.fragment(run_every=1)
+def mostra_operazione_in_coda():
+    """Segue l'operazione consegnata alla coda da questa sessione: posizione
+    in coda finché è in attesa, poi l'esito (mostrato al rerun successivo)."""
+    operazione = st.session_state.get("operazione_in_coda")
+    if not operazione:
+        return
+    stato = coda_transazioni.stato(operazione["biglietto"])
+    if stato is None or stato["stato"] in (FATTO, ERRORE):
+        if stato is None:
+            esito = (False, "Esito dell'operazione non disponibile: controlla la rosa prima di riprovare.")
+        elif stato["stato"] == ERRORE:
+            esito = (False, f"Operazione non riuscita: {stato['errore']}. Nessun credito è stato mosso.")
+        else:
+            esito = stato["esito"]
+        st.session_state.operazione_in_coda = None
+        st.session_state.esito_operazione = (operazione, esito)
+        carica_fotografia_lega.clear()
+        st.rerun()
+    davanti = coda_transazioni.posizione(operazione["biglietto"])
+    if davanti:
+        st.info(f"⏳ {operazione['descrizione']}: in coda, {davanti} operazioni prima della tua...")
+    else:
+        st.info(f"⏳ {operazione['descrizione']}: in corso...")
+
+def mostra_esito_operazione():
+    """Messaggio finale dell'ultima operazione in coda di questa sessione."""
+    esito_operazione = st.session_state.get("esito_operazione")
+    if not esito_operazione:
+        return
+    st.session_state.esito_operazione = None
+    operazione, (ok, motivo) = esito_operazione
+    if ok:
+        st.success(f"✅ {operazione['successo']}")
+        if operazione.get("festa"):
+            st.balloons()
+    else:
+        st.error(f"❌ {motivo}")
+
+@st.fragment
+def mercato_lega(lega, libro, budget, squadre, my_cred, clausole_esaurite):
+    """Mercato di una lega: l'elenco delle squadre e il dettaglio (giocatori
+    e pulsanti PAGA) della sola squadra aperta. Cambiare squadra o pagare
+    riesegue solo questo fragment; l'avanzamento del pagamento in coda viene
+    seguito qui finché non serve un rerun completo (dati cambiati).
+    'squadre' è [(squadra, crediti)] nell'ordine di leghe.csv."""
+    # Esito e avanzamento vanno in cima, ma si scrivono alla fine: così
+    # vedono anche il pagamento appena consegnato, senza un altro rerun
+    avvisi = st.container()
+
+    titoli = {sq: f"🏟️  {get_team_display_name(sq).upper()}  ·  💰 {sq_c} cr" for sq, sq_c in squadre}
+    sq = st.radio(
+        "🏟️ Squadre della lega", list(titoli), format_func=titoli.get, index=None,
+        key=f"mercato_squadra_{lega}", help="Apri una squadra per vederne le clausole",
+    )
+    if sq is None:
+        st.caption("👆 Scegli una squadra per vederne le clausole.")
+    else:
+        dettaglio_squadra_mercato(lega, sq, titoli[sq], libro, budget, my_cred, clausole_esaurite)
+
+    with avvisi:
+        mostra_esito_operazione()
+        if st.session_state.get("operazione_in_coda") and not st.session_state.get("coda_in_pagina"):
+            mostra_operazione_in_coda()
+
+def dettaglio_squadra_mercato(lega, sq, titolo, libro, budget, my_cred, clausole_esaurite):
+    """Giocatori acquistabili di una squadra con i pulsanti PAGA."""
+    with st.container(border=True):
+        st.markdown(f"**{titolo}**")
+        st.caption(f"🔝 Budget netto più alto tra i suoi rivali: {budget.max_rivali(sq)} cr")
+        if libro.d_ufficio(sq):
+            st.caption("⚠️ Clausole d'ufficio applicate (Valore FVM)")
+        giocatori = libro.clausole_di(lega, sq)
+
+        if not giocatori:
+            st.caption("— Nessun giocatore attualmente disponibile —")
+
+        for pid, pnm, pvl in giocatori:
+            pnm_clean = get_team_display_name(pnm)
+            
+            col1, col2, col3 = st.columns([3, 1, 1.5])
+            with col1:
+                st.markdown(f"<div class='player-row' style='margin-bottom:0; border:none; padding:6px 0;'><span class='p-name'>⚽ {pnm_clean}</span></div>", unsafe_allow_html=True)
+            with col2:
+                st.markdown(f"<span class='p-value'>💰 {pvl} cr</span>", unsafe_allow_html=True)
+            if sq != st.session_state.squadra:
+                with col3:
+                    if not MERCATO_PAGABILE:
+                        st.caption("👁️ Non ancora pagabile")
+                    elif clausole_esaurite:
+                        st.caption(f"🔒 Limite {LIMITE_CLAUSOLE_PAGATE}/{LIMITE_CLAUSOLE_PAGATE} raggiunto")
+                    elif st.button("💸 PAGA", key=f"a_{pid}", use_container_width=True):
+                        if st.session_state.get("operazione_in_coda"):
+                            st.warning("⏳ Attendi l'esito dell'operazione già in coda.")
+                        elif my_cred >= pvl:
+                            ok, motivo = esegui_trasferimento_clausola(st.session_state.squadra, sq, pid, pnm, pvl, attendi=False)
+                            if ok is None:
+                                st.session_state.operazione_in_coda = {
+                                    "biglietto": motivo, "descrizione": f"Pagamento clausola di {pnm_clean}",
+                                    "successo": f"Clausola pagata! {pnm_clean} è ora nella tua rosa.", "festa": True,
+                                }
+                                st.session_state.coda_in_pagina = False
+                            else:
+                                st.session_state.esito_operazione = ({}, (ok, motivo))
+                        else:
+                            st.error("❌ Budget insufficiente!")
+
+def approva_richiesta_clausola(richiesta):
+    """Approvazione admin di una richiesta PENDENTE: stato della richiesta,
+    roster e crediti in un unico commit. Restituisce (ok, motivo)."""
+    return archivio.transazione(
+        transazione_approvazione(richiesta, pulisci_nome(richiesta['Proprietario'])),
+        f"Pagata clausola rescissoria {richiesta['Nome']}",
+    )
 
-def parse_orario_pagamento(orario_str):
-    """Prova a interpretare il campo Orario come data+ora completa. Restituisce None
-    se il formato non è quello atteso (es. voci vecchie salvate solo con l'ora)."""
-    try:
-        return datetime.strptime(str(orario_str).strip(), "%Y-%m-%d %H:%M:%S")
-    except (ValueError, TypeError):
-        return None
+def rifiuta_richiesta_clausola(richiesta):
+    """Rifiuto admin: cambia lo stato della sola richiesta, se è ancora
+    PENDENTE, senza riscrivere il file da una copia in cache. Restituisce
+    quante righe sono state rifiutate."""
+    return archivio.transazione(
+        lambda tx: tx.aggiorna_righe(
+            "richieste_scippo.csv", {"Stato": "RIFIUTATO"}, Stato="PENDENTE", **chiave_richiesta(richiesta),
+        ),
+        "Richiesta rifiutata",
+    )
 
 def get_controriscatti_disponibili(squadra):
     """Clausole subite da 'squadra' ancora rispondibili con controriscatto:
@@ -281,56 +334,17 @@ def get_controriscatti_disponibili(squadra):
 
     return subite[subite['Orario'].apply(entro_24h)]
 
-def esegui_controriscatto(proprietario, acquirente, player_id, nome, costo_originale):
+def esegui_controriscatto(proprietario, acquirente, player_id, nome, costo_originale, attendi=True):
     """Il proprietario originale riprende il giocatore pagando il 110% della clausola;
-    l'acquirente riceve indietro solo l'importo originale (il 10% extra non va a nessuno)."""
+    l'acquirente riceve indietro solo l'importo originale (il 10% extra non va a nessuno).
+    Roster, crediti e stato della richiesta cambiano nello stesso commit,
+    passando dalla coda come i pagamenti (vedi esegui_trasferimento_clausola)."""
     ora = ora_italiana()
     if not (FINESTRA_CONTRORISCATTO_INIZIO <= ora <= FINESTRA_CONTRORISCATTO_FINE):
         return False, "Il diritto di controriscatto è esercitabile solo nelle ultime 48 ore di agosto."
 
-    df_sc = carica_csv("richieste_scippo.csv")
-    riga = df_sc[
-        (df_sc['Proprietario'] == proprietario) & (df_sc['Acquirente'] == acquirente) &
-        (df_sc['Id'].astype(str) == str(player_id)) & (df_sc['Stato'].astype(str) == 'APPROVATO_AUTO')
-    ]
-    if riga.empty:
-        return False, "Transazione non trovata o già gestita in precedenza."
-    idx = riga.index[0]
-
-    dt_pagamento = parse_orario_pagamento(riga.loc[idx, 'Orario'])
-    if dt_pagamento is None or ora > dt_pagamento + timedelta(hours=24):
-        return False, "Sono passate più di 24 ore dal pagamento: il controriscatto non è più esercitabile per questo giocatore."
-
-    acquirente_pulito = pulisci_nome(acquirente)
-    esito = {"trovato": False}
-
-    def trasforma_roster(df):
-        mask = (df['Id'].astype(str) == str(player_id)) & (df['Squadra_LFM'] == acquirente_pulito)
-        if mask.any():
-            esito["trovato"] = True
-            df.loc[mask, 'Squadra_LFM'] = proprietario
-        return df
-
-    aggiorna_csv_con_retry(
-        "fantamanager-2021-rosters.csv", trasforma_roster, f"Controriscatto {nome}"
-    )
-
-    if not esito["trovato"]:
-        return False, "Il giocatore non è più presso questa squadra: il controriscatto non è più valido. Nessun credito è stato mosso."
-
-    penale_totale = math.ceil(float(costo_originale) * 1.10)
-
-    def trasforma_crediti(df):
-        df.loc[df['Squadra'] == proprietario, 'Crediti'] -= penale_totale
-        df.loc[df['Squadra'] == acquirente, 'Crediti'] += int(costo_originale)
-        return df
-
-    aggiorna_csv_con_retry("leghe.csv", trasforma_crediti, f"Controriscatto: {nome} torna a {proprietario}")
-
-    df_sc.at[idx, 'Stato'] = 'CONTRORISCATTATO'
-    salva_file_github("richieste_scippo.csv", df_sc, f"Controriscatto eseguito su {nome}")
-
-    return True, None
+    transazione = transazione_controriscatto(proprietario, acquirente, pulisci_nome(acquirente), player_id, nome, costo_originale, ora)
+    return consegna_operazione(transazione, f"Controriscatto: {nome} torna a {proprietario}", attendi)
 
 def calcola_tassa(valore):
     if valore <= 200: 
@@ -345,22 +359,14 @@ def get_squadre_e_tasse():
     """Calcola, per ogni squadra con una bozza salvata, la tassa totale di
     blindaggio sui 3 valori salvati. Funzione pura, nessuna scrittura:
     calcola_tassa è deterministica quindi il totale è sempre ricostruibile
-    dai soli valori già salvati in clausole_segrete.csv."""
-    salvati = carica_clausole_salvate()
-    righe = []
-    for squadra, dati in salvati.items():
-        tot_tasse = 0
-        for p in dati.split(";"):
-            if not p.strip():
-                continue
-            try:
-                _, _, valore = p.split(":")
-                tot_tasse += calcola_tassa(int(valore))
-            except ValueError:
-                continue
-        eccedenza = max(0, tot_tasse - 60)
-        righe.append({'Squadra': squadra, 'TotaleTasse': tot_tasse, 'Eccedenza': eccedenza})
-    return pd.DataFrame(righe)
+    dai soli valori già salvati nella tabella delle clausole."""
+    salvate = carica_clausole_salvate().tabella
+    if salvate.empty:
+        return pd.DataFrame()
+    tasse = salvate.assign(TotaleTasse=salvate['Valore'].map(calcola_tassa))
+    df_tasse = tasse.groupby('Squadra', sort=False)['TotaleTasse'].sum().reset_index()
+    df_tasse['Eccedenza'] = (df_tasse['TotaleTasse'] - 60).clip(lower=0)
+    return df_tasse
 
 def applica_tasse_blindaggio():
     """Deduzione UNA TANTUM della tassa di blindaggio (parte eccedente il Bonus
@@ -368,16 +374,10 @@ def applica_tasse_blindaggio():
     un log che rende l'operazione non ripetibile: se il log esiste già, l'app
     rifiuta di eseguirla una seconda volta.
 
-    IMPORTANTE: il log viene scritto PRIMA di toccare i crediti apposta — se
-    qualcosa va storto a metà, il fallimento blocca un secondo tentativo (che
-    scalerebbe la tassa due volte) invece di rischiare un doppio addebito
-    silenzioso. Il prezzo è che un fallimento a metà lascia i crediti non
-    ancora aggiornati anche col log presente: in quel caso va sistemato a
-    mano confrontando il log con leghe.csv, non rilanciando l'operazione."""
-    log_esistente = carica_csv("tasse_blindaggio.csv")
-    if not log_esistente.empty:
-        return False, "Le tasse di blindaggio risultano già applicate in precedenza (o un tentativo precedente si è fermato a metà). Operazione non ripetibile: controlla leghe.csv a mano."
-
+    Log e crediti vengono scritti nello STESSO commit: non esiste più il caso
+    "log presente ma crediti non aggiornati" da sistemare a mano. Il controllo
+    sul log già esistente è fatto dentro la transazione, quindi due click
+    quasi simultanei non possono scalare la tassa due volte."""
     df_tasse = get_squadre_e_tasse()
     if df_tasse.empty:
         return False, "Nessuna bozza salvata trovata: nulla da applicare."
@@ -387,18 +387,24 @@ def applica_tasse_blindaggio():
         'Squadra': r['Squadra'], 'TotaleTasse': int(r['TotaleTasse']),
         'Eccedenza': int(r['Eccedenza']), 'Orario': orario
     } for _, r in df_tasse.iterrows()]
-    salva_file_github("tasse_blindaggio.csv", pd.DataFrame(log_righe), "Log tasse di blindaggio applicate")
 
-    def trasforma_crediti(df_l):
+    def transazione(tx):
+        if not tx.leggi_csv("tasse_blindaggio.csv").empty:
+            return False, "Le tasse di blindaggio risultano già applicate in precedenza. Operazione non ripetibile."
+
+        # Nomi di leghe.csv ripuliti una volta sola: ogni squadra della bozza
+        # trova le sue righe (stesso nome canonico) con un lookup
+        registro = RegistroNomi(tx.leggi_csv("leghe.csv")['Squadra'])
         for _, r in df_tasse.iterrows():
-            squadra_pulita = pulisci_nome(r['Squadra'])
-            mask = (df_l['Squadra'] == r['Squadra']) | (df_l['Squadra'].apply(pulisci_nome) == squadra_pulita)
-            if mask.any():
-                df_l.loc[mask, 'Crediti'] -= int(r['Eccedenza'])
-        return df_l
+            if not int(r['Eccedenza']):
+                continue
+            for squadra in registro.grezzi_di(r['Squadra']):
+                registra_movimento(tx, squadra, "TASSA_BLINDAGGIO", -int(r['Eccedenza']), "Tassa di blindaggio", orario)
 
-    aggiorna_csv_con_retry("leghe.csv", trasforma_crediti, "Applicazione tasse di blindaggio")
-    return True, None
+        tx.scrivi_csv("tasse_blindaggio.csv", pd.DataFrame(log_righe))
+        return True, None
+
+    return archivio.transazione(transazione, "Applicazione tasse di blindaggio")
 
 # --- 4. UI E CSS ---
 st.set_page_config(
@@ -754,11 +760,47 @@ else:
     st.session_state.portale_aperto = PORTALE_APERTO
 
 # --- 6. CARICAMENTO DATI ---
-df_leghe = carica_csv("leghe.csv")
+FILE_LEGA = [
+    "leghe.csv", "fantamanager-2021-rosters.csv", "quot.csv",
+    "richieste_scippo.csv", "stadi.csv", CLAUSOLE, CLAUSOLE_SEGRETE,
+]
+
+@st.cache_data(ttl=15)
+def carica_fotografia_lega():
+    """Tutti i file usati dalle viste del portale, letti alla STESSA versione
+    del repository con un solo giro di richieste (vedi Archivio.fotografia).
+    TTL breve: la verifica è una richiesta condizionale, quindi gratuita se
+    non è cambiato nulla; dopo una nostra scrittura la cache va svuotata."""
+    try:
+        return archivio.fotografia(FILE_LEGA, testuali=[CLAUSOLE_SEGRETE])
+    except Exception as e:
+        st.error(f"Errore lettura dati da GitHub: {e}")
+        return None, {f: ("" if f == CLAUSOLE_SEGRETE else pd.DataFrame()) for f in FILE_LEGA}
+
+versione_lega, dati_lega = carica_fotografia_lega()
+
+def carica_modello_lega():
+    """Modello dati condiviso (vedi modello_lega.py) costruito dalla stessa
+    fotografia: il merge si rifà solo quando cambia la versione del repository."""
+    return modello_da_tabelle(
+        dati_lega["fantamanager-2021-rosters.csv"], dati_lega["leghe.csv"], dati_lega["quot.csv"],
+        pd.DataFrame(), versione=("clausole", versione_lega),
+    )
+df_leghe = dati_lega["leghe.csv"]
+
+# Registro dei nomi squadra (grezzo -> canonico -> id intero), costruito una
+# volta per versione del repository invece di ripulire i nomi a ogni rerun
+registro = registro_nomi(
+    versione_lega,
+    df_leghe.get('Squadra'), dati_lega["fantamanager-2021-rosters.csv"].get('Squadra_LFM'),
+)
+
+# Capienza e manutenzione degli stadi, indicizzate per squadra (indice_stadi.py)
+stadi = indice_stadi(dati_lega["stadi.csv"], ("clausole", versione_lega) if versione_lega else None)
 
 # Pulisci i nomi delle squadre nel DataFrame
 if not df_leghe.empty:
-    df_leghe['Squadra_Pulita'] = df_leghe['Squadra'].apply(pulisci_nome)
+    df_leghe['Squadra_Pulita'] = registro.canonici(df_leghe['Squadra'])
 
 # --- 7. FUNZIONE PER OTTENERE SQUADRE PULITE ---
 def get_clean_teams(lega=None):
@@ -768,14 +810,10 @@ def get_clean_teams(lega=None):
     else:
         df_filtered = df_leghe
     
-    teams = {}
-    for _, row in df_filtered.iterrows():
-        original = row['Squadra']
-        clean = row.get('Squadra_Pulita', pulisci_nome(original))
-        if not clean:
-            clean = original
-        teams[clean] = original
-    return teams
+    if df_filtered.empty:
+        return {}
+    puliti = df_filtered['Squadra_Pulita'].where(df_filtered['Squadra_Pulita'] != "", df_filtered['Squadra'])
+    return dict(zip(puliti, df_filtered['Squadra']))
 
 # --- 8. LOGIN ---
 if not st.session_state.loggato:
@@ -870,8 +908,7 @@ else:
             st.markdown("---")
             
             st.markdown("#### 📝 Stato Blindaggi")
-            salvati_admin = carica_clausole_salvate()
-            consegnate = list(salvati_admin.keys())
+            consegnate = carica_clausole_salvate().squadre()
             mancanti = [s for s in df_leghe['Squadra'].unique() if s not in consegnate]
 
             col1, col2 = st.columns(2)
@@ -883,6 +920,32 @@ else:
             
             st.markdown("---")
 
+            st.markdown("#### 🔝 Soglie di Blindaggio")
+            if st.checkbox("👀 Vedi soglie per squadra"):
+                soglie = carica_budget_rivali().tabella.sort_values(["Lega", "Netti"], ascending=[True, False])
+                st.dataframe(
+                    soglie[["Lega", "Squadra", "Netti", "Max_Rivali", "Rivale_Max"]],
+                    use_container_width=True, hide_index=True,
+                )
+            
+            st.markdown("---")
+
+            st.markdown("#### 🎯 Scanner Vulnerabilità")
+            if st.checkbox("👀 Vedi clausole acquistabili"):
+                scanner = scanner_clausole(carica_libro_clausole(), carica_budget_rivali(), "clausole")
+                riepilogo = scanner.riepilogo()
+                col1, col2 = st.columns(2)
+                col1.metric("Acquistabili", f"{int((riepilogo['Acquirenti'] > 0).sum())}/{len(riepilogo)}")
+                col2.metric("Coppie valutate", f"{len(scanner.coppie)}")
+                st.caption("Margine = budget netto dell'acquirente meno la clausola (conta solo il budget, non il limite di clausole pagate).")
+                st.dataframe(riepilogo, use_container_width=True, hide_index=True)
+                st.download_button(
+                    "⬇️ Scarica acquistabili CSV", scanner.acquistabili().to_csv(index=False),
+                    file_name="clausole_acquistabili.csv", mime="text/csv"
+                )
+            
+            st.markdown("---")
+
             st.markdown("#### 💰 Tasse di Blindaggio")
             if ora_italiana() < SCADENZA:
                 st.caption(f"🔒 Disponibile dal raggiungimento della scadenza ({SCADENZA.strftime('%d/%m/%Y %H:%M')}).")
@@ -911,14 +974,30 @@ else:
                             ok, motivo = applica_tasse_blindaggio()
                             if ok:
                                 st.success("✅ Tasse applicate e registrate.")
+                                carica_fotografia_lega.clear()
                                 st.rerun()
                             else:
                                 st.error(f"❌ {motivo}")
             
             st.markdown("---")
             
+            st.markdown("#### 📡 API GitHub")
+            col1, col2 = st.columns(2)
+            col1.metric("Risparmiate (304)", f"{statistiche_richieste['non_modificate']}/{statistiche_richieste['richieste']}")
+            col2.metric("Blob da cache", f"{statistiche_richieste['blob_da_cache']}")
+            if statistiche_richieste['rate_limit_residuo'] is not None:
+                st.caption(f"Budget residuo: {statistiche_richieste['rate_limit_residuo']} richieste/ora · scaricati {statistiche_richieste['blob_scaricati']} blob nuovi")
+            st.caption(f"Transazioni: {archivio.statistiche['commit']} commit · {archivio.statistiche['conflitti']} conflitti ritentati")
+
+            st.markdown("---")
+
             st.markdown("#### 💸 Clausole Rescissorie")
             if st.checkbox("📥 GESTISCI RICHIESTE"):
+                # Approvazioni e rifiuti cercano la richiesta nel file per
+                # chiave (e Stato PENDENTE) dentro la transazione: prima si
+                # pubblicano le richieste ancora nel buffer, così ci sono
+                if buffer_log.pubblica():
+                    carica_csv.clear()
                 df_sc = carica_csv("richieste_scippo.csv")
                 if not df_sc.empty:
                     pendenti = df_sc[df_sc['Stato'].astype(str).str.contains('PENDENTE', na=False)]
@@ -935,20 +1014,19 @@ else:
                                 st.write(f"**Costo:** {r['Costo']} cr")
                                 c_adm1, c_adm2 = st.columns(2)
                                 if c_adm1.button("✅ APPROVA", key=f"ok_{i}", use_container_width=True):
-                                    df_l = carica_csv("leghe.csv")
-                                    df_l.loc[df_l['Squadra'] == r['Acquirente'], 'Crediti'] -= int(r['Costo'])
-                                    df_l.loc[df_l['Squadra'] == r['Proprietario'], 'Crediti'] += int(r['Costo'])
-                                    salva_file_github("leghe.csv", df_l, f"Pagata clausola rescissoria {r['Nome']}")
-                                    df_ros = carica_csv("fantamanager-2021-rosters.csv")
-                                    df_ros.loc[df_ros['Id'].astype(str) == str(r['Id']), 'Squadra_LFM'] = r['Acquirente']
-                                    salva_file_github("fantamanager-2021-rosters.csv", df_ros, f"Trasferimento {r['Nome']}")
-                                    df_sc.at[i, 'Stato'] = 'APPROVATO'
-                                    salva_file_github("richieste_scippo.csv", df_sc, "Richiesta approvata")
-                                    st.rerun()
+                                    ok, motivo = approva_richiesta_clausola(r)
+                                    carica_csv.clear()
+                                    carica_fotografia_lega.clear()
+                                    if ok:
+                                        st.rerun()
+                                    st.warning(f"⚠️ {motivo}")
                                 if c_adm2.button("❌ RIFIUTA", key=f"no_{i}", use_container_width=True):
-                                    df_sc.at[i, 'Stato'] = 'RIFIUTATO'
-                                    salva_file_github("richieste_scippo.csv", df_sc, "Richiesta rifiutata")
-                                    st.rerun()
+                                    rifiutate = rifiuta_richiesta_clausola(r)
+                                    carica_csv.clear()
+                                    carica_fotografia_lega.clear()
+                                    if rifiutate:
+                                        st.rerun()
+                                    st.warning("⚠️ Richiesta non più pendente: è già stata gestita.")
                 else:
                     st.info("📭 Nessuna richiesta presente")
 
@@ -963,9 +1041,16 @@ else:
         </div>
         """, unsafe_allow_html=True)
         
+        # Pagamenti e controriscatti passano dalla coda: esito dell'ultima
+        # operazione e, se ce n'è una in attesa, il suo avanzamento
+        mostra_esito_operazione()
+        st.session_state.coda_in_pagina = bool(st.session_state.get("operazione_in_coda"))
+        if st.session_state.coda_in_pagina:
+            mostra_operazione_in_coda()
+
         lega_view = st.selectbox("📋 Filtra Lega", df_leghe['Lega'].unique())
         my_cred = df_leghe[df_leghe['Squadra'] == st.session_state.squadra]['Crediti'].values[0]
-        clausole_pagate = conta_clausole_pagate(st.session_state.squadra)
+        clausole_pagate = conta_pagate_in(dati_lega["richieste_scippo.csv"], st.session_state.squadra)
         clausole_esaurite = clausole_pagate >= LIMITE_CLAUSOLE_PAGATE
 
         if not MERCATO_PAGABILE:
@@ -988,100 +1073,16 @@ else:
         if clausole_esaurite:
             st.sidebar.warning("Hai raggiunto il limite di clausole pagabili.")
 
-        df_r = carica_csv("fantamanager-2021-rosters.csv")
-        df_q = carica_csv("quot.csv")
-        
-        # PULIZIA NOMI
-        if not df_r.empty and 'Squadra_LFM' in df_r.columns:
-            df_r['Squadra_LFM'] = df_r['Squadra_LFM'].astype(str).str.strip()
-            df_r['Squadra_LFM'] = df_r['Squadra_LFM'].apply(pulisci_nome)
-        
-        if not df_q.empty and 'Nome' in df_q.columns:
-            df_q['Nome'] = df_q['Nome'].apply(pulisci_nome)
-        
-        df_q['Id'] = df_q['Id'].astype(str)
-        salvati = carica_clausole_salvate()
-
-        # Mappa Id -> proprietario ATTUALE, per filtrare giocatori già trasferiti
-        # (una clausola salvata su clausole_segrete.csv non si aggiorna da sola
-        # quando il giocatore viene comprato: senza questo controllo resterebbe
-        # "acquistabile" sotto la squadra vecchia anche dopo il trasferimento)
-        #
-        # IMPORTANTE: la mappa va limitata alle sole squadre della Lega selezionata.
-        # Lo stesso Id (stesso giocatore reale) può appartenere legittimamente a
-        # squadre diverse in leghe diverse (40 squadre su 4 campionati, stessi
-        # giocatori Serie A duplicati per ogni lega) — una mappa globale Id->Squadra
-        # sovrascriverebbe silenziosamente 3 proprietari su 4.
-        #
-        # Le chiavi/valori usano pulisci_nome(): Squadra_LFM è già ripulito da
-        # quella funzione (es. prima lettera forzata maiuscola), mentre i nomi
-        # grezzi di leghe.csv (sq) non lo sono — un nome scritto tutto minuscolo
-        # nel CSV originale altrimenti non troverebbe mai corrispondenza.
-        squadre_lega_view = set(pulisci_nome(s) for s in df_leghe[df_leghe['Lega'] == lega_view]['Squadra'])
-        proprietario_attuale = {}
-        if not df_r.empty and 'Id' in df_r.columns and 'Squadra_LFM' in df_r.columns:
-            df_r_lega_view = df_r[df_r['Squadra_LFM'].isin(squadre_lega_view)]
-            proprietario_attuale = df_r_lega_view.astype({'Id': str}).set_index('Id')['Squadra_LFM'].to_dict()
-
-        # Mostra squadre
-        for sq in df_leghe[df_leghe['Lega'] == lega_view]['Squadra']:
-            sq_pulito = pulisci_nome(sq)
-            sq_clean = get_team_display_name(sq)
-            sq_c = df_leghe[df_leghe['Squadra'] == sq]['Crediti'].values[0]
-            
-            team_title = f"🏟️  {sq_clean.upper()}  ·  💰 {sq_c} cr"
-            
-            with st.expander(team_title):
-                if sq in salvati:
-                    giocatori = []
-                    for p in salvati[sq].split(";"):
-                        if not p.strip():
-                            continue
-                        pid, pnm, pvl = p.split(":")
-                        giocatori.append((pid, pnm, int(pvl)))
-                else:
-                    st.caption("⚠️ Clausole d'ufficio applicate (Valore FVM)")
-                    ids = df_r[df_r['Squadra_LFM'] == sq_pulito]['Id'].astype(str).tolist()
-                    top_giocatori = df_q[df_q['Id'].isin(ids)].nlargest(3, 'FVM')
-                    giocatori = [(row['Id'], row['Nome'], int(row['FVM'])) for _, row in top_giocatori.iterrows()]
-
-                # Esclude i giocatori già trasferiti nel frattempo: la clausola
-                # salvata potrebbe essere obsoleta se il giocatore è stato comprato
-                giocatori = [
-                    (pid, pnm, pvl) for pid, pnm, pvl in giocatori
-                    if proprietario_attuale.get(str(pid)) == sq_pulito
-                ]
-
-                if not giocatori:
-                    st.caption("— Nessun giocatore attualmente disponibile —")
-
-                for pid, pnm, pvl in giocatori:
-                    pnm_clean = get_team_display_name(pnm)
-                    
-                    col1, col2, col3 = st.columns([3, 1, 1.5])
-                    with col1:
-                        st.markdown(f"<div class='player-row' style='margin-bottom:0; border:none; padding:6px 0;'><span class='p-name'>⚽ {pnm_clean}</span></div>", unsafe_allow_html=True)
-                    with col2:
-                        st.markdown(f"<span class='p-value'>💰 {pvl} cr</span>", unsafe_allow_html=True)
-                    if sq != st.session_state.squadra:
-                        with col3:
-                            if not MERCATO_PAGABILE:
-                                st.caption("👁️ Non ancora pagabile")
-                            elif clausole_esaurite:
-                                st.caption(f"🔒 Limite {LIMITE_CLAUSOLE_PAGATE}/{LIMITE_CLAUSOLE_PAGATE} raggiunto")
-                            elif st.button("💸 PAGA", key=f"a_{pid}", use_container_width=True):
-                                if my_cred >= pvl:
-                                    with st.spinner("⏳ Trasferimento in corso..."):
-                                        ok, motivo = esegui_trasferimento_clausola(st.session_state.squadra, sq, pid, pnm, pvl)
-                                    if ok:
-                                        st.success(f"✅ Clausola pagata! {pnm_clean} è ora nella tua rosa.")
-                                        st.balloons()
-                                        st.rerun()
-                                    else:
-                                        st.error(f"❌ {motivo}")
-                                        st.rerun()
-                                else:
-                                    st.error("❌ Budget insufficiente!")
+        # Clausole effettive di ogni squadra (bozza o d'ufficio), già filtrate
+        # sui proprietari attuali della lega: vedi libro_clausole.py
+        libro = carica_libro_clausole()
+        df_leghe_view = df_leghe[df_leghe['Lega'] == lega_view]
+
+        # Elenco delle squadre e dettaglio solo di quella aperta (fragment)
+        mercato_lega(
+            lega_view, libro, carica_budget_rivali(), list(zip(df_leghe_view['Squadra'], df_leghe_view['Crediti'])),
+            my_cred, clausole_esaurite,
+        )
 
         # --- DIRITTO DI CONTRORISCATTO: solo nelle ultime 48 ore di agosto ---
         if FINESTRA_CONTRORISCATTO_INIZIO <= ora_italiana() <= FINESTRA_CONTRORISCATTO_FINE:
@@ -1110,15 +1111,19 @@ else:
                         st.write(f"Penale totale da pagare per riprenderlo: **{penale_totale} cr**")
                         st.caption(f"⏳ Tempo rimanente per rispondere: {ore_rim}h {min_rim}m")
                         if st.button("🔁 Esercita Controriscatto", key=f"cr_{idx}", use_container_width=True):
-                            with st.spinner("⏳ Controriscatto in corso..."):
+                            if st.session_state.get("operazione_in_coda"):
+                                st.warning("⏳ Attendi l'esito dell'operazione già in coda.")
+                            else:
                                 ok, motivo = esegui_controriscatto(
-                                    st.session_state.squadra, r['Acquirente'], r['Id'], r['Nome'], r['Costo']
+                                    st.session_state.squadra, r['Acquirente'], r['Id'], r['Nome'], r['Costo'], attendi=False
                                 )
-                            if ok:
-                                st.success(f"✅ {nome_clean} torna nella tua rosa.")
-                                st.rerun()
-                            else:
-                                st.error(f"❌ {motivo}")
+                                if ok is None:
+                                    st.session_state.operazione_in_coda = {
+                                        "biglietto": motivo, "descrizione": f"Controriscatto di {nome_clean}",
+                                        "successo": f"{nome_clean} torna nella tua rosa.",
+                                    }
+                                else:
+                                    st.session_state.esito_operazione = ({}, (ok, motivo))
                                 st.rerun()
 
     # SEZIONE TERMINALE BLINDAGGI (PORTALE CHIUSO)
@@ -1132,24 +1137,6 @@ else:
         </div>
         """, unsafe_allow_html=True)
         
-        # --- Tabella manutenzione stadi (condivisa) ---
-        LIVELLI_STADIO = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
-        MANUTENZIONE_STADIO = {10: 45, 20: 25, 30: 35, 40: 50, 50: 70,
-                                60: 90, 70: 120, 80: 150, 90: 185, 100: 215}
-        df_stadi = carica_csv("stadi.csv")
-
-        def get_costo_stadio(nome_squadra):
-            if df_stadi.empty or 'Squadra' not in df_stadi.columns or 'Stadio' not in df_stadi.columns:
-                return 0
-            match = df_stadi[df_stadi['Squadra'] == nome_squadra]
-            if match.empty:
-                return 0
-            cap = pd.to_numeric(match['Stadio'].values[0], errors='coerce')
-            if pd.isna(cap):
-                return 0
-            livello_vicino = min(LIVELLI_STADIO, key=lambda x: abs(x - cap))
-            return MANUTENZIONE_STADIO[livello_vicino]
-
         # VERIFICA CHE LA SQUADRA ESISTA
         squadra_found = False
         if not df_leghe.empty:
@@ -1157,19 +1144,8 @@ else:
             if not squadra_match.empty:
                 squadra_found = True
                 crediti_totali = squadra_match['Crediti'].values[0]
-                mia_lega = squadra_match['Lega'].values[0]
-
-                rivali = df_leghe[
-                    (df_leghe['Squadra'] != st.session_state.squadra) &
-                    (df_leghe['Lega'] == mia_lega)
-                ].copy()
-                if not rivali.empty:
-                    rivali['CreditiNetti'] = rivali.apply(
-                        lambda r: r['Crediti'] - get_costo_stadio(r['Squadra']), axis=1
-                    )
-                    max_rivale = rivali['CreditiNetti'].max()
-                else:
-                    max_rivale = 0
+
+                max_rivale = carica_budget_rivali().max_rivali(st.session_state.squadra)
             else:
                 st.error(f"⚠️ Squadra '{st.session_state.squadra}' non trovata nel database.")
                 if st.button("🔄 TORNA AL LOGIN"):
@@ -1187,8 +1163,8 @@ else:
             c3.info(f"Soglia Blindaggio: > {max_rivale} cr")
             st.markdown("</div>", unsafe_allow_html=True)
 
-            df_r = carica_csv("fantamanager-2021-rosters.csv")
-            df_q = carica_csv("quot.csv")
+            df_r = dati_lega["fantamanager-2021-rosters.csv"]
+            df_q = dati_lega["quot.csv"]
             
             if df_r.empty or df_q.empty:
                 st.error("⚠️ Dati dei giocatori non disponibili.")
@@ -1202,19 +1178,6 @@ else:
                     f"Controlla l'intestazione del file su GitHub (spazi, maiuscole, delimitatore)."
                 )
                 st.stop()
-            df_r['Squadra_LFM'] = df_r['Squadra_LFM'].astype(str).str.strip()
-            df_r['Squadra_LFM'] = df_r['Squadra_LFM'].apply(pulisci_nome)
-
-            if 'Nome' in df_q.columns:
-                df_q['Nome'] = df_q['Nome'].apply(pulisci_nome)
-
-            df_q['Id'] = df_q['Id'].astype(str)
-            ids_miei = df_r[df_r['Squadra_LFM'] == pulisci_nome(st.session_state.squadra)]['Id'].astype(str).tolist()
-            
-            if not ids_miei:
-                st.warning("⚠️ Nessun giocatore trovato per la tua squadra.")
-                st.stop()
-
             # --- BUDGET NETTO: crediti - ingaggi rosa (Qt.I) - manutenzione stadio ---
             if 'Qt.I' not in df_q.columns:
                 st.error(
@@ -1223,15 +1186,20 @@ else:
                     f"Controlla l'intestazione del listone su GitHub (spazi, punteggiatura, delimitatore)."
                 )
                 st.stop()
-            df_q['Qt.I'] = pd.to_numeric(df_q['Qt.I'], errors='coerce').fillna(0)
-            costo_ingaggi = df_q[df_q['Id'].isin(ids_miei)]['Qt.I'].sum()
 
-            costo_stadio = get_costo_stadio(st.session_state.squadra)
-            capacita_stadio = None
-            if not df_stadi.empty and 'Squadra' in df_stadi.columns and 'Stadio' in df_stadi.columns:
-                stadio_match = df_stadi[df_stadi['Squadra'] == st.session_state.squadra]
-                if not stadio_match.empty:
-                    capacita_stadio = pd.to_numeric(stadio_match['Stadio'].values[0], errors='coerce')
+            # Rosa della squadra dal modello condiviso (rose × listone già uniti)
+            df_base = carica_modello_lega().base
+            rosa_mia = df_base[registro.ids(df_base['Squadra_LFM']) == registro.id_di(st.session_state.squadra)]
+
+            if rosa_mia.empty:
+                st.warning("⚠️ Nessun giocatore trovato per la tua squadra.")
+                st.stop()
+
+            costo_ingaggi = rosa_mia['Qt.I'].sum()
+
+            stadio = stadi.get(st.session_state.squadra)
+            costo_stadio = stadio.manutenzione if stadio else 0
+            capacita_stadio = stadio.capienza if stadio else None
 
             budget_netto = crediti_totali - costo_ingaggi - costo_stadio
 
@@ -1249,18 +1217,11 @@ else:
                 n4.success("✅ In equilibrio")
             st.markdown("</div>", unsafe_allow_html=True)
 
-            top_3 = df_q[df_q['Id'].isin(ids_miei)].copy()
-            top_3['FVM'] = pd.to_numeric(top_3['FVM'], errors='coerce').fillna(0)
-            top_3 = top_3.nlargest(3, 'FVM')
+            top_3 = rosa_mia.nlargest(3, 'FVM')[['Id', 'Nome', 'FVM']]
+            top_3['Nome'] = top_3['Nome'].map(pulisci_nome)
 
             # Carica l'eventuale bozza già salvata da questa squadra, per pre-riempire i campi
-            bozza_salvata = carica_clausole_salvate().get(st.session_state.squadra, "")
-            bozza_dict = {}
-            if bozza_salvata:
-                for p in bozza_salvata.split(";"):
-                    if p.strip():
-                        b_pid, b_nome, b_val = p.split(":")
-                        bozza_dict[b_pid] = int(b_val)
+            bozza_dict = carica_clausole_salvate().valori_di(st.session_state.squadra)
 
             if bozza_dict:
                 st.info("💾 Hai già una bozza salvata: i valori qui sotto sono quelli dell'ultimo salvataggio. Puoi modificarli liberamente fino alla scadenza.")
@@ -1307,7 +1268,7 @@ else:
                             st.markdown("<div class='badge-safe'>🛡️ BLINDATO</div>", unsafe_allow_html=True)
                 
                 st.markdown("</div>", unsafe_allow_html=True)
-                dati_invio.append(f"{p_id}:{nome}:{val}")
+                dati_invio.append((p_id, nome, val))
 
             st.markdown("---")
             st.markdown("### 📊 Riepilogo Clausole")
@@ -1330,7 +1291,8 @@ else:
             if st.button("📥 REGISTRA CLAUSOLE TEMPORANEAMENTE (PUOI MODIFICARLE FINO ALLA DEADLINE)", type="primary", use_container_width=True):
                 with st.spinner("⏳ Salvataggio in corso..."):
                     try:
-                        salva_clausola_singola(st.session_state.squadra, ";".join(dati_invio))
+                        salva_clausola_singola(st.session_state.squadra, dati_invio)
+                        carica_fotografia_lega.clear()
                         st.success(f"✅ Bozza salvata! Puoi tornare a modificarla in qualsiasi momento prima del {SCADENZA.strftime('%d/%m/%Y')}.")
                         st.balloons()
                     except Exception as e:
@@ -0,0 +1,111 @@
+import itertools
+import queue
+import threading
+import time
+
+# --- CODA DELLE TRANSAZIONI (UN SOLO SCRITTORE) ---
+# Alle 22:00, quando il mercato diventa pagabile, decine di sessioni pagano
+# nello stesso istante: ognuna con la propria transazione, si scontrano tutte
+# sullo stesso commit di base e ritentano a vuoto. Con la coda le sessioni
+# consegnano l'operazione (la funzione di transazione) e ricevono un
+# biglietto; un solo thread le esegue una alla volta, nell'ordine di
+# consegna. Nessun conflitto tra sessioni dello stesso processo, ordine equo
+# (chi preme prima paga prima) e un commit per operazione.
+#
+# Le sessioni non restano bloccate: controllano l'esito del biglietto con
+# stato() finché non è pronto. Gli esiti restano consultabili per
+# 'conserva_esiti' secondi.
+
+IN_CODA = "in_coda"
+IN_CORSO = "in_corso"
+FATTO = "fatto"
+ERRORE = "errore"
+
+
+class CodaTransazioni:
+    def __init__(self, archivio, conserva_esiti=600):
+        self.archivio = archivio
+        self.conserva_esiti = conserva_esiti
+        self._coda = queue.PriorityQueue()
+        self._progressivo = itertools.count(1)
+        self._stati = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._ciclo, daemon=True).start()
+
+    def accoda(self, funzione, msg):
+        """Consegna una transazione (come per archivio.transazione) e
+        restituisce subito il biglietto con cui seguirne l'esito."""
+        inviato = time.time()
+        biglietto = next(self._progressivo)
+        with self._lock:
+            self._stati[biglietto] = {"stato": IN_CODA, "inviato": inviato, "msg": msg}
+        # Ordine FIFO per orario di consegna, il progressivo risolve i pari merito
+        self._coda.put((inviato, biglietto, funzione, msg))
+        return biglietto
+
+    def stato(self, biglietto):
+        """Stato del biglietto: {'stato', 'esito' | 'errore', 'attesa', 'durata'}
+        oppure None se sconosciuto (o scaduto)."""
+        with self._lock:
+            stato = self._stati.get(biglietto)
+            return dict(stato) if stato else None
+
+    def posizione(self, biglietto):
+        """Quante operazioni vengono eseguite prima di questa (0 = è la prossima
+        o è già in corso). Conta nello stesso ordine della coda, per orario di
+        consegna e poi progressivo."""
+        with self._lock:
+            stato = self._stati.get(biglietto)
+            if stato is None:
+                return 0
+            turno = (stato["inviato"], biglietto)
+            return sum(
+                1 for b, s in self._stati.items()
+                if (s["inviato"], b) < turno and s["stato"] in (IN_CODA, IN_CORSO)
+            )
+
+    def attendi(self, biglietto, timeout=None):
+        """Attende l'esito del biglietto: restituisce il valore della
+        transazione, o rilancia l'errore. Per chi non può fare polling."""
+        limite = None if timeout is None else time.time() + timeout
+        while limite is None or time.time() < limite:
+            stato = self.stato(biglietto)
+            if stato is None:
+                raise KeyError(biglietto)
+            if stato["stato"] == FATTO:
+                return stato["esito"]
+            if stato["stato"] == ERRORE:
+                raise Exception(stato["errore"])
+            time.sleep(0.05)
+        raise TimeoutError(f"Operazione {biglietto} ancora in coda")
+
+    def esegui(self, funzione, msg, timeout=None):
+        """accoda() + attendi(): la transazione passa comunque dalla coda."""
+        return self.attendi(self.accoda(funzione, msg), timeout)
+
+    def in_attesa(self):
+        with self._lock:
+            return sum(1 for s in self._stati.values() if s["stato"] in (IN_CODA, IN_CORSO))
+
+    def _aggiorna(self, biglietto, **valori):
+        with self._lock:
+            self._stati[biglietto].update(valori)
+
+    def _pulisci(self):
+        scadenza = time.time() - self.conserva_esiti
+        with self._lock:
+            for biglietto in [b for b, s in self._stati.items()
+                              if s["stato"] in (FATTO, ERRORE) and s["fine"] < scadenza]:
+                del self._stati[biglietto]
+
+    def _ciclo(self):
+        while True:
+            inviato, biglietto, funzione, msg = self._coda.get()
+            inizio = time.time()
+            self._aggiorna(biglietto, stato=IN_CORSO, attesa=inizio - inviato)
+            try:
+                esito = self.archivio.transazione(funzione, msg)
+                self._aggiorna(biglietto, stato=FATTO, esito=esito, fine=time.time(), durata=time.time() - inizio)
+            except Exception as e:
+                self._aggiorna(biglietto, stato=ERRORE, errore=str(e), fine=time.time(), durata=time.time() - inizio)
+            self._pulisci()
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from modello_lega import modello_locale
 
 st.set_page_config(page_title="LFM Draft - Dashboard Ufficiale", layout="wide")
 
@@ -7,29 +8,12 @@ st.set_page_config(page_title="LFM Draft - Dashboard Ufficiale", layout="wide")
 ADMIN_SQUADRE = ["Liverpool Football Club", "Villarreal", "Reggina Calcio 1914", "Siviglia"]
 
 # --- FUNZIONI DI CARICAMENTO ---
-def read_csv_safe(file_name, delimiter=','):
-    try:
-        return pd.read_csv(file_name, encoding='utf-8', sep=delimiter)
-    except:
-        return pd.read_csv(file_name, encoding='ISO-8859-1', sep=delimiter)
-
 def load_data():
     try:
-        rosters = read_csv_safe('fantamanager-2021-rosters.csv')
-        leghe = read_csv_safe('leghe.csv')
-        quot = read_csv_safe('quot.csv')
-        esclusi = read_csv_safe('esclusi.csv', delimiter='\t')
-        
-        if len(esclusi.columns) >= 5:
-            esclusi.columns = ['Id', 'R', 'Nome', 'Qt.I', 'FVM']
-        
-        for df in [rosters, quot, esclusi]:
-            df['Id'] = pd.to_numeric(df['Id'], errors='coerce')
-            if 'FVM' in df.columns:
-                df['FVM'] = pd.to_numeric(df['FVM'], errors='coerce').fillna(0)
-            df.dropna(subset=['Id'], inplace=True)
-            df['Id'] = df['Id'].astype(int)
-        return rosters, leghe, quot, esclusi
+        # Tabelle già pulite dal modello condiviso (modello_lega.py); le rose
+        # vengono copiate perché il draft le modifica in sessione
+        modello = modello_locale()
+        return modello.rose.copy(), modello.leghe, modello.quot, modello.esclusi
     except Exception as e:
         st.error(f"Errore caricamento: {e}")
         return None, None, None, None
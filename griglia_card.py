@@ -0,0 +1,45 @@
+import threading
+
+from riepilogo_squadre import impronta_dati
+
+# --- GRIGLIA DELLE CARD ---
+# Le dashboard disegnavano ogni card squadra con un suo st.markdown dentro
+# st.columns: 40 e più elementi spediti al browser a ogni rerun. Qui le card
+# di una lega diventano UN solo blocco HTML (griglia CSS) e il blocco è
+# memorizzato per impronta delle righe della lega: dopo un cambio di widget
+# che non tocca i dati la dashboard rimanda lo stesso testo già pronto.
+#
+# La card resta dell'app (funzione riga -> HTML): qui si compone solo la
+# griglia. Le righe di ogni card vengono compattate, così nessun rientro o
+# riga vuota del template viene letto come markdown.
+
+_griglie = {}
+_lock_griglie = threading.Lock()
+_MAX_GRIGLIE = 32
+
+
+def compatta_html(html):
+    return "".join(riga.strip() for riga in html.splitlines())
+
+
+def html_griglia(righe, card, colonne=1, spazio="0 12px"):
+    """Le card delle righe (DataFrame) in una griglia di 'colonne' colonne."""
+    corpo = "".join(compatta_html(card(r)) for r in righe.to_dict("records"))
+    return (f'<div style="display: grid; grid-template-columns: repeat({colonne}, minmax(0, 1fr)); '
+            f'gap: {spazio};">{corpo}</div>')
+
+
+def griglia_card(righe, card, nome, colonne=1, extra=()):
+    """html_griglia memorizzata per (nome della card, colonne, extra,
+    impronta delle righe). 'nome' identifica il template: cambia nome se
+    cambia la funzione card."""
+    chiave = (nome, colonne, extra, impronta_dati(righe))
+    with _lock_griglie:
+        html = _griglie.get(chiave)
+    if html is None:
+        html = html_griglia(righe, card, colonne)
+        with _lock_griglie:
+            _griglie[chiave] = html
+            while len(_griglie) > _MAX_GRIGLIE:
+                _griglie.pop(next(iter(_griglie)))
+    return html
@@ -0,0 +1,139 @@
+import math
+import threading
+from collections import namedtuple
+
+import pandas as pd
+
+from manifesto_csv import firma_file, leggi_csv
+
+# --- INDICE DEGLI STADI ---
+# Capienza, bonus casa/trasferta e costo di manutenzione di ogni squadra,
+# calcolati una volta per versione di stadi.csv e cercati con un dizionario
+# sul nome squadra (senza spazi, maiuscolo). Sostituisce i filtri
+# df_stadi[df_stadi['Squadra'].str.upper() == ...] ripetuti per ogni partita
+# di una giornata e per ogni rivale.
+
+FILE_STADI = "stadi.csv"
+
+# Manutenzione annua per livello di capienza (migliaia di posti): si usa il
+# livello più vicino alla capienza reale
+LIVELLI_STADIO = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
+MANUTENZIONE_STADIO = {10: 45, 20: 25, 30: 35, 40: 50, 50: 70,
+                       60: 90, 70: 120, 80: 150, 90: 185, 100: 215}
+
+Stadio = namedtuple("Stadio", "capienza bonus_casa bonus_trasferta manutenzione")
+
+_indici = {}
+_lock_indici = threading.Lock()
+_MAX_INDICI = 4
+
+
+def calcola_bonus_stadio(capienza):
+    casa = capienza / 20
+    # Arrotondamento per difetto allo 0.5 più vicino
+    trasferta = math.floor((casa / 2) * 2) / 2
+    return casa, trasferta
+
+
+def costo_manutenzione(capienza):
+    livello_vicino = min(LIVELLI_STADIO, key=lambda x: abs(x - capienza))
+    return MANUTENZIONE_STADIO[livello_vicino]
+
+
+def chiave_stadio(nome):
+    return str(nome).strip().upper()
+
+
+class IndiceStadi:
+    """Stadio di ogni squadra da un stadi.csv già letto (colonne Squadra,
+    Stadio). Le squadre senza riga, o con capienza non numerica, non sono
+    nell'indice: capienza 0, nessun bonus, nessuna manutenzione."""
+
+    def __init__(self, df_stadi, versione=None):
+        self.stadi = {}
+        self.versione = versione
+        self._tabella = None
+        if df_stadi.empty or 'Squadra' not in df_stadi.columns or 'Stadio' not in df_stadi.columns:
+            return
+        capienze = pd.to_numeric(df_stadi['Stadio'], errors='coerce')
+        for squadra, capienza in zip(df_stadi['Squadra'], capienze):
+            chiave = chiave_stadio(squadra)
+            if pd.isna(capienza) or chiave in self.stadi:
+                continue  # a parità di nome vale la prima riga, come con .values[0]
+            casa, trasferta = calcola_bonus_stadio(capienza)
+            self.stadi[chiave] = Stadio(capienza, casa, trasferta, costo_manutenzione(capienza))
+
+    def __contains__(self, squadra):
+        return chiave_stadio(squadra) in self.stadi
+
+    def get(self, squadra):
+        """Stadio della squadra, o None se non è in stadi.csv."""
+        return self.stadi.get(chiave_stadio(squadra))
+
+    def capienza(self, squadra):
+        stadio = self.get(squadra)
+        return stadio.capienza if stadio else 0
+
+    def bonus_casa(self, squadra):
+        stadio = self.get(squadra)
+        return stadio.bonus_casa if stadio else 0.0
+
+    def bonus_trasferta(self, squadra):
+        stadio = self.get(squadra)
+        return stadio.bonus_trasferta if stadio else 0.0
+
+    def manutenzione(self, squadra):
+        stadio = self.get(squadra)
+        return stadio.manutenzione if stadio else 0
+
+    def bonus_partita(self, casa, fuori):
+        """(bonus della squadra di casa, bonus della squadra in trasferta)."""
+        return self.bonus_casa(casa), self.bonus_trasferta(fuori)
+
+    def tabella(self):
+        """L'indice come DataFrame (colonne di Stadio, indice chiave_stadio),
+        per i map vettoriali su intere colonne di squadre."""
+        if self._tabella is None:
+            self._tabella = pd.DataFrame(list(self.stadi.values()), index=list(self.stadi.keys()), columns=Stadio._fields)
+        return self._tabella
+
+    def bonus_colonne(self, casa, fuori):
+        """bonus_partita su due colonne allineate di squadre: (bonus casa,
+        bonus trasferta) come Series float, 0.0 per le squadre senza stadio."""
+        tabella = self.tabella()
+        chiavi_casa = casa.astype(str).str.strip().str.upper()
+        chiavi_fuori = fuori.astype(str).str.strip().str.upper()
+        return (chiavi_casa.map(tabella['bonus_casa']).fillna(0.0).astype(float),
+                chiavi_fuori.map(tabella['bonus_trasferta']).fillna(0.0).astype(float))
+
+
+def indice_stadi(df_stadi, versione):
+    """IndiceStadi condiviso per 'versione' dei dati (es. sha del commit o
+    firma del file); con versione None viene costruito ogni volta."""
+    if versione is None:
+        return IndiceStadi(df_stadi)
+    with _lock_indici:
+        indice = _indici.get(versione)
+    if indice is None:
+        indice = IndiceStadi(df_stadi, versione)
+        with _lock_indici:
+            _indici[versione] = indice
+            while len(_indici) > _MAX_INDICI:
+                _indici.pop(next(iter(_indici)))
+    return indice
+
+
+def indice_stadi_locale(path=FILE_STADI):
+    """Indice dal stadi.csv locale, ricostruito solo se il file cambia."""
+    firma = firma_file(path)
+    if firma is None:
+        return IndiceStadi(pd.DataFrame())
+    with _lock_indici:
+        indice = _indici.get((path, firma))
+    if indice is not None:
+        return indice
+    try:
+        df_stadi = leggi_csv(path)
+    except Exception:
+        df_stadi = pd.DataFrame()
+    return indice_stadi(df_stadi, (path, firma))
@@ -0,0 +1,73 @@
+"""Prepara l'istantanea del modello dati della lega (vedi modello_lega.py).
+
+Legge rose, leghe, listone ed esclusi dalla cartella indicata, costruisce
+df_base e lo scrive come file Feather in .cache_lfm/modelli/<impronta>/,
+dove l'impronta è lo SHA-256 del contenuto dei CSV. Le app mappano
+l'istantanea in memoria all'avvio invece di rileggere e unire i CSV; se i
+dati cambiano la ricostruiscono da sole, questo comando serve a farlo in
+anticipo (es. subito dopo aver aggiornato il listone) e a verificarla.
+
+    python istantanea_lega.py
+    python istantanea_lega.py --forza        # riscrive anche se esiste già
+    python istantanea_lega.py --elenco       # istantanee presenti su disco
+"""
+import argparse
+import os
+import shutil
+import time
+
+import modello_lega
+from modello_lega import (
+    CARTELLA_ISTANTANEE, FILE_ESCLUSI, FILE_LEGHE, FILE_QUOT, FILE_ROSE, TABELLE_MODELLO,
+    carica_istantanea, impronta_contenuto, percorso_istantanea,
+)
+
+
+def elenco():
+    if not os.path.isdir(CARTELLA_ISTANTANEE):
+        print("Nessuna istantanea.")
+        return
+    voci = [v for v in os.listdir(CARTELLA_ISTANTANEE) if not v.endswith(".tmp")]
+    for v in sorted(voci, key=lambda v: os.path.getmtime(os.path.join(CARTELLA_ISTANTANEE, v)), reverse=True):
+        cartella = os.path.join(CARTELLA_ISTANTANEE, v)
+        dimensione = sum(os.path.getsize(os.path.join(cartella, f)) for f in os.listdir(cartella))
+        creata = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(cartella)))
+        print(f"  {v[:16]}  {creata}  {dimensione / 1024:.0f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costruisce l'istantanea Feather del modello dati della lega.")
+    parser.add_argument("--cartella", default=".", help="cartella con i CSV (default: quella corrente)")
+    parser.add_argument("--forza", action="store_true", help="ricostruisce anche se l'istantanea esiste già")
+    parser.add_argument("--elenco", action="store_true", help="elenca le istantanee su disco ed esce")
+    args = parser.parse_args()
+
+    if args.elenco:
+        elenco()
+        return
+
+    percorsi = [os.path.join(args.cartella, f) for f in (FILE_ROSE, FILE_LEGHE, FILE_QUOT, FILE_ESCLUSI)]
+    impronta = impronta_contenuto(percorsi)
+    if args.forza:
+        shutil.rmtree(percorso_istantanea(impronta), ignore_errors=True)
+
+    inizio = time.perf_counter()
+    modello = modello_lega.modello_locale(args.cartella)
+    costruzione = time.perf_counter() - inizio
+
+    inizio = time.perf_counter()
+    mappato = carica_istantanea(impronta)
+    caricamento = time.perf_counter() - inizio
+    if mappato is None:
+        raise SystemExit(f"Istantanea non scritta in {percorso_istantanea(impronta)}")
+
+    print(f"Istantanea {impronta[:16]} in {percorso_istantanea(impronta)}")
+    for nome in TABELLE_MODELLO:
+        print(f"  {nome:<8} {len(getattr(mappato, nome)):>6} righe")
+    print(f"Modello pronto in {costruzione * 1000:.0f} ms · caricamento mappato {caricamento * 1000:.1f} ms")
+    if not mappato.base.equals(modello.base):
+        raise SystemExit("L'istantanea non coincide con il modello costruito dai CSV")
+
+
+if __name__ == "__main__":
+    main()
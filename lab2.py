@@ -1,8 +1,13 @@
 import streamlit as st
 import pandas as pd
-import math
 import os
-import re
+from calendari import compila_calendario
+from classifiche import classifiche
+from griglia_card import griglia_card
+from indice_stadi import indice_stadi_locale
+from manifesto_csv import leggi_csv
+from modello_lega import modello_locale
+from riepilogo_squadre import riepilogo_lega, riepilogo_squadre
 
 st.set_page_config(page_title="LFM Dashboard - Golden Edition", layout="wide", page_icon="⚖️")
 
@@ -12,20 +17,37 @@ MAPPATURA_COLORI = {"Serie A": "#00529b", "Bundesliga": "#d3010c", "Premier Leag
 ORDINE_RUOLI = {'P': 0, 'D': 1, 'C': 2, 'A': 3}
 
 # --- FUNZIONI UTILITY ---
-def natural_sort_key(s):
-    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
-
-def calculate_stadium_bonus(capienza):
-    casa = capienza / 20
-    trasferta = math.floor((casa / 2) * 2) / 2
-    return casa, trasferta
-
 def format_num(num):
     try:
         if num == int(num): return str(int(num))
         return str(round(num, 1))
     except: return str(num)
 
+def card_squadra(sq):
+    """HTML della card di una squadra in dashboard (una riga di riepilogo_squadre)"""
+    cap_txt = f"{int(sq['Capienza'])}k" if sq['Capienza'] > 0 else "N.D."
+    color_ng = "#ff4b4b" if sq['NG'] < 25 or sq['NG'] > 35 else "#00ff00"
+    txt_svinc = f"✈️ {sq['Svincolati']}" if sq['Svincolati'] else ""
+    txt_tagli = f"✂️ {sq['Tagliati']}" if sq['Tagliati'] else ""
+    return f"""<div style="background-color: {MAPPATURA_COLORI.get(sq['Lega'])}; padding: 15px; border-radius: 10px; margin-bottom: 12px; color: white; border: 1px solid rgba(255,255,255,0.1);">
+        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 5px;">
+            <b style="font-size: 18px;">{sq['Squadra_LFM']}</b> 
+            <span style="font-size:12px; background: rgba(0,0,0,0.2); padding: 2px 6px; border-radius: 4px;">🏟️ {cap_txt}</span>
+        </div>
+        <div style="display: flex; justify-content: space-between; align-items: baseline;">
+            <div style="font-size:22px; font-weight:bold;">{format_num(sq['Totale_Cr'])} <small style="font-size:12px;">cr residui</small></div>
+            <div style="font-size:14px; font-weight:bold; color: {color_ng};">({int(sq['NG'])} gioc.)</div>
+        </div>
+        <div style="margin-top: 8px; padding-top: 8px; border-top: 1px solid rgba(255,255,255,0.2); display: flex; justify-content: space-between; font-size:11px; opacity:0.9;">
+            <span>📊 FVM: <b>{format_num(sq['FVM_Tot'])}</b></span>
+            <span>💰 Quot: <b>{format_num(sq['Quot_Tot'])}</b></span>
+        </div>
+        <div style="margin-top: 10px; padding: 10px; background: rgba(0,0,0,0.2); border-radius: 8px; font-size: 15px; line-height: 1.5;">
+            <div style="color: #ffeb3b; font-weight: bold;">{txt_svinc}</div>
+            <div style="color: #ffffff; font-weight: 500; opacity: 0.9;">{txt_tagli}</div>
+        </div>
+    </div>"""
+
 def fix_league_names(df):
     if 'Lega' in df.columns:
         df['Lega'] = df['Lega'].replace(['Lega A', 'nan', 'Da Assegnare', None], 'Serie A')
@@ -33,44 +55,34 @@ def fix_league_names(df):
     return df
 
 # --- 1. CARICAMENTO DATI ---
-@st.cache_data
 def load_static_data():
-    for enc in ['latin1', 'cp1252', 'utf-8']:
-        try:
-            df_rose = pd.read_csv('fantamanager-2021-rosters.csv', header=None, skiprows=1, encoding=enc)
-            df_rose.columns = ['Squadra_LFM', 'Id', 'Prezzo_Asta']
-            df_quot = pd.read_csv('quot.csv', encoding=enc)
-            df_rose['Id'] = pd.to_numeric(df_rose['Id'], errors='coerce')
-            df_quot['Id'] = pd.to_numeric(df_quot['Id'], errors='coerce')
-            df_rose = df_rose.dropna(subset=['Id'])
-            df_owned = pd.merge(df_rose, df_quot, on='Id', how='left')
-            df_owned['Nome'] = df_owned['Nome'].fillna("ID: " + df_owned['Id'].astype(int, errors='ignore').astype(str))
-            df_owned['Qt.I'] = pd.to_numeric(df_owned['Qt.I'], errors='coerce').fillna(0)
-            df_owned['FVM'] = pd.to_numeric(df_owned['FVM'], errors='coerce').fillna(0)
-            df_owned['Squadra_LFM'] = df_owned['Squadra_LFM'].str.strip()
-            df_owned['Rimborso_Star'] = df_owned['FVM'] + (df_owned['Qt.I'] / 2)
-            df_owned['Rimborso_Taglio'] = (df_owned['FVM'] + df_owned['Qt.I']) / 2
-            return df_owned, df_quot
-        except: continue
-    return None, None
+    # Rose × listone × esclusi dal modello condiviso (modello_lega.py), ricostruito
+    # solo quando cambiano i CSV. Lega e crediti arrivano dopo da leghe.csv in sessione.
+    modello = modello_locale()
+    if modello.base.empty:
+        return None, None
+    df_owned = modello.base.drop(columns=['Lega', 'Crediti'])
+    df_owned['Rimborso_Star'] = df_owned['R_Star']
+    df_owned['Rimborso_Taglio'] = df_owned['R_Taglio']
+    return df_owned, modello.quot
 
 # --- 2. GESTIONE STATO ---
 if 'refunded_ids' not in st.session_state:
     try:
-        db_p = pd.read_csv('database_lfm.csv')
+        db_p = leggi_csv('database_lfm.csv')
         st.session_state.refunded_ids = set(db_p['Id'].tolist())
     except: st.session_state.refunded_ids = set()
 
 if 'tagli_map' not in st.session_state:
     try:
-        db_t = pd.read_csv('database_tagli.csv')
+        db_t = leggi_csv('database_tagli.csv')
         db_t['Key'] = db_t['Id'].astype(str) + "_" + db_t['Squadra'].astype(str)
         st.session_state.tagli_map = set(db_t['Key'].tolist())
     except: st.session_state.tagli_map = set()
 
 if 'df_leghe_full' not in st.session_state:
     try:
-        df_temp = pd.read_csv('leghe.csv', encoding='latin1')
+        df_temp = leggi_csv('leghe.csv')
         df_temp['Squadra'] = df_temp['Squadra'].str.strip()
         df_temp['Crediti'] = pd.to_numeric(df_temp['Crediti'], errors='coerce').fillna(0)
         st.session_state.df_leghe_full = fix_league_names(df_temp)
@@ -78,19 +90,18 @@ if 'df_leghe_full' not in st.session_state:
         st.session_state.df_leghe_full = pd.DataFrame(columns=['Squadra', 'Lega', 'Crediti'])
 
 try:
-    df_stadi = pd.read_csv('stadi.csv', encoding='latin1')
+    df_stadi = leggi_csv('stadi.csv')
     df_stadi['Squadra'] = df_stadi['Squadra'].str.strip()
     df_stadi['Stadio'] = pd.to_numeric(df_stadi['Stadio'], errors='coerce').fillna(0)
 except: 
     df_stadi = pd.DataFrame(columns=['Squadra', 'Stadio'])
+stadi = indice_stadi_locale()
 
 df_base, df_all_quot = load_static_data()
 
 if df_base is not None:
     leghe_pulite = st.session_state.df_leghe_full.copy()
     leghe_pulite['Squadra_Key'] = leghe_pulite['Squadra'].str.strip().str.upper()
-    df_base['Squadra_Key'] = df_base['Squadra_LFM'].str.strip().str.upper()
-    if 'Lega' in df_base.columns: df_base = df_base.drop(columns=['Lega', 'Crediti'], errors='ignore')
     df_base = pd.merge(df_base, leghe_pulite.drop(columns=['Squadra']), on='Squadra_Key', how='left')
     df_base['Rimborsato_Star'] = df_base['Id'].isin(st.session_state.refunded_ids)
     df_base['Taglio_Key'] = df_base['Id'].astype(int).astype(str) + "_" + df_base['Squadra_LFM'].astype(str)
@@ -101,46 +112,14 @@ if df_base is not None:
     # --- 🏠 DASHBOARD ---
     if menu == "🏠 Dashboard":
         st.title("🏠 Dashboard Riepilogo")
-        leghe_eff = [l for l in ORDINE_LEGHE if l in df_base['Lega'].dropna().unique()]
+        riepilogo = riepilogo_squadre(df_base, stadi=stadi)
+        leghe_eff = [l for l in ORDINE_LEGHE if l in riepilogo['Lega'].values]
         cols = st.columns(2)
         for i, lega_nome in enumerate(leghe_eff):
             with cols[i % 2]:
-                df_l = df_base[df_base['Lega'] == lega_nome]
-                df_attivi = df_l[~(df_l['Rimborsato_Star']) & ~(df_l['Rimborsato_Taglio'])]
-                att_stats = df_attivi.groupby('Squadra_LFM').agg({'Nome': 'count', 'FVM': 'sum', 'Qt.I': 'sum'}).rename(columns={'Nome': 'NG', 'FVM': 'FVM_Tot', 'Qt.I': 'Quot_Tot'}).reset_index()
-                res_star = df_l[df_l['Rimborsato_Star']].groupby('Squadra_LFM').agg({'Rimborso_Star':'sum', 'Nome': lambda x: ", ".join(x)}).reset_index()
-                res_tagli = df_l[df_l['Rimborsato_Taglio']].groupby('Squadra_LFM').agg({'Rimborso_Taglio':'sum', 'Nome': lambda x: ", ".join(x)}).reset_index()
-                tabella = pd.merge(df_l[['Squadra_LFM', 'Crediti']].drop_duplicates(), res_star, on='Squadra_LFM', how='left').fillna(0)
-                tabella = pd.merge(tabella, res_tagli.rename(columns={'Nome':'N_T'}), on='Squadra_LFM', how='left').fillna(0)
-                tabella = pd.merge(tabella, att_stats, on='Squadra_LFM', how='left').fillna(0)
-                tabella['Totale_Cr'] = tabella['Crediti'] + tabella['Rimborso_Star'] + tabella['Rimborso_Taglio']
-                
+                tabella = riepilogo_lega(riepilogo, lega_nome)
                 st.markdown(f"### 🏆 {lega_nome}")
-                for _, sq in tabella.sort_values(by='Squadra_LFM').iterrows():
-                    cap = df_stadi[df_stadi['Squadra'].str.strip().str.upper() == sq['Squadra_LFM'].strip().upper()]['Stadio'].values
-                    cap_txt = f"{int(cap[0])}k" if len(cap)>0 and cap[0] > 0 else "N.D."
-                    color_ng = "#ff4b4b" if sq['NG'] < 25 or sq['NG'] > 35 else "#00ff00"
-                    txt_svinc = f"✈️ {sq['Nome']}" if sq['Nome'] != 0 else ""
-                    txt_tagli = f"✂️ {sq['N_T']}" if sq['N_T'] != 0 else ""
-                    
-                    st.markdown(f"""<div style="background-color: {MAPPATURA_COLORI.get(lega_nome)}; padding: 15px; border-radius: 10px; margin-bottom: 12px; color: white; border: 1px solid rgba(255,255,255,0.1);">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 5px;">
-                            <b style="font-size: 18px;">{sq['Squadra_LFM']}</b> 
-                            <span style="font-size:12px; background: rgba(0,0,0,0.2); padding: 2px 6px; border-radius: 4px;">🏟️ {cap_txt}</span>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; align-items: baseline;">
-                            <div style="font-size:22px; font-weight:bold;">{format_num(sq['Totale_Cr'])} <small style="font-size:12px;">cr residui</small></div>
-                            <div style="font-size:14px; font-weight:bold; color: {color_ng};">({int(sq['NG'])} gioc.)</div>
-                        </div>
-                        <div style="margin-top: 8px; padding-top: 8px; border-top: 1px solid rgba(255,255,255,0.2); display: flex; justify-content: space-between; font-size:11px; opacity:0.9;">
-                            <span>📊 FVM: <b>{format_num(sq['FVM_Tot'])}</b></span>
-                            <span>💰 Quot: <b>{format_num(sq['Quot_Tot'])}</b></span>
-                        </div>
-                        <div style="margin-top: 10px; padding: 10px; background: rgba(0,0,0,0.2); border-radius: 8px; font-size: 15px; line-height: 1.5;">
-                            <div style="color: #ffeb3b; font-weight: bold;">{txt_svinc}</div>
-                            <div style="color: #ffffff; font-weight: 500; opacity: 0.9;">{txt_tagli}</div>
-                        </div>
-                    </div>""", unsafe_allow_html=True)
+                st.markdown(griglia_card(tabella, card_squadra, "lab2"), unsafe_allow_html=True)
 
     # --- 🗓️ CALENDARI CAMPIONATI ---
     elif menu == "🗓️ Calendari Campionati":
@@ -148,22 +127,14 @@ if df_base is not None:
         files = [f for f in os.listdir('.') if f.startswith("Calendario_") and all(x not in f.upper() for x in ["CHAMPIONS", "EUROPA", "PRELIMINARI"]) and f.endswith(".csv")]
         if files:
             camp = st.selectbox("Seleziona:", files)
-            df_c = pd.read_csv(camp, header=None, encoding='latin1').fillna("")
-            g_pos = [(str(df_c.iloc[r, c]).strip(), r, c) for c in [0, 6] for r in range(len(df_c)) if "Giornata" in str(df_c.iloc[r, c]) and "serie a" not in str(df_c.iloc[r, c]).lower()]
-            if g_pos:
-                sel_g = st.selectbox("Giornata:", sorted(list(set([x[0] for x in g_pos])), key=natural_sort_key))
+            cal = compila_calendario(camp)
+            if len(cal):
+                sel_g = st.selectbox("Giornata:", cal.giornate())
+                view = cal.giornata(sel_g)
                 res = []
-                for _, r, c in [x for x in g_pos if x[0] == sel_g]:
-                    for i in range(1, 11):
-                        if r+i < len(df_c):
-                            row = df_c.iloc[r+i]
-                            if "Giornata" in str(row[c]): break
-                            h, a = str(row[c]).strip(), str(row[c+3]).strip()
-                            if not h or h == "nan" or len(h) < 2: continue
-                            cap_h = df_stadi[df_stadi['Squadra'].str.strip().str.upper() == h.upper()]['Stadio'].values[0] if h.upper() in df_stadi['Squadra'].str.upper().values else 0
-                            cap_a = df_stadi[df_stadi['Squadra'].str.strip().str.upper() == a.upper()]['Stadio'].values[0] if a.upper() in df_stadi['Squadra'].str.upper().values else 0
-                            bh, _ = calculate_stadium_bonus(cap_h); _, ba = calculate_stadium_bonus(cap_a)
-                            res.append({"Casa": h, "Fuori": a, "Bonus Casa": f"+{format_num(bh)}", "Bonus Fuori": f"+{format_num(ba)}"})
+                for h, a in view.loc[~view['Riposa'] & (view['Casa'].str.len() >= 2), ['Casa', 'Fuori']].itertuples(index=False):
+                    bh, ba = stadi.bonus_partita(h, a)
+                    res.append({"Casa": h, "Fuori": a, "Bonus Casa": f"+{format_num(bh)}", "Bonus Fuori": f"+{format_num(ba)}"})
                 st.table(pd.DataFrame(res))
 
     elif menu == "🏆 Coppe e Preliminari":
@@ -181,51 +152,18 @@ if df_base is not None:
 
         if os.path.exists(nome_file):
             try:
-                # Lettura file
-                df_raw = pd.read_csv(nome_file, header=None, encoding='ISO-8859-1', dtype=str).fillna("")
-                
-                partite_pulite = []
-                g_sx, g_dx = "", ""
-
-                for i in range(len(df_raw)):
-                    r = [str(x).strip() for x in df_raw.iloc[i].tolist()]
-
-                    # Identificazione Giornate
-                    if len(r) > 0 and "Giornata" in r[0]: g_sx = r[0].split(" lega")[0]
-                    if len(r) > 7 and "Giornata" in r[7]: g_dx = r[7].split(" lega")[0]
-
-                    # Estrazione Sinistra
-                    if len(r) > 4:
-                        casa_s, fuori_s = r[1], r[4]
-                        if casa_s != "" and fuori_s != "" and "Giornata" not in casa_s and r[0] != "Girone":
-                            partite_pulite.append({"G": g_sx if g_sx else "Gironi", "Girone": r[0], "Casa": casa_s, "Fuori": fuori_s})
-
-                    # Estrazione Destra
-                    if len(r) > 11:
-                        casa_d, fuori_d = r[8], r[11]
-                        if casa_d != "" and fuori_d != "" and "Giornata" not in casa_d:
-                            partite_pulite.append({"G": g_dx if g_dx else "Gironi", "Girone": r[7], "Casa": casa_d, "Fuori": fuori_d})
-
-                if partite_pulite:
-                    df_final = pd.DataFrame(partite_pulite)
-                    
-                    # Rimuove eventuali righe identiche caricate per errore
-                    df_final = df_final.drop_duplicates()
+                cal = compila_calendario(nome_file)
 
-                    giornate_disp = sorted(df_final['G'].unique(), key=natural_sort_key)
-                    sel_g = st.selectbox("Seleziona Giornata:", giornate_disp)
-                    
-                    view = df_final[df_final['G'] == sel_g]
+                if cal.giornate():
+                    sel_g = st.selectbox("Seleziona Giornata:", cal.giornate(), format_func=lambda g: g.split(" lega")[0])
+                    view = cal.giornata(sel_g)
+                    # Rimuove eventuali righe identiche caricate per errore
+                    view = view[~view['Riposa']].drop_duplicates(['Girone', 'Casa', 'Fuori'])
                     res = []
                     
                     for _, row in view.iterrows():
                         # Calcolo Bonus
-                        c_up, f_up = row['Casa'].upper(), row['Fuori'].upper()
-                        cap_h = df_stadi[df_stadi['Squadra'].str.upper() == c_up]['Stadio'].values[0] if c_up in df_stadi['Squadra'].str.upper().values else 0
-                        cap_a = df_stadi[df_stadi['Squadra'].str.upper() == f_up]['Stadio'].values[0] if f_up in df_stadi['Squadra'].str.upper().values else 0
-                        
-                        bh, _ = calculate_stadium_bonus(cap_h)
-                        _, ba = calculate_stadium_bonus(cap_a)
+                        bh, ba = stadi.bonus_partita(row['Casa'], row['Fuori'])
                         
                         # Creazione colonne separate
                         res.append({
@@ -269,9 +207,10 @@ if df_base is not None:
         df_pros = pd.merge(df_pros, res_june, on='Squadra_Key', how='left').fillna(0)
         df_pros = pd.merge(df_pros, res_sept, on='Squadra_Key', how='left').fillna(0)
         
-        # Inizializzazione parametri input
+        # Inizializzazione parametri input (posizione dalla classifica dei calendari, se la squadra c'è)
         if 'input_finanze' not in st.session_state:
-            st.session_state.input_finanze = {sq: {"pos": 1, "coppa": "Nessuna", "mercato": 0.0} for sq in st.session_state.df_leghe_full['Squadra']}
+            posizioni = classifiche().posizioni()
+            st.session_state.input_finanze = {sq: {"pos": int(posizioni.get(str(sq).strip().upper(), 1)), "coppa": "Nessuna", "mercato": 0.0} for sq in st.session_state.df_leghe_full['Squadra']}
         
         st.subheader("📝 Configurazione Premi e Risultati")
         
@@ -416,7 +355,7 @@ if df_base is not None:
     elif menu == "🟢 Giocatori Liberi":
         st.title("🟢 Calciatori Liberi")
         try:
-            df_esc = pd.read_csv('esclusi.csv', sep='\t', header=None)
+            df_esc = leggi_csv('esclusi.csv', header=None)
             ids_esc = set(pd.to_numeric(df_esc[0], errors='coerce').dropna().astype(int))
         except: ids_esc = set()
         ids_occ = set(df_base['Id'])
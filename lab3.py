@@ -2,49 +2,26 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import math
+from modello_lega import modello_locale
 
 st.set_page_config(page_title="LFM Mercato Pro", layout="wide", page_icon="🏃")
 
 # --- CARICAMENTO E PULIZIA DATI ---
-@st.cache_data
 def load_all_data():
     try:
-        # Caricamento file con codifica corretta
-        df_r = pd.read_csv('fantamanager-2021-rosters.csv', encoding='latin1')
-        df_l = pd.read_csv('leghe.csv', encoding='latin1')
-        df_q = pd.read_csv('quot.csv', encoding='latin1')
-        # Esclusi usa il TAB come separatore
-        df_e = pd.read_csv('esclusi.csv', sep='\t', encoding='latin1')
+        # Rose × leghe × listone × esclusi dal modello condiviso (modello_lega.py)
+        modello = modello_locale()
+        df = modello.base.copy()
+        df['In_Esclusi'] = df['Is_Escluso']
 
-        # Pulizia ID: forziamo a numeri interi e rimuoviamo errori
-        for d in [df_r, df_q, df_e]:
-            d['Id'] = pd.to_numeric(d['Id'], errors='coerce').fillna(0).astype(int)
-        
-        # Pulizia Valori Economici
-        df_q['Qt.I'] = pd.to_numeric(df_q['Qt.I'], errors='coerce').fillna(0)
-        df_q['FVM'] = pd.to_numeric(df_q['FVM'], errors='coerce').fillna(0)
-
-        # Merge Rose + Leghe
-        df = pd.merge(df_r, df_l, left_on='Squadra_LFM', right_on='Squadra', how='left')
-        
-        # Merge con Listone (per Nome, Ruolo, Qt.I, FVM)
-        df = pd.merge(df, df_q[['Id', 'Nome', 'R', 'Qt.I', 'FVM']], on='Id', how='left')
-
-        # Identificazione Giocatori Asteriscati (Presenti in esclusi.csv)
-        ids_esclusi = set(df_e['Id'])
-        df['In_Esclusi'] = df['Id'].isin(ids_esclusi)
-
-        # --- APPLICAZIONE FORMULE RICHIESTE ---
-        # Svincolo (*): FVM + (Qt.I / 2)
-        df['Rimb_Star'] = np.ceil(df['FVM'] + (df['Qt.I'] / 2)).astype(int)
-        
-        # Taglio Volontario: (FVM / 2) + (Qt.I / 2) -> ovvero (FVM + Qt.I) / 2
-        df['Rimb_Taglio'] = np.ceil((df['FVM'] + df['Qt.I']) / 2).astype(int)
+        # Svincolo (*): FVM + (Qt.I / 2), taglio: (FVM + Qt.I) / 2, per eccesso
+        df['Rimb_Star'] = df['R_Star']
+        df['Rimb_Taglio'] = df['R_Taglio']
 
         # Chiave tecnica univoca per i tagli
         df['Taglio_Key'] = df['Id'].astype(str) + "_" + df['Squadra_LFM'].astype(str)
 
-        return df, df_l
+        return df, modello.leghe
     except Exception as e:
         st.error(f"Errore critico caricamento dati: {e}")
         return None, None
@@ -152,59 +129,22 @@ import re
 
 st.set_page_config(page_title="LFM Mercato - Fix Ufficiale", layout="wide", page_icon="⚖️")
 
-# --- FUNZIONI UTILITY ---
-def fix_league_names(df):
-    if 'Lega' in df.columns:
-        df['Lega'] = df['Lega'].replace(['Lega A', 'nan', 'Da Assegnare', None, 0], 'Serie A')
-    return df
-
 # --- CARICAMENTO DATI (LOGICA BLINDATA) ---
-@st.cache_data
 def load_data():
     try:
-        # Caricamento file CSV
-        df_r = pd.read_csv('fantamanager-2021-rosters.csv', encoding='latin1')
-        df_l = pd.read_csv('leghe.csv', encoding='latin1')
-        df_q = pd.read_csv('quot.csv', encoding='latin1')
-        
-        # Pulizia ID iniziali
-        df_r['Id'] = pd.to_numeric(df_r['Id'], errors='coerce').fillna(0).astype(int)
-        df_q['Id'] = pd.to_numeric(df_q['Id'], errors='coerce').fillna(0).astype(int)
-        
-        # Caricamento file esclusi (TAB separated)
-        try:
-            df_e = pd.read_csv('esclusi.csv', sep='\t', encoding='latin1')
-            id_col = 'Id' if 'Id' in df_e.columns else df_e.columns[0]
-            ids_esclusi = set(pd.to_numeric(df_e[id_col], errors='coerce').dropna().astype(int))
-        except:
-            ids_esclusi = set()
+        # Rose × leghe × listone × esclusi dal modello condiviso (modello_lega.py)
+        modello = modello_locale()
+        df_final = modello.base.copy()
+        df_final['In_Esclusi'] = df_final['Is_Escluso']
 
-        # Unione Rose + Leghe
-        df_merged = pd.merge(df_r, df_l, left_on='Squadra_LFM', right_on='Squadra', how='left')
-        df_merged = fix_league_names(df_merged)
+        # Svincoli (*): FVM + (Qt.I / 2), tagli: (FVM + Qt.I) / 2, per eccesso
+        df_final['Rimborso_Star'] = df_final['R_Star']
+        df_final['Rimborso_Taglio'] = df_final['R_Taglio']
 
-        # Unione con Quotazioni (per Nome, R, Qt.I, FVM)
-        df_final = pd.merge(df_merged, df_q[['Id', 'Nome', 'R', 'Qt.I', 'FVM']], on='Id', how='left')
-        
-        # --- SOLUZIONE AL VALUENERROR (NA or inf) ---
-        # Forza Qt.I e FVM a essere numerici e sostituisce i NaN con 0
-        df_final['Qt.I'] = pd.to_numeric(df_final['Qt.I'], errors='coerce').fillna(0)
-        df_final['FVM'] = pd.to_numeric(df_final['FVM'], errors='coerce').fillna(0)
-        
-        # Identificazione Asteriscati (*)
-        df_final['In_Esclusi'] = df_final['Id'].isin(ids_esclusi)
-        
-        # --- LE TUE FORMULE ORIGINALI (lab3(3).py Righe 52-53) ---
-        # Svincoli (*): FVM + (Qt.I / 2) -> Arrotondato per eccesso
-        df_final['Rimborso_Star'] = np.ceil(df_final['FVM'] + (df_final['Qt.I'] / 2)).astype(int)
-        
-        # Tagli Volontari: (FVM + Qt.I) / 2 -> Arrotondato per eccesso
-        df_final['Rimborso_Taglio'] = np.ceil((df_final['FVM'] + df_final['Qt.I']) / 2).astype(int)
-        
         # Chiave univoca per i tagli
         df_final['Taglio_Key'] = df_final['Id'].astype(str) + "_" + df_final['Squadra_LFM'].astype(str)
-        
-        return df_final, df_l, df_q
+
+        return df_final, modello.leghe, modello.quot
     except Exception as e:
         st.error(f"Errore nel caricamento: {e}")
         return None, None, None
@@ -238,7 +178,7 @@ if data and data[0] is not None:
             ed_star = st.data_editor(
                 df_star[['Id', 'Rimborsato_Star', 'Nome', 'Squadra_LFM', 'FVM', 'Qt.I', 'Rimborso_Star']], 
                 hide_index=True,
-                column_config={"Id": st.column_config.Column(hidden=True)},
+                column_config={"Id": None},
                 key="ed_svincoli"
             )
             if st.button("Conferma Svincoli (*)"):
@@ -258,7 +198,7 @@ if data and data[0] is not None:
             ed_taglio = st.data_editor(
                 df_t_list[['Taglio_Key', 'Rimborsato_Taglio', 'Nome', 'Squadra_LFM', 'FVM', 'Qt.I', 'Rimborso_Taglio']], 
                 hide_index=True,
-                column_config={"Taglio_Key": st.column_config.Column(hidden=True)},
+                column_config={"Taglio_Key": None},
                 key="ed_tagli"
             )
             if st.button("Conferma Tagli"):
@@ -1,69 +1,51 @@
 import streamlit as st
 import pandas as pd
-import math
 import os
-import re
+from calendari import compila_calendario
+from griglia_card import griglia_card
+from indice_stadi import indice_stadi_locale
+from manifesto_csv import leggi_csv
+from modello_lega import modello_locale
+from riepilogo_squadre import riepilogo_lega, riepilogo_squadre
 
 st.set_page_config(page_title="LFM Manager - Pro Edition", layout="wide", page_icon="⚖️")
 
-# --- FUNZIONE PER ORDINAMENTO NATURALE (1, 2, 10 invece di 1, 10, 2) ---
-def natural_sort_key(s):
-    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
-
 # --- 1. CARICAMENTO DATI BASE ---
-@st.cache_data
 def load_static_data():
-    try:
-        # Caricamento rose e quotazioni con codifica latin1
-        df_rose = pd.read_csv('fantamanager-2021-rosters.csv', header=None, skiprows=1, encoding='latin1')
-        df_rose.columns = ['Squadra_LFM', 'Id', 'Prezzo_Asta']
-        df_quot = pd.read_csv('quot.csv', encoding='latin1')
-        df_rose['Id'] = pd.to_numeric(df_rose['Id'], errors='coerce')
-        df_quot['Id'] = pd.to_numeric(df_quot['Id'], errors='coerce')
-        df_rose = df_rose.dropna(subset=['Id'])
-        df_owned = pd.merge(df_rose, df_quot, on='Id', how='left')
-        df_owned['Nome'] = df_owned['Nome'].fillna("ID: " + df_owned['Id'].astype(int, errors='ignore').astype(str))
-        df_owned['Qt.I'] = pd.to_numeric(df_owned['Qt.I'], errors='coerce').fillna(0)
-        df_owned['FVM'] = pd.to_numeric(df_owned['FVM'], errors='coerce').fillna(0)
-        df_owned['Squadra_LFM'] = df_owned['Squadra_LFM'].str.strip()
-        
-        # Calcolo Rimborsi
-        df_owned['Rimborso_Star'] = df_owned['FVM'] + (df_owned['Qt.I'] / 2)
-        df_owned['Rimborso_Taglio'] = (df_owned['FVM'] + df_owned['Qt.I']) / 2
-        
-        return df_owned, df_quot
-    except: return None, None
-
-def calculate_stadium_bonus(capienza):
-    casa = capienza / 20
-    # Arrotondamento per difetto allo 0.5 più vicino
-    trasferta = math.floor((casa / 2) * 2) / 2
-    return casa, trasferta
+    # Rose × listone × esclusi dal modello condiviso (modello_lega.py)
+    modello = modello_locale()
+    if modello.base.empty:
+        return None, None
+    df_owned = modello.base.drop(columns=['Lega', 'Crediti'])
+    df_owned['Rimborso_Star'] = df_owned['R_Star']
+    df_owned['Rimborso_Taglio'] = df_owned['R_Taglio']
+    return df_owned, modello.quot
 
 # --- 2. GESTIONE SESSIONE & FILE ---
 if 'refunded_ids' not in st.session_state:
     try:
-        db_p = pd.read_csv('database_lfm.csv')
+        db_p = leggi_csv('database_lfm.csv')
         st.session_state.refunded_ids = set(db_p['Id'].tolist())
     except: st.session_state.refunded_ids = set()
 
 if 'tagli_map' not in st.session_state:
     try:
-        db_t = pd.read_csv('database_tagli.csv')
+        db_t = leggi_csv('database_tagli.csv')
         db_t['Key'] = db_t['Id'].astype(str) + "_" + db_t['Squadra'].astype(str)
         st.session_state.tagli_map = set(db_t['Key'].tolist())
     except: st.session_state.tagli_map = set()
 
 # Caricamento Leghe e Stadi
 try:
-    df_leghe = pd.read_csv('leghe.csv', encoding='latin1')
+    df_leghe = leggi_csv('leghe.csv')
     df_leghe['Squadra'] = df_leghe['Squadra'].str.strip()
 except: df_leghe = pd.DataFrame(columns=['Squadra', 'Lega', 'Crediti'])
 
 try:
-    df_stadi = pd.read_csv('stadi.csv', encoding='latin1')
+    df_stadi = leggi_csv('stadi.csv')
     df_stadi['Squadra'] = df_stadi['Squadra'].str.strip()
 except: df_stadi = pd.DataFrame(columns=['Squadra', 'Lega', 'Stadio'])
+stadi = indice_stadi_locale()
 
 # --- 3. COSTRUZIONE INTERFACCIA ---
 df_base, df_all_quot = load_static_data()
@@ -91,34 +73,26 @@ if df_base is not None:
         ORDINE_LEGHE = ["Serie A", "Bundesliga", "Premier League", "Liga BBVA"]
         MAPPATURA_COLORI = {"Serie A": "#00529b", "Bundesliga": "#d3010c", "Premier League": "#3d195b", "Liga BBVA": "#ee8707"}
         
-        leghe_presenti = [l for l in ORDINE_LEGHE if l in df_base['Lega'].values]
+        def card_squadra(sq):
+            n_g = int(sq['NG'])
+            col_alert = "#81c784" if 25 <= n_g <= 35 else "#ef5350"
+            return f"""<div style="background-color: {MAPPATURA_COLORI.get(sq['Lega'], '#333')}; padding: 12px; border-radius: 10px; margin-bottom: 8px; color: white; border: 1px solid rgba(255,255,255,0.1);">
+                <div style="display: flex; justify-content: space-between; align-items: center;">
+                    <b>{sq['Squadra_LFM']}</b>
+                    <span style="background:{col_alert}; padding:1px 8px; border-radius:8px; font-size:10px;">🏃 {n_g}/25-35</span>
+                </div>
+                <div style="font-size:18px; font-weight:bold;">{int(sq['Totale_Cr'])} <small style="font-size:10px;">cr</small></div>
+            </div>"""
+
+        riepilogo = riepilogo_squadre(df_base)
+        leghe_presenti = [l for l in ORDINE_LEGHE if l in riepilogo['Lega'].values]
         cols = st.columns(2)
         
         for i, nome_lega in enumerate(leghe_presenti):
             with cols[i % 2]:
-                df_l = df_base[df_base['Lega'] == nome_lega]
-                res_star = df_l[df_l['Rimborsato_Star']].groupby('Squadra_LFM').agg({'Rimborso_Star':'sum'}).reset_index()
-                res_tagli = df_l[df_l['Rimborsato_Taglio']].groupby('Squadra_LFM').agg({'Rimborso_Taglio':'sum'}).reset_index()
-                attivi = df_l[~(df_l['Rimborsato_Star']) & ~(df_l['Rimborsato_Taglio'])].groupby('Squadra_LFM').size().reset_index(name='NG')
-                
-                tabella = pd.merge(df_l[['Squadra_LFM', 'Crediti']].drop_duplicates(), res_star, on='Squadra_LFM', how='left').fillna(0)
-                tabella = pd.merge(tabella, res_tagli, on='Squadra_LFM', how='left').fillna(0)
-                tabella = pd.merge(tabella, attivi, on='Squadra_LFM', how='left').fillna(0)
-                tabella['Totale'] = tabella['Crediti'] + tabella['Rimborso_Star'] + tabella['Rimborso_Taglio']
-                
-                st.markdown(f"### 🏆 {nome_lega} (Media: {int(tabella['Totale'].mean())} cr)")
-                bg_color = MAPPATURA_COLORI.get(nome_lega, "#333")
-                
-                for _, sq in tabella.sort_values(by='Squadra_LFM').iterrows():
-                    n_g = int(sq['NG'])
-                    col_alert = "#81c784" if 25 <= n_g <= 35 else "#ef5350"
-                    st.markdown(f"""<div style="background-color: {bg_color}; padding: 12px; border-radius: 10px; margin-bottom: 8px; color: white; border: 1px solid rgba(255,255,255,0.1);">
-                        <div style="display: flex; justify-content: space-between; align-items: center;">
-                            <b>{sq['Squadra_LFM']}</b>
-                            <span style="background:{col_alert}; padding:1px 8px; border-radius:8px; font-size:10px;">🏃 {n_g}/25-35</span>
-                        </div>
-                        <div style="font-size:18px; font-weight:bold;">{int(sq['Totale'])} <small style="font-size:10px;">cr</small></div>
-                    </div>""", unsafe_allow_html=True)
+                tabella = riepilogo_lega(riepilogo, nome_lega)
+                st.markdown(f"### 🏆 {nome_lega} (Media: {int(tabella['Totale_Cr'].mean())} cr)")
+                st.markdown(griglia_card(tabella, card_squadra, "lablfm"), unsafe_allow_html=True)
 
     # --- 🗓️ CALENDARI CAMPIONATI ---
     elif menu == "🗓️ Calendari Campionati":
@@ -132,43 +106,17 @@ if df_base is not None:
             camp_scelto = mappa_nomi[st.selectbox("Seleziona Competizione:", sorted(mappa_nomi.keys()))]
             
             try:
-                df_cal = pd.read_csv(camp_scelto, header=None, encoding='latin1')
-                is_coppa = df_cal.shape[1] > 10
-                col_dx = 7 if is_coppa else 6
-                
-                g_raw = list(set([str(x) for x in df_cal[0].dropna() if "Giornata" in str(x)] + 
-                                 [str(x) for x in df_cal[col_dx].dropna() if "Giornata" in str(x)]))
-                
-                sel_g = st.selectbox("Seleziona Giornata:", sorted(g_raw, key=natural_sort_key))
-                match_list, riposi = [], []
-
-                for r in range(len(df_cal)):
-                    for c in [0, col_dx]:
-                        if str(df_cal.iloc[r, c]) == sel_g:
-                            for i in range(1, 13): 
-                                if r+i < len(df_cal):
-                                    row = df_cal.iloc[r+i]
-                                    if "Giornata" in str(row[c]): break
-                                    
-                                    val_rip = str(row[c+1]) if is_coppa else str(row[c])
-                                    if "Riposa" in val_rip:
-                                        riposi.append(val_rip.strip())
-                                        continue
-
-                                    offset = 1 if is_coppa else 0
-                                    try:
-                                        h, a = str(row[c+offset]).strip(), str(row[c+offset+3]).strip()
-                                        if h == "nan" or a == "nan" or not h: continue
-                                        sh = str(row[c+offset+1]).replace(',','.').replace('"','').strip()
-                                        sa = str(row[c+offset+2]).replace(',','.').replace('"','').strip()
-                                        
-                                        if float(sh) == 0 and float(sa) == 0:
-                                            cap_h = df_stadi[df_stadi['Squadra']==h]['Stadio'].values[0] if h in df_stadi['Squadra'].values else 0
-                                            cap_a = df_stadi[df_stadi['Squadra']==a]['Stadio'].values[0] if a in df_stadi['Squadra'].values else 0
-                                            bh, _ = calculate_stadium_bonus(cap_h)
-                                            _, ba = calculate_stadium_bonus(cap_a)
-                                            match_list.append({"Partita": f"{h} vs {a}", "Bonus Casa": f"+{bh}", "Bonus Fuori": f"+{ba}"})
-                                    except: continue
+                cal = compila_calendario(camp_scelto)
+                sel_g = st.selectbox("Seleziona Giornata:", cal.giornate())
+                view = cal.giornata(sel_g)
+
+                # Solo le partite ancora da giocare (fantapunti entrambi a zero)
+                da_giocare = view[~view['Riposa'] & (view['Punti_Casa'] == 0) & (view['Punti_Fuori'] == 0)]
+                match_list = []
+                for h, a in da_giocare[['Casa', 'Fuori']].itertuples(index=False):
+                    bh, ba = stadi.bonus_partita(h, a)
+                    match_list.append({"Partita": f"{h} vs {a}", "Bonus Casa": f"+{bh}", "Bonus Fuori": f"+{ba}"})
+                riposi = list(view.loc[view['Riposa'], 'Casa'])
 
                 if match_list:
                     st.subheader("🏟️ Partite da giocare e Bonus")
@@ -0,0 +1,122 @@
+import threading
+
+import pandas as pd
+
+from registro_nomi import pulisci_nomi
+
+# --- LIBRO DELLE CLAUSOLE ---
+# Il mercato clausole costruiva la lista di ogni squadra dentro il suo
+# expander: la bozza salvata, oppure (clausole d'ufficio) un filtro di
+# quot.csv sugli Id della rosa più un nlargest(3, 'FVM'), e poi il
+# confronto con la mappa dei proprietari attuali. Un filtro e un top-3 per
+# squadra a ogni rerun.
+#
+# Qui le clausole effettive di tutte le squadre di tutte le leghe escono da
+# un solo passaggio: le bozze salvate (registro_clausole.py) e, per le
+# squadre senza bozza, un unico ordinamento per FVM con il top-3 per
+# squadra. Il risultato è già filtrato sui proprietari attuali: una
+# clausola salvata non si aggiorna da sola quando il giocatore viene
+# comprato, e senza il filtro resterebbe "acquistabile" sotto la squadra
+# vecchia.
+#
+# La mappa dei proprietari è per lega: lo stesso Id (stesso giocatore
+# reale) appartiene legittimamente a squadre diverse in leghe diverse. Il
+# confronto è sugli id interi del registro dei nomi, perché roster e
+# leghe.csv possono scrivere la stessa squadra in modo diverso.
+#
+# Il libro è memorizzato per versione dei dati: la pagina del mercato fa
+# solo un lookup per squadra.
+
+COLONNE_LIBRO = ["Lega", "Squadra", "Id_Squadra", "Id", "Nome", "Valore", "Ufficio"]
+CLAUSOLE_UFFICIO = 3
+
+_libri = {}
+_lock_libri = threading.Lock()
+_MAX_LIBRI = 4
+
+
+def proprietari_per_lega(squadre, rose):
+    """(Lega, Id) -> Id_Squadra del proprietario attuale, come DataFrame.
+    'squadre' ha Lega e Id_Squadra, 'rose' Id (testo) e Id_Squadra; se un
+    Id compare due volte nella stessa lega vale l'ultima riga del roster."""
+    possessi = rose[["Id", "Id_Squadra"]].merge(squadre[["Lega", "Id_Squadra"]].drop_duplicates(), on="Id_Squadra")
+    return possessi.drop_duplicates(["Lega", "Id"], keep="last")
+
+
+def clausole_ufficio(squadre, rose, quot, quante=CLAUSOLE_UFFICIO):
+    """Le 'quante' clausole d'ufficio (valore = FVM) di ogni squadra: i
+    giocatori della rosa con FVM più alto, a pari FVM nell'ordine di
+    quot.csv (come nlargest)."""
+    rose_sq = rose[["Id", "Id_Squadra"]].drop_duplicates()
+    rose_sq = rose_sq[rose_sq["Id_Squadra"].isin(set(squadre["Id_Squadra"]))]
+    quot = quot[quot["FVM"].notna()]
+    candidati = quot[["Id", "Nome", "FVM"]].merge(rose_sq, on="Id")
+    migliori = candidati.sort_values("FVM", ascending=False, kind="stable").groupby("Id_Squadra", sort=False).head(quante)
+    ufficio = squadre[["Lega", "Squadra", "Id_Squadra"]].merge(migliori, on="Id_Squadra")
+    return ufficio.assign(Valore=ufficio["FVM"].astype(int), Ufficio=True)
+
+
+def calcola_libro(df_leghe, df_rose, df_quot, clausole, registro):
+    """Clausole effettive (COLONNE_LIBRO) di tutte le squadre di leghe.csv:
+    bozza salvata (IndiceClausole) o clausole d'ufficio, filtrate sui
+    proprietari attuali. 'registro' è il RegistroNomi dei dati."""
+    if df_leghe.empty or df_rose.empty or "Squadra_LFM" not in df_rose.columns:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_LIBRO})
+    squadre = df_leghe[["Lega", "Squadra"]].assign(Id_Squadra=registro.ids(df_leghe["Squadra"]))
+    rose = pd.DataFrame({"Id": df_rose["Id"].astype(str), "Id_Squadra": registro.ids(df_rose["Squadra_LFM"])})
+    quot = pd.DataFrame({
+        "Id": df_quot["Id"].astype(str),
+        "Nome": pulisci_nomi(df_quot["Nome"]),
+        "FVM": pd.to_numeric(df_quot["FVM"], errors="coerce"),
+    }) if {"Id", "Nome", "FVM"} <= set(df_quot.columns) else pd.DataFrame(columns=["Id", "Nome", "FVM"])
+
+    con_bozza = squadre["Squadra"].isin(set(clausole.squadre()))
+    salvate = squadre[con_bozza].merge(clausole.tabella[["Squadra", "Id", "Nome", "Valore"]], on="Squadra")
+    ufficio = clausole_ufficio(squadre[~con_bozza], rose, quot)
+    libro = pd.concat([salvate.assign(Ufficio=False), ufficio], ignore_index=True)
+
+    proprietari = proprietari_per_lega(squadre, rose).rename(columns={"Id_Squadra": "Proprietario"})
+    libro = libro.merge(proprietari, on=["Lega", "Id"], how="left")
+    libro = libro[libro["Proprietario"] == libro["Id_Squadra"]]
+    return libro[COLONNE_LIBRO].reset_index(drop=True)
+
+
+class LibroClausole:
+    """Clausole effettive per (lega, squadra) e squadre a cui si applicano
+    le clausole d'ufficio."""
+
+    def __init__(self, tabella, d_ufficio=(), versione=None):
+        self.tabella = tabella
+        self.versione = versione
+        self._ufficio = set(d_ufficio)
+        self._clausole = {}
+        t = tabella
+        for lega, sq, pid, nome, valore in zip(t["Lega"], t["Squadra"], t["Id"], t["Nome"], t["Valore"]):
+            self._clausole.setdefault((lega, sq), []).append((pid, nome, int(valore)))
+
+    def clausole_di(self, lega, squadra):
+        """[(id, nome, valore)] acquistabili della squadra nella lega."""
+        return list(self._clausole.get((lega, squadra), []))
+
+    def d_ufficio(self, squadra):
+        """True se la squadra non ha una bozza salvata (valgono gli FVM)."""
+        return squadra in self._ufficio
+
+
+def libro_clausole(df_leghe, df_rose, df_quot, clausole, registro, versione=None):
+    """LibroClausole condiviso per 'versione' dei dati (es. sha del commit);
+    con versione None viene costruito ogni volta."""
+    if versione is not None:
+        with _lock_libri:
+            libro = _libri.get(versione)
+        if libro is not None:
+            return libro
+    tabella = calcola_libro(df_leghe, df_rose, df_quot, clausole, registro)
+    senza_bozza = [sq for sq in df_leghe.get("Squadra", pd.Series(dtype=object)) if sq not in clausole]
+    libro = LibroClausole(tabella, senza_bozza, versione)
+    if versione is not None:
+        with _lock_libri:
+            _libri[versione] = libro
+            while len(_libri) > _MAX_LIBRI:
+                _libri.pop(next(iter(_libri)))
+    return libro
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import threading
+
+import pandas as pd
+
+# --- MANIFESTO DEI CSV (CODIFICA E DELIMITATORE) ---
+# I CSV dell'app arrivano da editor diversi: i Calendario_* esportati da
+# Excel sono in cp1252 ("1ª Giornata"), altri in UTF-8, qualcuno con il BOM.
+# Leggerli tutti come latin1, o provare codifiche a tentativi rileggendo il
+# file a ogni errore, produce "Âª" e "�" oppure costa più letture; sep=None
+# obbliga al parser Python, molto più lento di quello in C.
+#
+# Qui codifica e delimitatore di ogni file vengono riconosciuti UNA volta e
+# salvati nel manifesto (in memoria e su disco, nella cartella della cache)
+# insieme a dimensione e data di modifica: finché il file non cambia la
+# lettura è sempre un solo read_csv con il motore C e i parametri giusti.
+
+CARTELLA_CACHE = os.environ.get("LFM_CACHE_DIR", ".cache_lfm")
+FILE_MANIFESTO = os.path.join(CARTELLA_CACHE, "manifesto_csv.json")
+
+DELIMITATORI = ",;\t|"
+
+_manifesto = None
+_lock_manifesto = threading.Lock()
+
+
+def firma_file(path):
+    """(dimensione, mtime) del file: cambia se il file viene riscritto."""
+    try:
+        info = os.stat(path)
+        return info.st_size, info.st_mtime_ns
+    except OSError:
+        return None
+
+
+def decodifica(dati):
+    """(testo, codifica) di un contenuto binario: UTF-8 (con o senza BOM) se
+    valido, altrimenti cp1252, e latin1 come ultima risorsa (non fallisce mai)."""
+    if dati.startswith(b"\xef\xbb\xbf"):
+        return dati.decode("utf-8-sig"), "utf-8-sig"
+    for codifica in ("utf-8", "cp1252"):
+        try:
+            return dati.decode(codifica), codifica
+        except UnicodeDecodeError:
+            continue
+    return dati.decode("latin1"), "latin1"
+
+
+def rileva_separatore(testo):
+    """Delimitatore più probabile tra , ; tab |, dalle prime righe non vuote."""
+    righe = [r for r in testo.splitlines() if r.strip()][:20]
+    if not righe:
+        return ","
+    try:
+        return csv.Sniffer().sniff("\n".join(righe), delimiters=DELIMITATORI).delimiter
+    except csv.Error:
+        # Sniffer non decide (es. una sola colonna): vince il più frequente
+        conteggi = {d: sum(r.count(d) for r in righe) for d in DELIMITATORI}
+        migliore = max(conteggi, key=conteggi.get)
+        return migliore if conteggi[migliore] else ","
+
+
+def _carica_manifesto():
+    global _manifesto
+    if _manifesto is None:
+        try:
+            with open(FILE_MANIFESTO, encoding="utf-8") as f:
+                _manifesto = json.load(f)
+        except (OSError, ValueError):
+            _manifesto = {}
+    return _manifesto
+
+
+def _salva_manifesto():
+    try:
+        os.makedirs(CARTELLA_CACHE, exist_ok=True)
+        tmp = f"{FILE_MANIFESTO}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_manifesto, f, indent=1, sort_keys=True)
+        os.replace(tmp, FILE_MANIFESTO)
+    except OSError:
+        pass  # il manifesto su disco è solo un risparmio al riavvio
+
+
+def parametri_csv(path):
+    """{'encoding', 'sep'} del file, dal manifesto se dimensione e data di
+    modifica non sono cambiate, altrimenti riconosciuti ora e registrati.
+    FileNotFoundError se il file non esiste."""
+    firma = firma_file(path)
+    if firma is None:
+        raise FileNotFoundError(path)
+    chiave = os.path.abspath(path)
+    with _lock_manifesto:
+        voce = _carica_manifesto().get(chiave)
+        if voce and tuple(voce["firma"]) == firma:
+            return {"encoding": voce["encoding"], "sep": voce["sep"]}
+
+    with open(path, "rb") as f:
+        testo, codifica = decodifica(f.read())
+    voce = {"firma": list(firma), "encoding": codifica, "sep": rileva_separatore(testo)}
+    with _lock_manifesto:
+        _carica_manifesto()[chiave] = voce
+        _salva_manifesto()
+    return {"encoding": voce["encoding"], "sep": voce["sep"]}
+
+
+def leggi_csv(path, **kwargs):
+    """pd.read_csv con codifica e delimitatore del manifesto, sempre con il
+    motore C. Gli altri argomenti (header, dtype, ...) passano invariati."""
+    parametri = parametri_csv(path)
+    return pd.read_csv(path, engine="c", **{**parametri, **kwargs})
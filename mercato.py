@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 from github import Github
-import io
 import time
+from archivio import ArchivioGithub, archivio_da_ambiente
+from buffer_log import BufferLog
+from griglia_card import griglia_card
+from indice_stadi import indice_stadi_locale
+from manifesto_csv import leggi_csv
+from modello_lega import modello_da_archivio
+from registro_crediti import leggi_saldi, registra_movimento
+from riepilogo_squadre import riepilogo_lega, riepilogo_squadre
 
 # --- 1. CONFIGURAZIONE E COSTANTI ---
 st.set_page_config(page_title="LFM Mercato - Golden Edition", layout="wide", page_icon="⚖️")
@@ -19,20 +25,55 @@ def format_num(num):
     except:
         return "0"
 
+def card_squadra(sq):
+    """HTML della card di una squadra in dashboard (una riga di riepilogo_squadre)"""
+    cap_txt = f"{int(sq['Capienza'])}k" if sq['Capienza'] > 0 else "N.D."
+    gioc_usciti = sq['Uscite'] or "-"
+    color_ng = "#00ff00" if 25 <= sq['NG'] <= 35 else "#ff4b4b"
+    return f"""<div style="background-color: {MAPPATURA_COLORI.get(sq['Lega'], '#333')}; padding: 12px; border-radius: 10px; margin-bottom: 12px; color: white; border: 1px solid rgba(255,255,255,0.1); line-height: 1.2;">
+        <div style="display: flex; justify-content: space-between; align-items: center; border-bottom: 1px solid rgba(255,255,255,0.2); padding-bottom: 5px; margin-bottom: 8px;">
+            <b style="font-size: 15px;">{sq['Squadra_LFM']}</b>
+            <span style="font-size: 10px; background: rgba(0,0,0,0.2); padding: 2px 4px; border-radius: 4px;">🏟️ {cap_txt}</span>
+        </div>
+        <div style="display: flex; justify-content: space-between; align-items: baseline;">
+            <div style="font-size: 22px; font-weight: 900;">{format_num(sq['Crediti'])} <small style="font-size: 12px;">cr</small></div>
+            <div style="font-size: 14px; font-weight: bold; color: {color_ng};">{int(sq['NG'])} <small style="font-size: 10px; color: white;">gioc.</small></div>
+        </div>
+        <div style="margin-top: 8px; display: grid; grid-template-columns: 1fr 1fr; gap: 4px; font-size: 10px; text-align: center;">
+            <div style="background: rgba(255,255,255,0.1); padding: 4px; border-radius: 4px;">FVM: {format_num(sq['FVM_Tot'])}</div>
+            <div style="background: rgba(255,255,255,0.1); padding: 4px; border-radius: 4px;">Qt: {format_num(sq['Quot_Tot'])}</div>
+        </div>
+        <div style="font-size: 9px; margin-top: 8px; color: rgba(255,255,255,0.8); font-style: italic;">❌ {gioc_usciti}</div>
+    </div>"""
+
 # --- 2. CONNESSIONE GITHUB ---
-try:
-    token = st.secrets["GITHUB_TOKEN"]
-    repo_name = st.secrets["REPO_NAME"]
-    g = Github(token)
-    repo = g.get_repo(repo_name)
-except:
-    st.error("Errore Secrets! Verifica GITHUB_TOKEN e REPO_NAME.")
+# Archivio locale/SQLite se indicato dalle variabili d'ambiente (vedi archivio_da_ambiente)
+archivio = archivio_da_ambiente()
+if archivio is None:
+    try:
+        token = st.secrets["GITHUB_TOKEN"]
+        repo_name = st.secrets["REPO_NAME"]
+        g = Github(token)
+        archivio = ArchivioGithub(g.get_repo(repo_name))
+    except:
+        st.error("Errore Secrets! Verifica GITHUB_TOKEN e REPO_NAME.")
+
+# Log di svincoli, tagli e draft: buffer write-behind, un commit ogni
+# qualche secondo invece di uno per operazione (vedi buffer_log.py)
+@st.cache_resource
+def apri_buffer_log():
+    return BufferLog(archivio, "mercato")
+
+buffer_log = apri_buffer_log()
 
 # --- 3. FUNZIONI API GITHUB ---
 def get_df_from_github(file_path):
     try:
-        content = repo.get_contents(file_path)
-        df = pd.read_csv(io.StringIO(content.decoded_content.decode('utf-8')))
+        try:
+            df = archivio.leggi_csv(file_path)
+        except FileNotFoundError:
+            df = pd.DataFrame()
+        df = buffer_log.unisci(file_path, df)
         if 'Rimborso' in df.columns and 'Totale' not in df.columns:
             df = df.rename(columns={'Rimborso': 'Totale'})
         return df
@@ -40,72 +81,23 @@ def get_df_from_github(file_path):
         return pd.DataFrame()
 
 def save_to_github_direct(file_path, df, message):
-    csv_content = df.to_csv(index=False)
-    try:
-        contents = repo.get_contents(file_path)
-        repo.update_file(contents.path, message, csv_content, contents.sha)
-    except:
-        repo.create_file(file_path, message, csv_content)
+    archivio.scrivi_csv(file_path, df, message)
 
 # --- 4. CARICAMENTO E PULIZIA PROFONDA (Versione Unificata) ---
-@st.cache_data(ttl=2)
 def load_all_data():
-    # Caricamento file da GitHub
-    df_rosters = get_df_from_github('fantamanager-2021-rosters.csv')
-    df_leghe = get_df_from_github('leghe.csv')
-    
-    # Caricamento file locali con gestione errori
+    # Rose × leghe × listone × esclusi dal modello condiviso (modello_lega.py):
+    # rose e leghe dall'archivio, il merge si rifà solo quando cambiano
+    modello = modello_da_archivio(archivio)
     try:
-        df_quot = pd.read_csv('quot.csv', sep=None, engine='python', encoding='latin1')
-        df_esclusi = pd.read_csv('esclusi.csv', sep=None, engine='python', encoding='latin1')
-    except:
-        df_quot = pd.DataFrame(columns=['Id', 'Nome', 'R', 'Qt.I', 'FVM'])
-        df_esclusi = pd.DataFrame(columns=['Id'])
-
-    try:
-        df_stadi = pd.read_csv('stadi.csv', encoding='latin1')
+        df_stadi = leggi_csv('stadi.csv')
     except:
         df_stadi = pd.DataFrame(columns=['Squadra', 'Stadio'])
-
-    # Pulizia nomi colonne e spazi
-    for d in [df_rosters, df_quot, df_esclusi, df_leghe]:
-        if not d.empty:
-            d.columns = d.columns.str.strip()
-            cols_obj = d.select_dtypes(['object']).columns
-            d[cols_obj] = d[cols_obj].apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-
-    # Forza ID come interi
-    for d in [df_rosters, df_quot, df_esclusi]:
-        if 'Id' in d.columns:
-            d['Id'] = pd.to_numeric(d['Id'], errors='coerce').fillna(0).astype(int)
-
-    # Merge dei dati
-    df_m = pd.merge(df_rosters, df_leghe, left_on='Squadra_LFM', right_on='Squadra', how='left')
-    df_base = pd.merge(df_m, df_quot[['Id', 'Nome', 'R', 'Qt.I', 'FVM']], on='Id', how='left')
-    
-    # Pulizia Valori Numerici
-    df_base['Qt.I'] = pd.to_numeric(df_base['Qt.I'], errors='coerce').fillna(0)
-    df_base['FVM'] = pd.to_numeric(df_base['FVM'], errors='coerce').fillna(0)
-    
-    # Calcoli rimborsi
-    df_base['Meta_Qt'] = np.ceil(df_base['Qt.I'] / 2).astype(int)
-    df_base['Meta_FVM'] = np.ceil(df_base['FVM'] / 2).astype(int)
-    df_base['R_Star'] = (df_base['FVM'].astype(int) + df_base['Meta_Qt']).astype(int)
-    df_base['R_Taglio'] = np.ceil((df_base['FVM'] + df_base['Qt.I']) / 2).astype(int)
-    
-    # Identificazione Esclusi (Asteriscati)
-    if 'Id' in df_esclusi.columns:
-        esclusi_ids = set(df_esclusi['Id'].unique())
-        df_base['Is_Escluso'] = df_base['Id'].isin(esclusi_ids)
-    else:
-        df_base['Is_Escluso'] = False
-    
-    # IMPORTANTE: I nomi qui devono essere quelli locali alla funzione
-    return df_base, df_leghe, df_rosters, df_stadi 
+    return modello.base, modello.leghe, modello.rose, df_stadi
 
 # --- CHIAMATA ALLA FUNZIONE (Margine sinistro) ---
 # Qui "afferri" i dati e puoi usare i nomi che vuoi per il resto dell'app
 df_base, df_leghe_upd, df_rosters_upd, df_stadi = load_all_data()
+stadi = indice_stadi_locale()
 # --- 5. NAVIGAZIONE ---
 menu = st.sidebar.radio("Scegli Pagina:", ["🏠 Dashboard", "1. Svincoli (*)", "2. Tagli", "3. Bilancio", "4. Rose"])
 
@@ -116,42 +108,15 @@ if menu == "🏠 Dashboard":
     df_t = get_df_from_github('tagli_volontari.csv')
     mov = pd.concat([df_s, df_t], ignore_index=True)
     
-    leghe_per_dash = [l for l in ORDINE_LEGHE if l in df_base['Lega'].unique()]
+    riepilogo = riepilogo_squadre(df_base, mov, stadi)
+    leghe_per_dash = [l for l in ORDINE_LEGHE if l in riepilogo['Lega'].values]
     
     for lega_nome in leghe_per_dash:
         st.markdown(f"#### 🏆 {lega_nome}")
-        df_l = df_base[df_base['Lega'] == lega_nome]
-        if df_l.empty: continue
-        
-        uscite_nomi = mov.groupby('Squadra')['Giocatore'].apply(lambda x: ", ".join(x)) if not mov.empty else pd.Series()
-        stats = df_l.groupby('Squadra_LFM').agg({'Nome': 'count', 'FVM': 'sum', 'Qt.I': 'sum'}).rename(columns={'Nome': 'NG', 'FVM': 'FVM_Tot', 'Qt.I': 'Quot_Tot'}).reset_index()
+        stats = riepilogo_lega(riepilogo, lega_nome)
+        if stats.empty: continue
 
-        cols = st.columns(3)
-        for idx, (_, sq) in enumerate(stats.sort_values(by='Squadra_LFM').iterrows()):
-            with cols[idx % 3]:
-                cap = df_stadi[df_stadi['Squadra'].str.upper() == sq['Squadra_LFM'].upper()]['Stadio'].values
-                cap_txt = f"{int(cap[0])}k" if len(cap)>0 and cap[0] > 0 else "N.D."
-                cred_val = df_leghe_upd[df_leghe_upd['Squadra'] == sq['Squadra_LFM']]['Crediti'].sum()
-                gioc_usciti = uscite_nomi.get(sq['Squadra_LFM'], "-")
-                color_ng = "#00ff00" if 25 <= sq['NG'] <= 35 else "#ff4b4b"
-                
-                st.markdown(f"""
-                    <div style="background-color: {MAPPATURA_COLORI.get(lega_nome, '#333')}; padding: 12px; border-radius: 10px; margin-bottom: 12px; color: white; border: 1px solid rgba(255,255,255,0.1); line-height: 1.2;">
-                        <div style="display: flex; justify-content: space-between; align-items: center; border-bottom: 1px solid rgba(255,255,255,0.2); padding-bottom: 5px; margin-bottom: 8px;">
-                            <b style="font-size: 15px;">{sq['Squadra_LFM']}</b>
-                            <span style="font-size: 10px; background: rgba(0,0,0,0.2); padding: 2px 4px; border-radius: 4px;">🏟️ {cap_txt}</span>
-                        </div>
-                        <div style="display: flex; justify-content: space-between; align-items: baseline;">
-                            <div style="font-size: 22px; font-weight: 900;">{format_num(cred_val)} <small style="font-size: 12px;">cr</small></div>
-                            <div style="font-size: 14px; font-weight: bold; color: {color_ng};">{int(sq['NG'])} <small style="font-size: 10px; color: white;">gioc.</small></div>
-                        </div>
-                        <div style="margin-top: 8px; display: grid; grid-template-columns: 1fr 1fr; gap: 4px; font-size: 10px; text-align: center;">
-                            <div style="background: rgba(255,255,255,0.1); padding: 4px; border-radius: 4px;">FVM: {format_num(sq['FVM_Tot'])}</div>
-                            <div style="background: rgba(255,255,255,0.1); padding: 4px; border-radius: 4px;">Qt: {format_num(sq['Quot_Tot'])}</div>
-                        </div>
-                        <div style="font-size: 9px; margin-top: 8px; color: rgba(255,255,255,0.8); font-style: italic;">❌ {gioc_usciti}</div>
-                    </div>
-                """, unsafe_allow_html=True)
+        st.markdown(griglia_card(stats, card_squadra, "mercato", colonne=3), unsafe_allow_html=True)
 
 # --- 1. SVINCOLI ---
 elif menu == "1. Svincoli (*)":
@@ -172,27 +137,28 @@ elif menu == "1. Svincoli (*)":
                 
                 # Tutto il codice sotto è dentro il BUTTON
                 if st.button("ESEGUI SVINCOLO GLOBALE"):
-                    # 1. Aggiorna i crediti per ogni squadra che ha quel giocatore
-                    for _, row in targets.iterrows():
-                        df_leghe_upd.loc[df_leghe_upd['Squadra'] == row['Squadra_LFM'], 'Crediti'] += row['R_Star']
-                    
-                    # 2. Rimuovi il giocatore dal roster globale
-                    df_rosters_upd = df_rosters_upd[df_rosters_upd['Id'] != targets.iloc[0]['Id']]
-                    
-                    # 3. Prepara il log
+                    # Log dello svincolo
                     log = targets[['Nome', 'Squadra_LFM', 'Lega', 'R', 'FVM', 'Meta_Qt', 'R_Star']].copy()
                     log.columns = ['Giocatore', 'Squadra', 'Lega', 'Ruolo', 'Quota_FVM', 'Quota_Qt', 'Totale']
                     log['Tipo'] = "STAR (*)"
+
+                    # Rimozione dal roster e rimborso in un'unica transazione: ogni squadra
+                    # viene rimborsata solo se la sua riga è stata davvero rimossa (un doppio
+                    # clic o una transazione ripetuta non rimborsano due volte); il log,
+                    # delle sole righe rimosse, passa dal buffer
+                    def svincolo(tx):
+                        rimosse = []
+                        for i, row in targets.iterrows():
+                            if tx.elimina_righe('fantamanager-2021-rosters.csv', Id=row['Id'], Squadra_LFM=row['Squadra_LFM']):
+                                registra_movimento(tx, row['Squadra_LFM'], 'STAR', int(row['R_Star']), row['Nome'])
+                                rimosse.append(i)
+                        return rimosse
+                    rimosse = archivio.transazione(svincolo, f"Svincolo {scelta}")
+                    if rimosse:
+                        buffer_log.accoda_df('svincolati_gennaio.csv', log.loc[rimosse])
                     
-                    # 4. Salva tutto su GitHub
-                    save_to_github_direct('leghe.csv', df_leghe_upd, f"Svincolo {scelta}")
-                    save_to_github_direct('fantamanager-2021-rosters.csv', df_rosters_upd, f"Rimozione {scelta}")
-                    
-                    old_l = get_df_from_github('svincolati_gennaio.csv')
-                    save_to_github_direct('svincolati_gennaio.csv', pd.concat([old_l, log], ignore_index=True), "Log Star")
-                    
-                    # 5. Messaggio finale e reset
-                    st.success(f"Operazione completata per {scelta}!")
+                    # Messaggio finale e reset
+                    st.success(f"Operazione completata per {scelta}!" if rimosse else f"{scelta} era già stato svincolato.")
                     st.cache_data.clear()
                     time.sleep(1)
                     st.rerun()
@@ -210,13 +176,16 @@ elif menu == "2. Tagli":
         if gioc:
             info = df_base[(df_base['Squadra_LFM'] == sq) & (df_base['Nome'] == gioc)].iloc[0]
             if st.button("ESEGUI TAGLIO"):
-                df_leghe_upd.loc[df_leghe_upd['Squadra'] == sq, 'Crediti'] += info['R_Taglio']
-                df_rosters_upd = df_rosters_upd[~((df_rosters_upd['Squadra_LFM'] == sq) & (df_rosters_upd['Id'] == info['Id']))]
                 log_t = pd.DataFrame([{'Giocatore': gioc, 'Squadra': sq, 'Lega': info['Lega'], 'Ruolo': info['R'], 'Quota_FVM': info['Meta_FVM'], 'Quota_Qt': info['Meta_Qt'], 'Totale': info['R_Taglio'], 'Tipo': 'TAGLIO'}])
-                save_to_github_direct('leghe.csv', df_leghe_upd, f"Taglio {gioc}")
-                save_to_github_direct('fantamanager-2021-rosters.csv', df_rosters_upd, f"Rimozione {gioc}")
-                old_t = get_df_from_github('tagli_volontari.csv')
-                save_to_github_direct('tagli_volontari.csv', pd.concat([old_t, log_t], ignore_index=True), "Log Taglio")
+
+                # Il rimborso solo se il giocatore è stato davvero rimosso
+                def taglio(tx):
+                    if not tx.elimina_righe('fantamanager-2021-rosters.csv', Squadra_LFM=sq, Id=info['Id']):
+                        return False
+                    registra_movimento(tx, sq, 'TAGLIO', int(info['R_Taglio']), gioc)
+                    return True
+                if archivio.transazione(taglio, f"Taglio {gioc}"):
+                    buffer_log.accoda_df('tagli_volontari.csv', log_t)
                 st.cache_data.clear(); st.rerun()
 
 # --- 3. BILANCIO (PROTEZIONE TYPEERROR) ---
@@ -226,15 +195,13 @@ elif menu == "3. Bilancio":
     leghe_l = [l for l in ORDINE_LEGHE if l in df_base['Lega'].unique()]
     lega_s = st.selectbox("Filtra Lega:", leghe_l)
     
-    df_s = get_df_from_github('svincolati_gennaio.csv')
-    df_t = get_df_from_github('tagli_volontari.csv')
-    mov = pd.concat([df_s, df_t], ignore_index=True)
-    bonus = mov.groupby('Squadra')['Totale'].sum() if not mov.empty else pd.Series()
-    
-    bil = df_leghe_upd[df_leghe_upd['Lega'] == lega_s].copy()
-    bil['Bonus'] = bil['Squadra'].map(bonus).fillna(0).astype(int)
-    bil['Iniziale'] = bil['Crediti'] - bil['Bonus']
-    st.table(bil[['Squadra', 'Iniziale', 'Bonus', 'Crediti']].rename(columns={'Crediti': 'Attuali'}))
+    # Vista dei saldi mantenuta dal registro dei crediti: una riga per squadra,
+    # niente raggruppamento dei log a ogni rerun
+    saldi = leggi_saldi(archivio)
+    bil = saldi[saldi['Lega'] == lega_s].copy()
+    bil['Bonus'] = (bil['Svincoli'] + bil['Tagli']).astype(int)
+    bil['Iniziale'] = bil['Saldo'] - bil['Bonus']
+    st.table(bil[['Squadra', 'Iniziale', 'Bonus', 'Saldo']].rename(columns={'Saldo': 'Attuali'}))
 
 # --- 4. ROSE ---
 elif menu == "4. Rose":
@@ -0,0 +1,289 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+from manifesto_csv import CARTELLA_CACHE, firma_file, leggi_csv
+from riepilogo_squadre import impronta_dati
+
+# --- MODELLO DATI DELLA LEGA ---
+# Un solo posto dove rose × leghe × listone × esclusi diventano df_base, con
+# la stessa pulizia per tutte le app (lfm, lab2, lablfm, lab3, mercato,
+# draft_fm, draft, clausole) invece di un merge diverso per ognuna.
+#
+# Colonne di df_base:
+#   Squadra_LFM, Id, Prezzo                 dalle rose
+#   Squadra_Key                             nome squadra senza spazi, maiuscolo (chiave di join)
+#   Lega, Crediti                           da leghe.csv
+#   Nome, R, Qt.I, FVM                      dal listone (quot.csv)
+#   Meta_Qt, Meta_FVM, R_Star, R_Taglio     rimborsi (per eccesso, interi)
+#   Is_Escluso                              giocatore in esclusi.csv (asteriscato)
+#
+# Tipi compatti: Id int32, Squadra_LFM/Squadra_Key/Lega/R categoriche,
+# Qt.I/FVM float32. Il modello viene costruito una volta per versione dei
+# file e condiviso: chi deve aggiungere colonne lavora su una copia.
+#
+# Istantanee: il modello costruito viene anche scritto su disco come file
+# Feather (una cartella per impronta del contenuto dei dati), e al primo
+# avvio di un processo viene mappato in memoria invece di rileggere e
+# riunire i CSV. Si ricostruisce da solo quando i dati cambiano; per
+# prepararlo in anticipo (es. dopo un aggiornamento del listone):
+#     python istantanea_lega.py
+
+FILE_ROSE = "fantamanager-2021-rosters.csv"
+FILE_LEGHE = "leghe.csv"
+FILE_QUOT = "quot.csv"
+FILE_ESCLUSI = "esclusi.csv"
+
+ModelloLega = namedtuple("ModelloLega", "base leghe rose quot esclusi versione")
+
+_modelli = {}
+_lock_modelli = threading.Lock()
+_MAX_MODELLI = 4
+
+CARTELLA_ISTANTANEE = os.path.join(CARTELLA_CACHE, "modelli")
+TABELLE_MODELLO = ("base", "leghe", "rose", "quot", "esclusi")
+_MAX_ISTANTANEE = 8
+
+
+def fix_league_names(df):
+    if 'Lega' in df.columns:
+        df['Lega'] = df['Lega'].replace(['Lega A', 'nan', 'Da Assegnare', None, 0], 'Serie A')
+        df['Lega'] = df['Lega'].fillna('Serie A')
+    return df
+
+
+def chiave_squadra(serie):
+    return serie.astype(str).str.strip().str.upper()
+
+
+def _pulisci(df):
+    df = df.copy()
+    df.columns = df.columns.astype(str).str.strip()
+    for c in df.columns:
+        if pd.api.types.is_string_dtype(df[c]):
+            df[c] = df[c].str.strip()
+    return df
+
+
+def _ids(serie):
+    return pd.to_numeric(serie, errors='coerce')
+
+
+def prepara_tabelle(df_rosters, df_leghe, df_quot, df_esclusi):
+    """Le quattro tabelle sorgente pulite: colonne e testi senza spazi, Id
+    interi (righe senza Id scartate), valori numerici del listone."""
+    rose = _pulisci(df_rosters)
+    if len(rose.columns) >= 3 and 'Prezzo' not in rose.columns:
+        rose = rose.rename(columns={rose.columns[2]: 'Prezzo'})
+    rose['Id'] = _ids(rose['Id'])
+    rose = rose.dropna(subset=['Id']).reset_index(drop=True)
+    rose['Id'] = rose['Id'].astype('int32')
+    rose['Prezzo'] = pd.to_numeric(rose['Prezzo'], errors='coerce').fillna(0).astype('int32')
+
+    leghe = fix_league_names(_pulisci(df_leghe))
+    leghe['Crediti'] = pd.to_numeric(leghe['Crediti'], errors='coerce').fillna(0).astype(int)
+
+    quot = _pulisci(df_quot)
+    quot['Id'] = _ids(quot['Id'])
+    quot = quot.dropna(subset=['Id']).drop_duplicates('Id').reset_index(drop=True)
+    quot['Id'] = quot['Id'].astype('int32')
+    for c in ('Qt.I', 'FVM'):
+        quot[c] = pd.to_numeric(quot[c], errors='coerce').fillna(0).astype('float32')
+
+    esclusi = _pulisci(df_esclusi) if not df_esclusi.empty else pd.DataFrame(columns=['Id'])
+    id_col = 'Id' if 'Id' in esclusi.columns else esclusi.columns[0]
+    esclusi = esclusi.rename(columns={id_col: 'Id'})
+    esclusi['Id'] = _ids(esclusi['Id'])
+    esclusi = esclusi.dropna(subset=['Id']).reset_index(drop=True)
+    esclusi['Id'] = esclusi['Id'].astype('int32')
+    for c in ('Qt.I', 'FVM'):
+        if c in esclusi.columns:
+            esclusi[c] = pd.to_numeric(esclusi[c], errors='coerce').fillna(0).astype('float32')
+    return rose, leghe, quot, esclusi
+
+
+def costruisci_base(rose, leghe, quot, esclusi):
+    """df_base da tabelle già passate da prepara_tabelle()."""
+    base = rose[['Squadra_LFM', 'Id', 'Prezzo']].copy()
+    base['Squadra_Key'] = chiave_squadra(base['Squadra_LFM'])
+
+    l = leghe[['Squadra', 'Lega', 'Crediti']].copy()
+    l['Squadra_Key'] = chiave_squadra(l['Squadra'])
+    base = base.merge(l.drop(columns=['Squadra']).drop_duplicates('Squadra_Key'), on='Squadra_Key', how='left')
+    base = base.merge(quot[['Id', 'Nome', 'R', 'Qt.I', 'FVM']], on='Id', how='left')
+
+    base['Nome'] = base['Nome'].fillna("ID: " + base['Id'].astype(str))
+    base['Qt.I'] = base['Qt.I'].fillna(0).astype('float32')
+    base['FVM'] = base['FVM'].fillna(0).astype('float32')
+    base['Crediti'] = base['Crediti'].fillna(0).astype(int)
+
+    # Rimborsi: svincolo (*) = FVM + metà Qt.I, taglio = metà di (FVM + Qt.I), per eccesso
+    base['Meta_Qt'] = np.ceil(base['Qt.I'] / 2).astype('int32')
+    base['Meta_FVM'] = np.ceil(base['FVM'] / 2).astype('int32')
+    base['R_Star'] = (base['FVM'].astype('int32') + base['Meta_Qt']).astype('int32')
+    base['R_Taglio'] = np.ceil((base['FVM'] + base['Qt.I']) / 2).astype('int32')
+    base['Is_Escluso'] = base['Id'].isin(set(esclusi['Id']))
+
+    for c in ('Squadra_LFM', 'Squadra_Key', 'Lega', 'R'):
+        base[c] = base[c].astype('category')
+    return base
+
+
+def _memorizza(chiave, costruisci):
+    with _lock_modelli:
+        modello = _modelli.get(chiave)
+    if modello is not None:
+        return modello
+    modello = costruisci()
+    with _lock_modelli:
+        _modelli[chiave] = modello
+        while len(_modelli) > _MAX_MODELLI:
+            _modelli.pop(next(iter(_modelli)))
+    return modello
+
+
+def impronta_contenuto(percorsi, extra=()):
+    """SHA-256 del contenuto dei file (e di eventuali chiavi già note, come
+    gli sha dei blob): identifica l'istantanea indipendentemente da dove e
+    quando i file sono stati scritti."""
+    h = hashlib.sha256()
+    for x in extra:
+        h.update(repr(x).encode("utf-8") + b"\0")
+    for p in percorsi:
+        h.update(os.path.basename(p).encode("utf-8") + b"\0")
+        try:
+            with open(p, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            h.update(b"-")
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def percorso_istantanea(impronta):
+    return os.path.join(CARTELLA_ISTANTANEE, impronta)
+
+
+def carica_istantanea(impronta, versione=None):
+    """Modello dall'istantanea Feather, mappata in memoria: le colonne
+    numeriche restano sul file senza copie né parsing. None se manca o è
+    illeggibile."""
+    cartella = percorso_istantanea(impronta)
+    if not os.path.isdir(cartella):
+        return None
+    try:
+        tabelle = [
+            feather.read_table(os.path.join(cartella, f"{nome}.feather"), memory_map=True).to_pandas()
+            for nome in TABELLE_MODELLO
+        ]
+    except Exception:
+        return None
+    return ModelloLega(*tabelle, versione)
+
+
+def salva_istantanea(impronta, modello):
+    """Scrive le tabelle del modello come Feather non compressi (mappabili
+    senza decodifica) in una cartella temporanea poi rinominata: chi legge
+    in parallelo vede un'istantanea completa o nessuna. Tiene solo le
+    ultime _MAX_ISTANTANEE. Restituisce la cartella, o None se non riesce."""
+    cartella = percorso_istantanea(impronta)
+    if os.path.isdir(cartella):
+        return cartella
+    tmp = f"{cartella}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(tmp)
+        for nome in TABELLE_MODELLO:
+            getattr(modello, nome).reset_index(drop=True).to_feather(
+                os.path.join(tmp, f"{nome}.feather"), compression="uncompressed"
+            )
+        os.replace(tmp, cartella)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return cartella if os.path.isdir(cartella) else None
+    _pota_istantanee()
+    return cartella
+
+
+def _pota_istantanee():
+    try:
+        voci = [os.path.join(CARTELLA_ISTANTANEE, v) for v in os.listdir(CARTELLA_ISTANTANEE) if not v.endswith(".tmp")]
+        voci.sort(key=os.path.getmtime, reverse=True)
+        for vecchia in voci[_MAX_ISTANTANEE:]:
+            shutil.rmtree(vecchia, ignore_errors=True)
+    except OSError:
+        pass
+
+
+def _costruisci(impronta, versione, leggi_sorgenti):
+    """Modello dall'istantanea se esiste già, altrimenti dalle tabelle
+    sorgente (leggi_sorgenti() -> rose, leghe, quot, esclusi) e salvato
+    come nuova istantanea."""
+    modello = carica_istantanea(impronta, versione) if impronta else None
+    if modello is None:
+        rose, leghe, quot, esclusi = prepara_tabelle(*leggi_sorgenti())
+        modello = ModelloLega(costruisci_base(rose, leghe, quot, esclusi), leghe, rose, quot, esclusi, versione)
+        if impronta:
+            salva_istantanea(impronta, modello)
+    return modello
+
+
+def modello_da_tabelle(df_rosters, df_leghe, df_quot, df_esclusi, versione):
+    """Modello dalle quattro tabelle sorgente. 'versione' identifica il loro
+    contenuto (es. lo sha del commit): a parità di versione si riusa lo
+    stesso oggetto senza rifare il merge. L'istantanea su disco è invece
+    cercata per impronta del contenuto delle tabelle, perché una versione
+    come il numero progressivo di SQLite si ripete tra database diversi."""
+    if not versione or None in versione:
+        return _costruisci(None, versione, lambda: (df_rosters, df_leghe, df_quot, df_esclusi))
+    return _memorizza(versione, lambda: _costruisci(
+        impronta_dati(df_rosters, df_leghe, df_quot, df_esclusi), versione,
+        lambda: (df_rosters, df_leghe, df_quot, df_esclusi),
+    ))
+
+
+def _leggi_locale(p):
+    return leggi_csv(p) if firma_file(p) else pd.DataFrame()
+
+
+def modello_locale(cartella="."):
+    """Modello dai CSV nella cartella dell'app. In memoria è legato a
+    dimensione e data di modifica dei file; quando cambiano si calcola
+    l'impronta del contenuto e si mappa l'istantanea corrispondente, che
+    viene ricostruita solo se i dati sono davvero nuovi."""
+    percorsi = [os.path.join(cartella, f) for f in (FILE_ROSE, FILE_LEGHE, FILE_QUOT, FILE_ESCLUSI)]
+    versione = ("locale",) + tuple((p, firma_file(p)) for p in percorsi)
+    return _memorizza(versione, lambda: _costruisci(
+        impronta_contenuto(percorsi), versione, lambda: [_leggi_locale(p) for p in percorsi]
+    ))
+
+
+def modello_da_archivio(archivio, cartella="."):
+    """Modello con rose e leghe lette dall'archivio (GitHub, locale o
+    SQLite) e listone/esclusi dai file dell'app. La versione è data dalle
+    voci dei due file in voci_albero() (sha dei blob, o identificativo
+    della tabella su SQLite), quindi il merge si rifà solo quando cambiano
+    davvero. Rose e leghe vengono lette insieme alle loro voci: il modello
+    non finisce mai sotto una chiave più vecchia dei dati che contiene."""
+    percorsi = [os.path.join(cartella, f) for f in (FILE_QUOT, FILE_ESCLUSI)]
+    firme = tuple(firma_file(p) for p in percorsi)
+
+    def chiave(voci):
+        return ("archivio", voci.get(FILE_ROSE), voci.get(FILE_LEGHE)) + firme
+
+    with _lock_modelli:
+        modello = _modelli.get(chiave(archivio.voci_albero()))
+    if modello is not None:
+        return modello
+
+    voci, dati = archivio.fotografia_voci([FILE_ROSE, FILE_LEGHE])
+    versione = chiave(voci)
+    return _memorizza(versione, lambda: _costruisci(
+        impronta_contenuto(percorsi, extra=versione[1:3]), versione,
+        lambda: [dati[FILE_ROSE], dati[FILE_LEGHE]] + [_leggi_locale(p) for p in percorsi],
+    ))
@@ -0,0 +1,135 @@
+import math
+from datetime import datetime, timedelta
+
+from registro_clausole import salva_bozza_clausole
+from registro_crediti import registra_movimento
+
+# --- OPERAZIONI DEL PORTALE CLAUSOLE ---
+# Le transazioni di pagamento, controriscatto e salvataggio della bozza,
+# senza Streamlit: le usa clausole.py (tramite la coda delle transazioni) e
+# le usa carico_mercato.py per simulare il mercato delle 22:00 su un
+# archivio locale. Ogni funzione restituisce la funzione da passare ad
+# archivio.transazione (o alla coda); i controlli di calendario restano a
+# chi chiama.
+
+LIMITE_CLAUSOLE_PAGATE = 3
+INTESTAZIONE_RICHIESTE = ["Acquirente", "Proprietario", "Id", "Nome", "Costo", "Stato", "Orario"]
+
+
+def conta_pagate_in(df_sc, squadra):
+    """Clausole pagate con successo da 'squadra' secondo un richieste_scippo.csv già letto."""
+    if df_sc.empty or 'Acquirente' not in df_sc.columns or 'Stato' not in df_sc.columns:
+        return 0
+    mask = (df_sc['Acquirente'] == squadra) & (df_sc['Stato'].astype(str).isin(['APPROVATO', 'APPROVATO_AUTO']))
+    return int(mask.sum())
+
+
+def parse_orario_pagamento(orario_str):
+    """Prova a interpretare il campo Orario come data+ora completa. Restituisce None
+    se il formato non è quello atteso (es. voci vecchie salvate solo con l'ora)."""
+    try:
+        return datetime.strptime(str(orario_str).strip(), "%Y-%m-%d %H:%M:%S")
+    except (ValueError, TypeError):
+        return None
+
+
+def transazione_trasferimento(acquirente, proprietario, proprietario_pulito, player_id, nome, costo, orario):
+    """Pagamento di una clausola: limite di clausole pagate e proprietario
+    attuale controllati sulla fotografia della transazione, poi roster,
+    crediti e log nello stesso commit. 'proprietario_pulito' è il nome
+    del proprietario come compare in Squadra_LFM del roster."""
+    def transazione(tx):
+        pagate = tx.righe("richieste_scippo.csv", Acquirente=acquirente)
+        if conta_pagate_in(pagate, acquirente) >= LIMITE_CLAUSOLE_PAGATE:
+            return False, f"Hai già raggiunto il limite di {LIMITE_CLAUSOLE_PAGATE} clausole pagate. Nessun credito è stato mosso."
+
+        trasferiti = tx.aggiorna_righe(
+            "fantamanager-2021-rosters.csv", {"Squadra_LFM": acquirente},
+            Id=player_id, Squadra_LFM=proprietario_pulito,
+        )
+        if not trasferiti:
+            return False, "Questo giocatore non appartiene più a questa squadra: probabilmente è già stato trasferito da qualcun altro un istante prima. Nessun credito è stato mosso."
+
+        registra_movimento(tx, acquirente, "CLAUSOLA", -int(costo), nome, orario)
+        registra_movimento(tx, proprietario, "CLAUSOLA", int(costo), nome, orario)
+        tx.appendi_righe(
+            "richieste_scippo.csv",
+            [[acquirente, proprietario, player_id, nome, costo, "APPROVATO_AUTO", orario]],
+            INTESTAZIONE_RICHIESTE,
+        )
+        return True, None
+
+    return transazione
+
+
+def transazione_controriscatto(proprietario, acquirente, acquirente_pulito, player_id, nome, costo_originale, ora):
+    """Controriscatto: il proprietario originale riprende il giocatore pagando
+    il 110% della clausola, l'acquirente riceve indietro l'importo originale.
+    'ora' è l'istante della richiesta, per il controllo delle 24 ore."""
+    penale_totale = math.ceil(float(costo_originale) * 1.10)
+
+    def transazione(tx):
+        filtro_richiesta = dict(Proprietario=proprietario, Acquirente=acquirente, Id=player_id, Stato="APPROVATO_AUTO")
+        riga = tx.righe("richieste_scippo.csv", **filtro_richiesta)
+        if riga.empty:
+            return False, "Transazione non trovata o già gestita in precedenza."
+        orario_pagamento = riga.iloc[0]['Orario']
+
+        dt_pagamento = parse_orario_pagamento(orario_pagamento)
+        if dt_pagamento is None or ora > dt_pagamento + timedelta(hours=24):
+            return False, "Sono passate più di 24 ore dal pagamento: il controriscatto non è più esercitabile per questo giocatore."
+
+        ripresi = tx.aggiorna_righe(
+            "fantamanager-2021-rosters.csv", {"Squadra_LFM": proprietario},
+            Id=player_id, Squadra_LFM=acquirente_pulito,
+        )
+        if not ripresi:
+            return False, "Il giocatore non è più presso questa squadra: il controriscatto non è più valido. Nessun credito è stato mosso."
+
+        registra_movimento(tx, proprietario, "CONTRORISCATTO", -penale_totale, nome)
+        registra_movimento(tx, acquirente, "CONTRORISCATTO", int(costo_originale), nome)
+        tx.aggiorna_righe("richieste_scippo.csv", {"Stato": "CONTRORISCATTATO"}, Orario=orario_pagamento, **filtro_richiesta)
+        return True, None
+
+    return transazione
+
+
+def chiave_richiesta(richiesta):
+    """Filtri che individuano una richiesta di richieste_scippo.csv senza
+    dipendere dalla sua posizione nel file."""
+    return {c: richiesta[c] for c in ("Acquirente", "Proprietario", "Id", "Orario")}
+
+
+def transazione_approvazione(richiesta, proprietario_pulito):
+    """Approvazione admin di una richiesta PENDENTE. Stato della richiesta e
+    proprietario attuale vengono controllati sulla fotografia della
+    transazione prima di muovere qualsiasi credito: un doppio clic o due
+    admin insieme trovano la richiesta già gestita. 'proprietario_pulito' è
+    il nome del proprietario come compare in Squadra_LFM del roster."""
+    chiave = chiave_richiesta(richiesta)
+
+    def transazione(tx):
+        if tx.righe("richieste_scippo.csv", Stato="PENDENTE", **chiave).empty:
+            return False, "Richiesta non più pendente: è già stata gestita. Nessun credito è stato mosso."
+        trasferiti = tx.aggiorna_righe(
+            "fantamanager-2021-rosters.csv", {"Squadra_LFM": richiesta['Acquirente']},
+            Id=richiesta['Id'], Squadra_LFM=proprietario_pulito,
+        )
+        if not trasferiti:
+            return False, "Il giocatore non appartiene più a questa squadra. Nessun credito è stato mosso."
+        registra_movimento(tx, richiesta['Acquirente'], "CLAUSOLA", -int(richiesta['Costo']), richiesta['Nome'])
+        registra_movimento(tx, richiesta['Proprietario'], "CLAUSOLA", int(richiesta['Costo']), richiesta['Nome'])
+        tx.aggiorna_righe("richieste_scippo.csv", {"Stato": "APPROVATO"}, Stato="PENDENTE", **chiave)
+        return True, None
+
+    return transazione
+
+
+def transazione_clausola_singola(squadra, giocatori, orario=""):
+    """Sostituisce (o aggiunge) la bozza della squadra nella tabella delle
+    clausole (registro_clausole.py): le sole righe della squadra, nella
+    stessa transazione. 'giocatori' è [(id, nome, valore)]."""
+    def transazione(tx):
+        return salva_bozza_clausole(tx, squadra, giocatori, orario)
+
+    return transazione
@@ -0,0 +1,173 @@
+import threading
+
+import pandas as pd
+
+# --- REGISTRO DELLE CLAUSOLE ---
+# Le bozze di blindaggio stavano in clausole_segrete.csv, una riga per
+# squadra nel formato "Squadra,id:nome:valore;id:nome:valore": ogni lettura
+# la rispezzava con cicli di split (barra admin, mercato, bozza del
+# Terminale, tasse) e ogni salvataggio riscriveva l'intero file.
+#
+# Ora sono una tabella a colonne, clausole_salvate.csv, una riga per
+# giocatore blindato:
+#   Squadra, Id, Nome, Valore   la clausola
+#   Orario                      ora del salvataggio della bozza
+#   Versione                    numero di salvataggi della bozza di quella squadra
+# Il salvataggio di una squadra è un upsert sulle sole sue righe (sul
+# backend SQLite un DELETE + INSERT per indice). La prima volta che serve
+# la tabella viene creata migrando il vecchio clausole_segrete.csv, che
+# resta nel repository così com'era.
+#
+# IndiceClausole tiene la tabella già interpretata e i due indici (per
+# squadra e per giocatore), costruiti una volta per versione dei dati.
+
+CLAUSOLE = "clausole_salvate.csv"
+CLAUSOLE_SEGRETE = "clausole_segrete.csv"
+COLONNE_CLAUSOLE = ["Squadra", "Id", "Nome", "Valore", "Orario", "Versione"]
+
+_indici = {}
+_lock_indici = threading.Lock()
+_MAX_INDICI = 4
+
+
+def _tabella_vuota():
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_CLAUSOLE})
+
+
+def interpreta_clausole_segrete(testo):
+    """Tabella delle clausole (COLONNE_CLAUSOLE) dal vecchio formato
+    "Squadra,id:nome:valore;...". A parità di squadra vale l'ultima riga;
+    le voci malformate o con valore non numerico vengono scartate."""
+    righe = pd.Series(testo.splitlines(), dtype=object)
+    righe = righe[righe.str.strip().ne("") & righe.str.contains(",", regex=False)]
+    if righe.empty:
+        return _tabella_vuota()
+    parti = righe.str.split(",", n=1, expand=True)
+    bozze = pd.DataFrame({"Squadra": parti[0], "Voce": parti[1].str.split(";")})
+    bozze = bozze.drop_duplicates("Squadra", keep="last").explode("Voce", ignore_index=True)
+    campi = bozze["Voce"].str.strip().str.extract(r"^([^:]+):(.*):([^:]+)$")
+    tabella = pd.DataFrame({
+        "Squadra": bozze["Squadra"], "Id": campi[0].str.strip(), "Nome": campi[1].str.strip(),
+        "Valore": pd.to_numeric(campi[2].str.strip(), errors="coerce"), "Orario": "", "Versione": 1,
+    })
+    return normalizza_clausole(tabella)
+
+
+def normalizza_clausole(tabella):
+    """Tabella con le colonne e i tipi attesi: Id e nomi come testo, Valore
+    e Versione interi. Le righe senza valore numerico vengono scartate."""
+    if tabella is None or tabella.empty or not {"Squadra", "Id", "Valore"} <= set(tabella.columns):
+        return _tabella_vuota()
+    tabella = tabella.reindex(columns=COLONNE_CLAUSOLE).reset_index(drop=True)
+    valori = pd.to_numeric(tabella["Valore"], errors="coerce")
+    tabella = tabella[valori.notna() & tabella["Squadra"].notna() & tabella["Id"].notna()]
+    return pd.DataFrame({
+        "Squadra": tabella["Squadra"].astype(str).astype(object),
+        "Id": tabella["Id"].astype(str).str.strip().str.removesuffix(".0").astype(object),
+        "Nome": tabella["Nome"].fillna("").astype(str).astype(object),
+        "Valore": valori[tabella.index].astype(int),
+        "Orario": tabella["Orario"].fillna("").astype(str).astype(object),
+        "Versione": pd.to_numeric(tabella["Versione"], errors="coerce").fillna(1).astype(int),
+    }).reset_index(drop=True)
+
+
+def tabella_clausole(tabella, testo_segrete=""):
+    """La tabella delle clausole se esiste già (ha un'intestazione),
+    altrimenti quella migrata dal vecchio clausole_segrete.csv."""
+    if tabella is not None and len(tabella.columns):
+        return normalizza_clausole(tabella)
+    return interpreta_clausole_segrete(testo_segrete or "")
+
+
+def salva_bozza_clausole(tx, squadra, giocatori, orario=""):
+    """Sostituisce, dentro la transazione tx, la bozza di 'squadra' con
+    'giocatori' [(id, nome, valore)]. Se la tabella non esiste ancora viene
+    prima migrata dal vecchio formato. Restituisce la nuova versione."""
+    if not tx.esiste(CLAUSOLE):
+        migrata = interpreta_clausole_segrete(tx.leggi_testo(CLAUSOLE_SEGRETE) if tx.esiste(CLAUSOLE_SEGRETE) else "")
+        tx.scrivi_csv(CLAUSOLE, migrata)
+
+    precedenti = tx.righe(CLAUSOLE, Squadra=squadra)
+    precedenti = pd.to_numeric(precedenti["Versione"], errors="coerce") if "Versione" in precedenti.columns else pd.Series(dtype=float)
+    versione = int(precedenti.max()) + 1 if precedenti.notna().any() else 1
+    tx.elimina_righe(CLAUSOLE, Squadra=squadra)
+    nuove = pd.DataFrame(
+        [[squadra, str(pid), nome, int(valore), orario, versione] for pid, nome, valore in giocatori],
+        columns=COLONNE_CLAUSOLE,
+    )
+    if not nuove.empty:
+        tx.appendi_df(CLAUSOLE, nuove)
+    return versione
+
+
+class IndiceClausole:
+    """Clausole salvate cercabili per squadra e per giocatore. Le squadre
+    senza bozza non sono nell'indice."""
+
+    def __init__(self, tabella, versione=None):
+        self.tabella = normalizza_clausole(tabella)
+        self.versione = versione
+        self._squadre = {}
+        self._giocatori = {}
+        self._versioni = {}
+        t = self.tabella
+        for sq, pid, nome, valore, ver in zip(t["Squadra"], t["Id"], t["Nome"], t["Valore"], t["Versione"]):
+            self._squadre.setdefault(sq, []).append((pid, nome, int(valore)))
+            self._giocatori.setdefault(pid, []).append((sq, int(valore)))
+            self._versioni[sq] = int(ver)
+
+    def __contains__(self, squadra):
+        return squadra in self._squadre
+
+    def __len__(self):
+        return len(self._squadre)
+
+    def squadre(self):
+        """Squadre con una bozza salvata, nell'ordine della tabella."""
+        return list(self._squadre)
+
+    def clausole_di(self, squadra):
+        """[(id, nome, valore)] della bozza della squadra ([] se non c'è)."""
+        return list(self._squadre.get(squadra, []))
+
+    def valori_di(self, squadra):
+        """{id: valore} della bozza della squadra."""
+        return {pid: valore for pid, _, valore in self._squadre.get(squadra, [])}
+
+    def versione_di(self, squadra):
+        """Quante volte la squadra ha salvato la bozza (0 se mai)."""
+        return self._versioni.get(squadra, 0)
+
+    def protezioni(self, player_id):
+        """[(squadra, valore)] delle bozze che blindano il giocatore (lo
+        stesso Id compare in più leghe)."""
+        return list(self._giocatori.get(str(player_id), []))
+
+
+def indice_clausole(tabella, testo_segrete="", versione=None):
+    """IndiceClausole condiviso per 'versione' dei dati (es. sha del commit);
+    con versione None viene costruito ogni volta."""
+    if versione is None:
+        return IndiceClausole(tabella_clausole(tabella, testo_segrete))
+    with _lock_indici:
+        indice = _indici.get(versione)
+    if indice is None:
+        indice = IndiceClausole(tabella_clausole(tabella, testo_segrete), versione)
+        with _lock_indici:
+            _indici[versione] = indice
+            while len(_indici) > _MAX_INDICI:
+                _indici.pop(next(iter(_indici)))
+    return indice
+
+
+def leggi_clausole(archivio):
+    """Tabella delle clausole dell'archivio. Se non è ancora stata creata
+    viene migrata al volo dal vecchio formato, senza scrivere nulla."""
+    try:
+        return tabella_clausole(archivio.leggi_csv(CLAUSOLE))
+    except FileNotFoundError:
+        pass
+    try:
+        return interpreta_clausole_segrete(archivio.leggi_testo(CLAUSOLE_SEGRETE))
+    except FileNotFoundError:
+        return _tabella_vuota()
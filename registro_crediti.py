@@ -0,0 +1,132 @@
+import math
+from datetime import datetime
+
+import pandas as pd
+
+# --- REGISTRO DEI CREDITI ---
+# Ogni variazione dei crediti di una squadra passa da registra_movimento():
+# nella stessa transazione aggiorna leghe.csv, accoda UNA riga al registro
+# (movimenti_crediti.csv, solo in aggiunta, mai riscritto) e aggiorna la
+# riga della squadra nella vista dei saldi (saldi_crediti.csv), che tiene
+# per ogni squadra il saldo iniziale, i totali per tipo di movimento e il
+# saldo attuale. Il Bilancio legge la vista — una riga per squadra — invece
+# di rileggere e raggruppare tutti i log a ogni rerun.
+#
+# La prima volta che serve, la vista (e il registro) vengono ricostruiti dai
+# log già esistenti: svincolati, tagli, richieste di clausola e tasse di
+# blindaggio. Da lì in poi vengono solo aggiornati.
+
+REGISTRO = "movimenti_crediti.csv"
+SALDI = "saldi_crediti.csv"
+INTESTAZIONE_REGISTRO = ["Orario", "Squadra", "Tipo", "Importo", "Riferimento"]
+
+# tipo di movimento -> colonna della vista dei saldi
+TIPI = {
+    "CLAUSOLA": "Clausole",
+    "CONTRORISCATTO": "Controriscatti",
+    "STAR": "Svincoli",
+    "TAGLIO": "Tagli",
+    "TASSA_BLINDAGGIO": "Tasse",
+}
+COLONNE_SALDI = ["Squadra", "Lega", "Iniziale"] + list(TIPI.values()) + ["Saldo"]
+
+
+def _intero(valore):
+    valore = pd.to_numeric(valore, errors='coerce')
+    return int(valore) if pd.notna(valore) else 0
+
+
+def movimenti_storici(leggi):
+    """Movimenti già avvenuti prima del registro, ricavati dai log esistenti.
+    'leggi' è una funzione path -> DataFrame (es. tx.leggi_csv)."""
+    righe = []
+
+    for path, tipo in (("svincolati_gennaio.csv", "STAR"), ("tagli_volontari.csv", "TAGLIO")):
+        df = leggi(path)
+        if not df.empty and {'Squadra', 'Totale'} <= set(df.columns):
+            for _, r in df.iterrows():
+                righe.append(["", r['Squadra'], tipo, _intero(r['Totale']), r.get('Giocatore', "")])
+
+    df_sc = leggi("richieste_scippo.csv")
+    if not df_sc.empty and 'Stato' in df_sc.columns:
+        for _, r in df_sc.iterrows():
+            stato = str(r['Stato'])
+            if stato not in ('APPROVATO', 'APPROVATO_AUTO', 'CONTRORISCATTATO'):
+                continue
+            costo = _intero(r['Costo'])
+            righe.append([r['Orario'], r['Acquirente'], "CLAUSOLA", -costo, r['Nome']])
+            righe.append([r['Orario'], r['Proprietario'], "CLAUSOLA", costo, r['Nome']])
+            if stato == 'CONTRORISCATTATO':
+                righe.append([r['Orario'], r['Proprietario'], "CONTRORISCATTO", -math.ceil(costo * 1.10), r['Nome']])
+                righe.append([r['Orario'], r['Acquirente'], "CONTRORISCATTO", costo, r['Nome']])
+
+    df_tasse = leggi("tasse_blindaggio.csv")
+    if not df_tasse.empty and 'Eccedenza' in df_tasse.columns:
+        for _, r in df_tasse.iterrows():
+            if _intero(r['Eccedenza']):
+                righe.append([r['Orario'], r['Squadra'], "TASSA_BLINDAGGIO", -_intero(r['Eccedenza']), "Tassa di blindaggio"])
+
+    return pd.DataFrame(righe, columns=INTESTAZIONE_REGISTRO)
+
+
+def ricostruisci_saldi(leggi):
+    """(registro, saldi) ricostruiti da leghe.csv e dai log esistenti: il
+    saldo iniziale è quello attuale meno tutti i movimenti già avvenuti."""
+    registro = movimenti_storici(leggi)
+    df_l = leggi("leghe.csv")
+    if df_l.empty:
+        return registro, pd.DataFrame(columns=COLONNE_SALDI)
+
+    saldi = df_l[['Squadra', 'Lega', 'Crediti']].rename(columns={'Crediti': 'Saldo'}).copy()
+    per_tipo = registro.pivot_table(index='Squadra', columns='Tipo', values='Importo', aggfunc='sum', fill_value=0)
+    for tipo, colonna in TIPI.items():
+        totali = per_tipo[tipo] if tipo in per_tipo.columns else pd.Series(dtype=int)
+        saldi[colonna] = saldi['Squadra'].map(totali).fillna(0).astype(int)
+    saldi['Iniziale'] = saldi['Saldo'] - saldi[list(TIPI.values())].sum(axis=1)
+    return registro, saldi[COLONNE_SALDI].reset_index(drop=True)
+
+
+def registra_movimento(tx, squadra, tipo, importo, riferimento="", orario=None):
+    """Somma 'importo' ai crediti di 'squadra' dentro la transazione tx e lo
+    registra: una riga di registro accodata, una riga dei saldi aggiornata.
+    Restituisce False (senza registrare nulla) se la squadra non è in
+    leghe.csv."""
+    if not tx.esiste(SALDI):
+        registro, saldi = ricostruisci_saldi(tx.leggi_csv)
+        tx.scrivi_csv(REGISTRO, registro)
+        tx.scrivi_csv(SALDI, saldi)
+
+    importo = int(importo)
+    if not tx.incrementa("leghe.csv", "Crediti", importo, Squadra=squadra):
+        return False
+    if not tx.incrementa(SALDI, TIPI[tipo], importo, Squadra=squadra):
+        # Squadra aggiunta a leghe.csv dopo la creazione della vista
+        squadra_l = tx.righe("leghe.csv", Squadra=squadra).iloc[0]
+        precedente = int(squadra_l['Crediti']) - importo
+        riga = {c: 0 for c in COLONNE_SALDI}
+        riga.update({'Squadra': squadra, 'Lega': squadra_l['Lega'], 'Iniziale': precedente,
+                     TIPI[tipo]: importo, 'Saldo': precedente})
+        tx.appendi_df(SALDI, pd.DataFrame([riga]))
+    tx.incrementa(SALDI, "Saldo", importo, Squadra=squadra)
+
+    orario = orario or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tx.appendi_righe(REGISTRO, [[orario, squadra, tipo, importo, riferimento]], INTESTAZIONE_REGISTRO)
+    return True
+
+
+def leggi_saldi(archivio):
+    """Vista dei saldi (una riga per squadra). Se non è ancora stata creata
+    viene calcolata al volo dai log, senza scrivere nulla."""
+    try:
+        saldi = archivio.leggi_csv(SALDI)
+        if not saldi.empty:
+            return saldi
+    except FileNotFoundError:
+        pass
+
+    def leggi(path):
+        try:
+            return archivio.leggi_csv(path)
+        except FileNotFoundError:
+            return pd.DataFrame()
+    return ricostruisci_saldi(leggi)[1]
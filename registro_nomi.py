@@ -0,0 +1,119 @@
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# --- REGISTRO DEI NOMI (SQUADRE E GIOCATORI) ---
+# I nomi nei CSV arrivano "sporchi": emoji o simboli davanti, minuscole,
+# spazi doppi. pulisci_nome() li riporta alla forma canonica, ma applicato
+# con .apply a ogni rerun (e dentro i cicli, una volta per squadra) rifà la
+# stessa pulizia migliaia di volte.
+#
+# Qui ogni nome grezzo viene ripulito una volta sola (pulisci_nome è
+# memorizzato, pulisci_nomi lavora sui valori distinti di una colonna) e il
+# registro, costruito una volta per versione dei dati, tiene:
+#   - grezzo -> canonico (dizionario, lookup O(1));
+#   - canonico -> id intero della squadra, per i join su interi invece che
+#     su stringhe ripulite ogni volta.
+
+_registri = {}
+_lock_registri = threading.Lock()
+_MAX_REGISTRI = 4
+
+_INIZIO_LETTERA = re.compile(r"^[^A-Za-z]+(?=[A-Za-z])")
+_SPAZI = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def _pulisci_testo(testo):
+    nome_pulito = _INIZIO_LETTERA.sub("", testo.strip())
+    if nome_pulito and nome_pulito[0].islower():
+        nome_pulito = nome_pulito[0].upper() + nome_pulito[1:]
+    nome_pulito = _SPAZI.sub(" ", nome_pulito).strip()
+    # Se il nome è vuoto o troppo corto, resta l'originale
+    if len(nome_pulito) < 2:
+        return testo.strip()
+    return nome_pulito
+
+
+def pulisci_nome(nome):
+    """Pulisce il nome rimuovendo TUTTO ciò che non è una lettera all'inizio
+    (memorizzato: ogni nome grezzo viene ripulito una volta sola)."""
+    if not nome or pd.isna(nome):
+        return ""
+    return _pulisci_testo(str(nome))
+
+
+def pulisci_nomi(serie):
+    """pulisci_nome su un'intera colonna. Le righe vengono raggruppate per
+    valore (factorize) e riportate con un take vettoriale: la pulizia vera
+    gira solo sui valori distinti, e passa dalla memoria di pulisci_nome
+    (una colonna di squadre ha 40 nomi su migliaia di righe)."""
+    codici, valori = pd.factorize(serie, use_na_sentinel=False)
+    puliti = np.array([pulisci_nome(v) for v in valori], dtype=object)
+    return pd.Series(puliti[codici], index=serie.index, dtype=object)
+
+
+class RegistroNomi:
+    """Nomi canonici delle squadre e loro id interi, dalle colonne di nomi
+    grezzi passate (es. leghe['Squadra'], rose['Squadra_LFM'])."""
+
+    def __init__(self, *colonne):
+        colonne = [c.dropna().astype(str) for c in colonne if c is not None]
+        grezzi = pd.Series(pd.unique(pd.concat(colonne, ignore_index=True)) if colonne else [], dtype=object)
+        canonici = pulisci_nomi(grezzi)
+        self.canonico = dict(zip(grezzi, canonici))
+        self.nomi = sorted(set(canonici) - {""})
+        self.id = {nome: i for i, nome in enumerate(self.nomi)}
+        self.id_grezzo = {g: self.id.get(c, -1) for g, c in self.canonico.items()}
+        self._grezzi = {}
+        for g, c in self.canonico.items():
+            self._grezzi.setdefault(c, []).append(g)
+
+    def canonici(self, serie):
+        """Colonna di nomi canonici; i nomi mai visti vengono ripuliti al volo."""
+        mappati = serie.map(self.canonico)
+        mancanti = mappati.isna() & serie.notna()
+        if mancanti.any():
+            mappati[mancanti] = pulisci_nomi(serie[mancanti])
+        return mappati.fillna("").astype(object)
+
+    def nome_canonico(self, nome):
+        if nome in self.canonico:
+            return self.canonico[nome]
+        return pulisci_nome(nome)
+
+    def ids(self, serie):
+        """Id intero della squadra per ogni nome grezzo (-1 se sconosciuto)."""
+        ids = serie.map(self.id_grezzo)
+        mancanti = ids.isna() & serie.notna()
+        if mancanti.any():
+            ids[mancanti] = pulisci_nomi(serie[mancanti]).map(self.id)
+        return ids.fillna(-1).astype(np.int32)
+
+    def id_di(self, nome):
+        """Id intero di un singolo nome (grezzo o canonico), -1 se sconosciuto."""
+        return self.id.get(self.nome_canonico(nome), -1)
+
+    def grezzi_di(self, nome):
+        """Tutti i nomi grezzi registrati che hanno la stessa forma canonica di 'nome'."""
+        return list(self._grezzi.get(self.nome_canonico(nome), []))
+
+
+def registro_nomi(versione, *colonne):
+    """RegistroNomi condiviso per 'versione' dei dati (es. lo sha del commit):
+    costruito una volta e riusato dai rerun successivi. Con versione None
+    viene costruito ogni volta."""
+    if versione is None:
+        return RegistroNomi(*colonne)
+    with _lock_registri:
+        registro = _registri.get(versione)
+    if registro is None:
+        registro = RegistroNomi(*colonne)
+        with _lock_registri:
+            _registri[versione] = registro
+            while len(_registri) > _MAX_REGISTRI:
+                _registri.pop(next(iter(_registri)))
+    return registro
@@ -0,0 +1,130 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- RIEPILOGO SQUADRE (DATI DELLE CARD DELLA DASHBOARD) ---
+# Le dashboard (lfm, lab2, lablfm, mercato, draft_fm) calcolavano le card
+# lega per lega: due groupby filtrati con ", ".join, tre merge, poi un
+# iterrows con una ricerca dello stadio e dei crediti per ogni squadra, e i
+# nomi dei giocatori usciti ricalcolati dai movimenti dentro il ciclo.
+#
+# riepilogo_squadre() fa tutto in un passaggio su df_base, per tutte le
+# leghe insieme. Una riga per squadra (Lega, Squadra_LFM):
+#   Crediti                         residui da leghe.csv
+#   NG, FVM_Tot, Quot_Tot           giocatori attivi (non rimborsati) e loro valore
+#   Rimborso_Star, Svincolati       rimborsi e nomi degli svincolati (*)
+#   Rimborso_Taglio, Tagliati       rimborsi e nomi dei tagliati
+#   Totale_Cr                       Crediti + rimborsi
+#   Uscite                          nomi dai movimenti (svincoli/tagli registrati)
+#   Capienza                        stadio in migliaia di posti (0 se manca)
+# Senza le colonne Rimborsato_Star / Rimborsato_Taglio tutti i giocatori
+# sono attivi. Il risultato è memorizzato per impronta del contenuto dei
+# dati: a dati invariati la dashboard si limita a formattare.
+
+COLONNE_RIEPILOGO = [
+    "Lega", "Squadra_LFM", "Crediti", "NG", "FVM_Tot", "Quot_Tot", "Rimborso_Star", "Svincolati",
+    "Rimborso_Taglio", "Tagliati", "Totale_Cr", "Uscite", "Capienza",
+]
+
+_riepiloghi = {}
+_lock_riepiloghi = threading.Lock()
+_MAX_RIEPILOGHI = 8
+
+
+def _colonne_presenti(df, colonne):
+    return [c for c in colonne if c in df.columns]
+
+
+def impronta_dati(*tabelle, extra=()):
+    """Impronta del contenuto di alcune tabelle (hash vettoriale delle righe)
+    e di eventuali chiavi già note."""
+    h = hashlib.sha256(repr(extra).encode("utf-8"))
+    for df in tabelle:
+        if df is None:
+            h.update(b"-")
+            continue
+        h.update(repr(list(df.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def _nomi(df, flag, chiavi):
+    righe = df[df[flag]]
+    if righe.empty:
+        return pd.Series(dtype=object)
+    return righe.groupby(chiavi, observed=True, sort=False)["Nome"].agg(", ".join)
+
+
+def calcola_riepilogo(df_base, movimenti=None, stadi=None):
+    """Il riepilogo di tutte le squadre di tutte le leghe (vedi sopra)."""
+    chiavi = ["Lega", "Squadra_LFM"]
+    df = df_base[df_base["Lega"].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=COLONNE_RIEPILOGO)
+    df = df.assign(Lega=df["Lega"].astype(object), Squadra_LFM=df["Squadra_LFM"].astype(object))
+    star = df["Rimborsato_Star"].astype(bool) if "Rimborsato_Star" in df.columns else pd.Series(False, index=df.index)
+    taglio = df["Rimborsato_Taglio"].astype(bool) if "Rimborsato_Taglio" in df.columns else pd.Series(False, index=df.index)
+    attivi = ~star & ~taglio
+    df = df.assign(
+        _Attivo=attivi, _Star=star, _Taglio=taglio,
+        _FVM=df["FVM"].where(attivi), _Qt=df["Qt.I"].where(attivi),
+        _R_Star=df["Rimborso_Star"].where(star, 0) if "Rimborso_Star" in df.columns else 0,
+        _R_Taglio=df["Rimborso_Taglio"].where(taglio, 0) if "Rimborso_Taglio" in df.columns else 0,
+    )
+
+    gruppi = df.groupby(chiavi, sort=False)
+    riepilogo = gruppi.agg(
+        Crediti=("Crediti", "first"), NG=("_Attivo", "sum"), FVM_Tot=("_FVM", "sum"), Quot_Tot=("_Qt", "sum"),
+        Rimborso_Star=("_R_Star", "sum"), Rimborso_Taglio=("_R_Taglio", "sum"),
+    )
+    riepilogo["Svincolati"] = _nomi(df, "_Star", chiavi).reindex(riepilogo.index).fillna("")
+    riepilogo["Tagliati"] = _nomi(df, "_Taglio", chiavi).reindex(riepilogo.index).fillna("")
+    riepilogo = riepilogo.reset_index()
+    riepilogo["Crediti"] = pd.to_numeric(riepilogo["Crediti"], errors="coerce").fillna(0)
+    riepilogo["NG"] = riepilogo["NG"].astype(int)
+    riepilogo["Totale_Cr"] = riepilogo["Crediti"] + riepilogo["Rimborso_Star"] + riepilogo["Rimborso_Taglio"]
+
+    if movimenti is not None and not movimenti.empty and {"Squadra", "Giocatore"} <= set(movimenti.columns):
+        uscite = movimenti.dropna(subset=["Squadra", "Giocatore"])
+        uscite = uscite.groupby("Squadra", sort=False)["Giocatore"].agg(lambda x: ", ".join(x.astype(str)))
+        riepilogo["Uscite"] = riepilogo["Squadra_LFM"].map(uscite).fillna("")
+    else:
+        riepilogo["Uscite"] = ""
+
+    if stadi is not None:
+        chiavi_stadio = riepilogo["Squadra_LFM"].astype(str).str.strip().str.upper()
+        riepilogo["Capienza"] = chiavi_stadio.map(stadi.tabella()["capienza"]).fillna(0)
+    else:
+        riepilogo["Capienza"] = 0
+    riepilogo = riepilogo.sort_values(["Lega", "Squadra_LFM"], ignore_index=True)
+    return riepilogo[COLONNE_RIEPILOGO]
+
+
+def riepilogo_squadre(df_base, movimenti=None, stadi=None):
+    """calcola_riepilogo memorizzato per impronta dei dati: le colonne di
+    df_base che entrano nelle card, i movimenti e la versione degli stadi."""
+    colonne = _colonne_presenti(df_base, [
+        "Lega", "Squadra_LFM", "Crediti", "Nome", "FVM", "Qt.I",
+        "Rimborsato_Star", "Rimborsato_Taglio", "Rimborso_Star", "Rimborso_Taglio",
+    ])
+    mov = movimenti[_colonne_presenti(movimenti, ["Squadra", "Giocatore"])] if movimenti is not None else None
+    versione_stadi = stadi.versione if stadi is not None else None
+    if stadi is not None and versione_stadi is None:
+        return calcola_riepilogo(df_base, movimenti, stadi)
+    chiave = impronta_dati(df_base[colonne], mov, extra=(versione_stadi,))
+    with _lock_riepiloghi:
+        riepilogo = _riepiloghi.get(chiave)
+    if riepilogo is None:
+        riepilogo = calcola_riepilogo(df_base, movimenti, stadi)
+        with _lock_riepiloghi:
+            _riepiloghi[chiave] = riepilogo
+            while len(_riepiloghi) > _MAX_RIEPILOGHI:
+                _riepiloghi.pop(next(iter(_riepiloghi)))
+    return riepilogo
+
+
+def riepilogo_lega(riepilogo, lega):
+    """Le righe di una lega, in ordine di squadra."""
+    return riepilogo[riepilogo["Lega"] == lega]
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from riepilogo_squadre import impronta_dati
+
+# --- SCANNER DELLE VULNERABILITÀ ---
+# Il Terminale dice a ogni manager solo se i SUOI tre giocatori sono
+# VULNERABILI (clausola non oltre il budget netto del rivale più ricco).
+# Qui la stessa verifica vale per tutte le clausole effettive di tutte le
+# leghe (libro_clausole.py) contro ogni rivale di lega: una tabella di
+# coppie giocatore × acquirente con
+#   Netti_Acquirente   budget netto attuale dell'acquirente (budget_rivali.py)
+#   Margine            Netti_Acquirente - Valore: >= 0 vuol dire acquistabile
+# Si guarda il solo budget: il limite di clausole pagate e l'orario del
+# mercato restano ai controlli del pagamento.
+#
+# Lo scanner è incrementale: le coppie si costruiscono (merge per lega) solo
+# quando cambia il contenuto del libro delle clausole (bozze, proprietari) o
+# l'elenco delle squadre. Se cambiano soltanto i crediti di qualche squadra
+# (una tassa, uno svincolo), vengono aggiornate solo le righe in cui quella
+# squadra è l'acquirente.
+
+COLONNE_COPPIE = [
+    "Lega", "Squadra", "Id", "Nome", "Valore", "Ufficio", "Acquirente", "Netti_Acquirente", "Margine",
+]
+COLONNE_RIEPILOGO = ["Lega", "Squadra", "Id", "Nome", "Valore", "Ufficio", "Acquirenti", "Margine_Max", "Miglior_Acquirente"]
+
+
+def coppie_clausole_vuote():
+    return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_COPPIE})
+
+
+def coppie_clausole(libro, budget):
+    """Tutte le coppie (clausola, rivale di lega) con il margine."""
+    clausole = libro.tabella[["Lega", "Squadra", "Id", "Nome", "Valore", "Ufficio"]]
+    rivali = budget.tabella[["Lega", "Squadra", "Netti"]].rename(
+        columns={"Squadra": "Acquirente", "Netti": "Netti_Acquirente"}
+    )
+    coppie = clausole.merge(rivali, on="Lega")
+    coppie = coppie[coppie["Acquirente"] != coppie["Squadra"]].reset_index(drop=True)
+    coppie["Margine"] = coppie["Netti_Acquirente"] - coppie["Valore"]
+    return coppie[COLONNE_COPPIE]
+
+
+def riepilogo_vulnerabilita(coppie):
+    """Una riga per clausola: quanti rivali possono pagarla, il margine più
+    alto e chi lo ha. Le più esposte per prime."""
+    chiavi = ["Lega", "Squadra", "Id", "Nome", "Valore", "Ufficio"]
+    if coppie.empty:
+        return pd.DataFrame({c: pd.Series(dtype=object) for c in COLONNE_RIEPILOGO})
+    migliori = coppie.sort_values("Margine", ascending=False, kind="stable").drop_duplicates(["Lega", "Squadra", "Id"])
+    acquirenti = coppie[coppie["Margine"] >= 0].groupby(["Lega", "Squadra", "Id"]).size()
+    riepilogo = migliori[chiavi].assign(
+        Acquirenti=pd.MultiIndex.from_frame(migliori[["Lega", "Squadra", "Id"]]).map(acquirenti).fillna(0).astype(int),
+        Margine_Max=migliori["Margine"].values,
+        Miglior_Acquirente=np.where(migliori["Margine"] >= 0, migliori["Acquirente"], ""),
+    )
+    return riepilogo.sort_values(["Margine_Max", "Lega", "Squadra"], ascending=[False, True, True], ignore_index=True)
+
+
+class ScannerClausole:
+    """Coppie clausola × acquirente aggiornate in modo incrementale (vedi
+    aggiorna). Le tabelle vengono sostituite, mai modificate sul posto: chi
+    le sta leggendo continua a vedere quelle di prima."""
+
+    def __init__(self):
+        self.coppie = coppie_clausole_vuote()
+        self._impronta_libro = None
+        self._netti = {}  # (lega, squadra) -> budget netto usato nelle coppie
+        self.ricalcolate = 0
+        self._riepilogo = None
+
+    def aggiorna(self, libro, budget):
+        """Allinea le coppie al libro e ai budget dati. Ricostruisce tutto se
+        cambia il contenuto del libro (o le squadre), altrimenti ricalcola
+        solo le righe degli acquirenti con budget cambiato; restituisce
+        quante righe."""
+        t = budget.tabella
+        netti = dict(zip(zip(t["Lega"], t["Squadra"]), t["Netti"].astype(int)))
+        impronta_libro = impronta_dati(libro.tabella)
+        if impronta_libro != self._impronta_libro or netti.keys() != self._netti.keys():
+            self.coppie = coppie_clausole(libro, budget)
+            self.ricalcolate = len(self.coppie)
+        else:
+            cambiate = {k[1]: n for k, n in netti.items() if self._netti[k] != n}
+            if not cambiate:
+                self.ricalcolate = 0
+                return 0
+            coppie = self.coppie.copy()
+            righe = coppie["Acquirente"].isin(set(cambiate))
+            nuovi_netti = coppie.loc[righe, "Acquirente"].map(cambiate)
+            coppie.loc[righe, "Netti_Acquirente"] = nuovi_netti
+            coppie.loc[righe, "Margine"] = nuovi_netti - coppie.loc[righe, "Valore"]
+            self.coppie = coppie
+            self.ricalcolate = int(righe.sum())
+        self._impronta_libro = impronta_libro
+        self._netti = netti
+        self._riepilogo = None
+        return self.ricalcolate
+
+    def acquistabili(self, lega=None):
+        """Le coppie con margine >= 0 (chi può pagare cosa), per margine."""
+        coppie = self.coppie[self.coppie["Margine"] >= 0]
+        if lega is not None:
+            coppie = coppie[coppie["Lega"] == lega]
+        return coppie.sort_values(["Margine", "Lega"], ascending=[False, True], ignore_index=True)
+
+    def riepilogo(self):
+        riepilogo = self._riepilogo
+        if riepilogo is None:
+            riepilogo = self._riepilogo = riepilogo_vulnerabilita(self.coppie)
+        return riepilogo
+
+
+_scanner = {}
+_lock_scanner = threading.Lock()
+
+
+def scanner_clausole(libro, budget, nome="default"):
+    """ScannerClausole condiviso per 'nome', allineato a libro e budget."""
+    with _lock_scanner:
+        scanner = _scanner.setdefault(nome, ScannerClausole())
+        scanner.aggiorna(libro, budget)
+    return scanner
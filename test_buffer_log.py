@@ -0,0 +1,63 @@
+import pandas as pd
+
+import buffer_log
+from archivio import ArchivioLocale
+from buffer_log import BufferLog
+
+INTESTAZIONE = ["Squadra", "Giocatore"]
+
+
+def test_blocco_pubblicato_non_ripubblicato_dopo_molti_commit(tmp_path, monkeypatch):
+    monkeypatch.setattr(buffer_log, "CARTELLA_BUFFER", str(tmp_path / "buffer"))
+    archivio = ArchivioLocale(str(tmp_path / "archivio"))
+
+    # Il processo muore tra il commit del blocco e la pulizia del file
+    buffer = BufferLog(archivio, "prova", max_secondi=3600)
+    buffer.accoda("log_prova.csv", [["Arsenal", "Rossi"]], INTESTAZIONE)
+    buffer.accoda("log_prova.csv", [["Chelsea", "Bianchi"]], INTESTAZIONE)
+    monkeypatch.setattr(buffer, "_rimuovi_prime", lambda quante: None)
+    assert buffer.pubblica() == 2
+
+    # Più commit di altri di quanti ne legga un singolo elenco dello storico
+    for i in range(45):
+        archivio.scrivi_csv("altro.csv", pd.DataFrame({"N": [i]}), f"Commit {i}")
+
+    riavviato = BufferLog(archivio, "prova", max_secondi=3600)
+    assert riavviato.in_sospeso("log_prova.csv").empty
+    assert riavviato.pubblica() == 0
+    assert len(archivio.leggi_csv("log_prova.csv")) == 2
+
+
+def test_blocco_non_pubblicato_resta_in_sospeso(tmp_path, monkeypatch):
+    monkeypatch.setattr(buffer_log, "CARTELLA_BUFFER", str(tmp_path / "buffer"))
+    archivio = ArchivioLocale(str(tmp_path / "archivio"))
+
+    buffer = BufferLog(archivio, "prova", max_secondi=3600)
+    buffer.accoda("log_prova.csv", [["Arsenal", "Rossi"]], INTESTAZIONE)
+
+    riavviato = BufferLog(archivio, "prova", max_secondi=3600)
+    assert len(riavviato.in_sospeso("log_prova.csv")) == 1
+    assert riavviato.pubblica() == 1
+    assert len(archivio.leggi_csv("log_prova.csv")) == 1
+
+
+def test_blocco_mai_pubblicato_non_legge_tutto_lo_storico(tmp_path, monkeypatch):
+    monkeypatch.setattr(buffer_log, "CARTELLA_BUFFER", str(tmp_path / "buffer"))
+    archivio = ArchivioLocale(str(tmp_path / "archivio"))
+    for i in range(200):
+        archivio.scrivi_csv("altro.csv", pd.DataFrame({"N": [i]}), f"Commit {i}")
+
+    buffer = BufferLog(archivio, "prova", max_secondi=3600)
+    buffer.accoda("log_prova.csv", [["Arsenal", "Rossi"]], INTESTAZIONE)
+    # Tutto lo storico precede l'accodamento: le versioni lette sono solo
+    # quelle dentro il margine dell'orologio
+    for voce in buffer._voci:
+        voce["creata"] += 2 * buffer_log.MARGINE_OROLOGIO
+    buffer._riscrivi()
+
+    letture = []
+    elenca_versioni = archivio.elenca_versioni
+    monkeypatch.setattr(archivio, "elenca_versioni", lambda **k: letture.append(k) or elenca_versioni(**k))
+    riavviato = BufferLog(archivio, "prova", max_secondi=3600)
+    assert len(riavviato.in_sospeso("log_prova.csv")) == 1
+    assert len(letture) == 1
@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+
+import modello_lega
+from archivio_sqlite import ArchivioSqlite
+from modello_lega import FILE_LEGHE, FILE_QUOT, FILE_ROSE, modello_da_archivio, modello_da_tabelle
+
+CARTELLA = os.path.dirname(os.path.abspath(__file__))
+
+
+def crediti(modello, squadra):
+    return int(modello.leghe.loc[modello.leghe["Squadra"] == squadra, "Crediti"].iloc[0])
+
+
+def test_modello_sqlite_segue_le_scritture(tmp_path, monkeypatch):
+    monkeypatch.setattr(modello_lega, "CARTELLA_ISTANTANEE", str(tmp_path / "modelli"))
+    monkeypatch.setattr(modello_lega, "_modelli", {})
+    archivio = ArchivioSqlite(str(tmp_path / "lfm.sqlite"), sorgente=CARTELLA)
+
+    prima = modello_da_archivio(archivio, CARTELLA)
+    squadra = prima.leghe["Squadra"].iloc[0]
+    iniziali = crediti(prima, squadra)
+    assert modello_da_archivio(archivio, CARTELLA) is prima
+
+    archivio.transazione(lambda tx: tx.incrementa(FILE_LEGHE, "Crediti", -100, Squadra=squadra), "Prova crediti")
+    dopo = modello_da_archivio(archivio, CARTELLA)
+    assert dopo.versione != prima.versione
+    assert crediti(dopo, squadra) == iniziali - 100
+
+    # Processo nuovo: l'istantanea su disco non riporta i crediti vecchi
+    monkeypatch.setattr(modello_lega, "_modelli", {})
+    assert crediti(modello_da_archivio(archivio, CARTELLA), squadra) == iniziali - 100
+
+
+def test_istantanea_tabelle_segue_il_contenuto(tmp_path, monkeypatch):
+    monkeypatch.setattr(modello_lega, "CARTELLA_ISTANTANEE", str(tmp_path / "modelli"))
+    crediti_letti = []
+    for i, valore in enumerate((698, 99999)):
+        # Processi diversi, database diversi alla stessa versione
+        monkeypatch.setattr(modello_lega, "_modelli", {})
+        archivio = ArchivioSqlite(str(tmp_path / f"lfm{i}.sqlite"), sorgente=CARTELLA)
+        archivio.transazione(lambda tx: tx.aggiorna_righe(FILE_LEGHE, {"Crediti": valore}), "Prova crediti")
+        versione, dati = archivio.fotografia([FILE_ROSE, FILE_LEGHE, FILE_QUOT])
+        modello = modello_da_tabelle(dati[FILE_ROSE], dati[FILE_LEGHE], dati[FILE_QUOT], pd.DataFrame(),
+                                     versione=("prova", versione))
+        crediti_letti.append(crediti(modello, modello.leghe["Squadra"].iloc[0]))
+    assert crediti_letti == [698, 99999]